@@ -1,11 +1,19 @@
-from typing import Dict, List
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import json
+from fastapi import APIRouter, Depends, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from app.services.lexical_index import LexicalIndex
+from app.services.payload_filter import validate_filter
+from app.services.prompt_builder import BuiltPrompt, build_prompt
+from app.services.reranking import Reranker
+from app.services.retrieval import retrieve
 from app.services.vectorstore import VectorStore
 from app.utils.redis_memory import RedisMemory
 from app.services.booking_handler import BookingHandler
-from app.services.embeddings import EmbeddingService
+from app.services.embeddings import EmbeddingService, acall_groq_completion, astream_groq_completion
 from app.services.booking_handler import BookingResult
+from app.api.v1.deps import get_embedding_service, get_lexical_index, get_memory, get_reranker, get_vector_store
 
 router = APIRouter()
 
@@ -13,62 +21,188 @@ class ChatRequest(BaseModel):
     user_id: str
     query: str
     top_k: int = 5
+    # "vector" (dense only), "lexical" (BM25 only) or "hybrid" (both, fused by reciprocal rank)
+    search_mode: str = Field("vector", pattern="^(vector|lexical|hybrid)$")
+    # restrict retrieval to matching chunk payloads, e.g. {"file_name": ["a.pdf", "b.pdf"]}
+    # or {"chunk_id": {"gte": 10}}; see app.services.payload_filter
+    filter: Optional[Dict[str, Any]] = None
+
+    @field_validator("filter")
+    @classmethod
+    def _check_filter(cls, value: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return validate_filter(value)
 
 class ChatResponse(BaseModel):
     reply: str
 
+async def _save_turn(mem: RedisMemory, user_id: str, query: str, reply: str) -> None:
+    await mem.append_message(user_id, {"role": "user", "content": query})
+    await mem.append_message(user_id, {"role": "assistant", "content": reply})
+
+async def _handle_booking(payload: ChatRequest, mem: RedisMemory) -> Optional[str]:
+    """Return a booking confirmation if the query is a complete booking request, else None."""
+    # Booking detection - simple heuristic / entity extraction
+    booking = BookingHandler()
+    if not booking.detect_booking_intent(payload.query):
+        return None
+    booking_info = booking.extract_booking_details(payload.query)
+    if not booking_info:
+        return None
+    saved = booking.save_booking(booking_info)
+    # create confirmation text
+    confirmation = f"Booking confirmed for {saved.name} at {saved.date} {saved.time} (id: {saved.id})."
+    # persist chat
+    await _save_turn(mem, payload.user_id, payload.query, confirmation)
+    return confirmation
+
+async def _build_prompt(
+    payload: ChatRequest,
+    vs: VectorStore,
+    emb: EmbeddingService,
+    mem: RedisMemory,
+    lexical: Optional[LexicalIndex] = None,
+    reranker: Optional[Reranker] = None,
+) -> BuiltPrompt:
+    """Retrieve context for the query and compose the LLM prompt with conversation memory."""
+    results = await retrieve(
+        payload.query,
+        vs,
+        emb,
+        lexical,
+        top_k=payload.top_k,
+        mode=payload.search_mode,
+        payload_filter=payload.filter,
+        reranker=reranker,
+    )
+
+    # load conversation history from Redis
+    history = await mem.get_messages(payload.user_id)
+
+    # dedupe and fit context and history into the prompt token budget
+    return build_prompt(payload.query, results, history)
+
+async def _single(text: str) -> AsyncIterator[str]:
+    yield text
+
+async def _stream_completion(payload: ChatRequest, mem: RedisMemory, prompt: BuiltPrompt) -> AsyncIterator[str]:
+    parts: List[str] = []
+    async for delta in astream_groq_completion(prompt.text):
+        parts.append(delta)
+        yield delta
+    await _save_turn(mem, payload.user_id, payload.query, "".join(parts))
+
+async def _start_reply(
+    payload: ChatRequest,
+    vs: VectorStore,
+    emb: EmbeddingService,
+    mem: RedisMemory,
+    lexical: Optional[LexicalIndex] = None,
+    reranker: Optional[Reranker] = None,
+) -> Tuple[Optional[Dict[str, int]], AsyncIterator[str]]:
+    """
+    Build the prompt and return its token usage with an iterator of reply deltas, which
+    saves the assembled reply to memory once the stream ends. A booking confirmation
+    is a single delta and has no usage (no prompt is built).
+    """
+    confirmation = await _handle_booking(payload, mem)
+    if confirmation is not None:
+        return None, _single(confirmation)
+    prompt = await _build_prompt(payload, vs, emb, mem, lexical, reranker)
+    return prompt.usage, _stream_completion(payload, mem, prompt)
+
 @router.post("", response_model=ChatResponse)
-async def chat_endpoint(payload: ChatRequest) -> ChatResponse:
+async def chat_endpoint(
+    payload: ChatRequest,
+    response: Response,
+    vs: VectorStore = Depends(get_vector_store),
+    emb: EmbeddingService = Depends(get_embedding_service),
+    mem: RedisMemory = Depends(get_memory),
+    lexical: Optional[LexicalIndex] = Depends(get_lexical_index),
+    reranker: Optional[Reranker] = Depends(get_reranker),
+) -> ChatResponse:
     """
     Conversational RAG endpoint.
-    - Retrieve relevant chunks from vector DB
-    - Compose prompt with conversation memory
+    - Retrieve relevant chunks from vector DB (search_mode "lexical" / "hybrid" adds BM25)
+    - Re-rank an over-fetched candidate set when a reranker is configured
+    - Compose prompt with conversation memory within PROMPT_TOKEN_BUDGET tokens;
+      per-section token usage is returned in the X-Prompt-Tokens header
     - Call Groq LLM and return response
     - Save conversation in Redis
     """
-    vs = VectorStore()
-    emb = EmbeddingService()
-    mem = RedisMemory()
+    confirmation = await _handle_booking(payload, mem)
+    if confirmation is not None:
+        return ChatResponse(reply=confirmation)
 
-    # Booking detection - simple heuristic / entity extraction
-    booking = BookingHandler()
-    if booking.detect_booking_intent(payload.query):
-        booking_info = booking.extract_booking_details(payload.query)
-        if booking_info:
-            saved = booking.save_booking(booking_info)
-            # create confirmation text
-            confirmation = f"Booking confirmed for {saved.name} at {saved.date} {saved.time} (id: {saved.id})."
-            # persist chat
-            await mem.append_message(payload.user_id, {"role": "user", "content": payload.query})
-            await mem.append_message(payload.user_id, {"role": "assistant", "content": confirmation})
-            return ChatResponse(reply=confirmation)
-
-    # embed the query for similarity search
-    query_emb = emb.embed_text(payload.query)
-    results = vs.search_vector(query_emb, top_k=payload.top_k)
-
-    context_parts = [r["payload"].get("text", "") for r in results]
-    context = "\n\n---\n\n".join(context_parts)
+    prompt = await _build_prompt(payload, vs, emb, mem, lexical, reranker)
 
-    # load conversation history from Redis
-    history = await mem.get_messages(payload.user_id)
+    # call LLM (Groq) without blocking the event loop
+    reply = await acall_groq_completion(prompt.text)
+    response.headers["X-Prompt-Tokens"] = json.dumps(prompt.usage, separators=(",", ":"))
 
-    # prepare prompt
-    prompt = (
-        "You are a helpful assistant that answers questions using the provided context.\n"
-        "If the context does not contain the answer, say you don’t know.\n"
-        "Use prior conversation memory to maintain continuity.\n\n"
-        f"Context:\n{context}\n\n"
-        f"Conversation history:\n{history}\n\n"
-        f"User: {payload.query}\nAssistant:"
-    )
+    # save messages
+    await _save_turn(mem, payload.user_id, payload.query, reply)
 
-    # call LLM (Groq)
-    from app.services.embeddings import call_groq_completion
-    reply = call_groq_completion(prompt)
+    return ChatResponse(reply=reply)
 
-    # save messages
-    await mem.append_message(payload.user_id, {"role": "user", "content": payload.query})
-    await mem.append_message(payload.user_id, {"role": "assistant", "content": reply})
+@router.post("/stream")
+async def chat_stream_endpoint(
+    payload: ChatRequest,
+    vs: VectorStore = Depends(get_vector_store),
+    emb: EmbeddingService = Depends(get_embedding_service),
+    mem: RedisMemory = Depends(get_memory),
+    lexical: Optional[LexicalIndex] = Depends(get_lexical_index),
+    reranker: Optional[Reranker] = Depends(get_reranker),
+) -> StreamingResponse:
+    """
+    Streaming variant of the chat endpoint using Server-Sent Events.
+    Emits `event: usage` with the prompt's token usage (as in X-Prompt-Tokens; not
+    sent for a booking confirmation), `data: {"delta": ...}` events as tokens arrive,
+    then a final `event: done` carrying the full reply.
+    """
+
+    async def events() -> AsyncIterator[str]:
+        usage, deltas = await _start_reply(payload, vs, emb, mem, lexical, reranker)
+        if usage is not None:
+            yield f"event: usage\ndata: {json.dumps(usage)}\n\n"
+        parts: List[str] = []
+        async for delta in deltas:
+            parts.append(delta)
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'reply': ''.join(parts)})}\n\n"
 
-    return ChatResponse(reply=reply)
\ No newline at end of file
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.websocket("/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    vs: VectorStore = Depends(get_vector_store),
+    emb: EmbeddingService = Depends(get_embedding_service),
+    mem: RedisMemory = Depends(get_memory),
+    lexical: Optional[LexicalIndex] = Depends(get_lexical_index),
+    reranker: Optional[Reranker] = Depends(get_reranker),
+) -> None:
+    """
+    WebSocket variant of the chat endpoint. Each JSON message is a ChatRequest;
+    the server answers with {"type": "usage", "usage": ...} (the prompt's token usage;
+    not sent for a booking confirmation), {"type": "delta", "content": ...} frames and
+    {"type": "done", "reply": ...}. Invalid messages get {"type": "error", ...}.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                payload = ChatRequest(**json.loads(raw))
+            except (ValueError, ValidationError) as exc:
+                await websocket.send_json({"type": "error", "detail": str(exc)})
+                continue
+            usage, deltas = await _start_reply(payload, vs, emb, mem, lexical, reranker)
+            if usage is not None:
+                await websocket.send_json({"type": "usage", "usage": usage})
+            parts: List[str] = []
+            async for delta in deltas:
+                parts.append(delta)
+                await websocket.send_json({"type": "delta", "content": delta})
+            await websocket.send_json({"type": "done", "reply": "".join(parts)})
+    except WebSocketDisconnect:
+        return
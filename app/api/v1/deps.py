@@ -1,15 +1,76 @@
+from typing import Any, Callable, Generator, Optional
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException, status
-from app.db.session import get_db
-from app.core.config import settings
+from starlette.requests import HTTPConnection
+from app.services.dedup import INGEST_DEDUP, NearDuplicateIndex
+from app.services.embeddings import EmbeddingService
+from app.services.ingestion_jobs import IngestionJobQueue
+from app.services.lexical_index import LEXICAL_INDEX, LexicalIndex
+from app.services.reranking import RERANKER, Reranker, make_reranker
+from app.services.vectorstore import VectorStore
+from app.utils.db import get_db_session
+from app.utils.redis_memory import RedisMemory
+
+def get_db() -> Generator[Session, None, None]:
+    db = get_db_session()
+    try:
+        yield db
+    finally:
+        db.close()
 
 def get_database_session(db: Session = Depends(get_db)) -> Session:
     if db is None:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database connection error")
     return db
 
-def get_redis_connection():
-    # Placeholder for Redis connection logic
-    pass
+def _app_resource(conn: HTTPConnection, name: str, factory: Callable[[], Any]) -> Any:
+    """
+    Return a long-lived resource from app.state. The lifespan handler in app.main
+    creates these at startup; they are created lazily here if the app was started
+    without running lifespan events (e.g. a TestClient used outside a `with` block).
+    """
+    state = conn.app.state
+    resource = getattr(state, name, None)
+    if resource is None:
+        resource = factory()
+        setattr(state, name, resource)
+    return resource
+
+def get_vector_store(conn: HTTPConnection) -> VectorStore:
+    return _app_resource(conn, "vector_store", VectorStore)
+
+def get_embedding_service(conn: HTTPConnection) -> EmbeddingService:
+    return _app_resource(conn, "embedding_service", EmbeddingService)
+
+def get_memory(conn: HTTPConnection) -> RedisMemory:
+    return _app_resource(conn, "memory", RedisMemory)
+
+def get_dedup_index(conn: HTTPConnection) -> Optional[NearDuplicateIndex]:
+    """The app's near-duplicate index, or None when INGEST_DEDUP is off."""
+    if not INGEST_DEDUP:
+        return None
+    return _app_resource(conn, "dedup_index", NearDuplicateIndex)
+
+def get_lexical_index(conn: HTTPConnection) -> Optional[LexicalIndex]:
+    """The app's BM25 index, or None when LEXICAL_INDEX is off."""
+    if not LEXICAL_INDEX:
+        return None
+    return _app_resource(conn, "lexical_index", LexicalIndex)
+
+def get_reranker(conn: HTTPConnection) -> Optional[Reranker]:
+    """The app's re-ranking stage, or None when RERANKER is "none"."""
+    if RERANKER in ("", "none"):
+        return None
+    return _app_resource(conn, "reranker", lambda: make_reranker(RERANKER))
 
-# Additional dependency functions can be added here as needed.
\ No newline at end of file
+def get_ingestion_jobs(conn: HTTPConnection) -> IngestionJobQueue:
+    return _app_resource(
+        conn,
+        "ingestion_jobs",
+        lambda: IngestionJobQueue(
+            get_embedding_service(conn),
+            get_vector_store(conn),
+            dedup=get_dedup_index(conn),
+            lexical=get_lexical_index(conn),
+        ),
+    )
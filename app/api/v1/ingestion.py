@@ -1,11 +1,25 @@
+import asyncio
+import os
 from typing import Dict, Optional
-from fastapi import APIRouter, File, UploadFile, Query, HTTPException
+from fastapi import APIRouter, Depends, File, UploadFile, Query, HTTPException
 from fastapi.responses import JSONResponse
-from app.services.text_extractor import extract_text_from_file
-from app.utils.chunking import chunk_text_fixed, chunk_text_sentences, chunk_text_recursive
+from app.services.text_extractor import iter_pages, spool_upload
+from app.utils.chunking import iter_chunk_document
+from app.utils.token_counting import get_token_counter
 from app.services.embeddings import EmbeddingService
+from app.services.ingestion_jobs import IngestionJobQueue, JobQueueFull
+from app.services.ingestion_pipeline import store_chunk_stream, sync_file_chunks
 from app.services.vectorstore import VectorStore
-from app.utils.db import get_db_session, init_db, FileChunkMeta, Base
+from app.utils.db import init_db
+from app.api.v1.deps import (
+    get_dedup_index,
+    get_embedding_service,
+    get_ingestion_jobs,
+    get_lexical_index,
+    get_vector_store,
+)
+from app.services.dedup import NearDuplicateIndex
+from app.services.lexical_index import LexicalIndex
 
 router = APIRouter()
 
@@ -18,44 +32,84 @@ async def ingest_file(
     chunking_strategy: str = Query("fixed", regex="^(fixed|sentence|recursive)$"),
     chunk_size: int = Query(500, gt=0),
     chunk_overlap: int = Query(50, ge=0),
+    mode: str = Query("sync", regex="^(sync|async)$"),
+    incremental: bool = Query(False),
+    emb_service: EmbeddingService = Depends(get_embedding_service),
+    vs: VectorStore = Depends(get_vector_store),
+    jobs: IngestionJobQueue = Depends(get_ingestion_jobs),
+    dedup: Optional[NearDuplicateIndex] = Depends(get_dedup_index),
+    lexical: Optional[LexicalIndex] = Depends(get_lexical_index),
 ) -> Dict:
     """
     Ingest a PDF or TXT file, extract text, chunk, embed, and store vectors + metadata.
 
     - chunking_strategy: "fixed" (fixed token-size approx), "sentence" (sentence-based), or "recursive" (recursive character splitter with overlap)
-    - chunk_size: tokens for chunking strategies (approx by whitespace tokens)
+    - chunk_size: tokens for chunking strategies (BPE tokens of the vocabulary at CHUNK_TOKENIZER_PATH
+      if set, otherwise approx by whitespace tokens)
     - chunk_overlap: number of tokens to overlap between chunks (only used for "recursive" strategy)
+    - mode: "sync" processes the file inside the request; "async" queues a background job and
+      returns 202 with a job id to poll at GET /ingest/jobs/{job_id}
+    - incremental: re-ingest an already ingested file by diffing chunk content hashes; only new
+      chunks are embedded and vectors of chunks that disappeared from the file are deleted
     """
     if file.content_type not in ("application/pdf", "text/plain"):
         raise HTTPException(status_code=400, detail="Only .pdf or .txt files supported")
+    if vs.read_only:
+        # a persistent local store takes writes in one process only (see VectorLog)
+        raise HTTPException(status_code=503, detail="Vector store is read-only in this worker")
 
-    raw_text = await extract_text_from_file(file)
-    if not raw_text.strip():
+    if mode == "async":
+        # the queued job reads the upload from disk and deletes the spooled file when done
+        path = await spool_upload(file)
+        try:
+            job = jobs.submit(
+                file.filename, path, file.content_type, chunking_strategy, chunk_size, chunk_overlap, incremental
+            )
+        except JobQueueFull as exc:
+            os.remove(path)
+            raise HTTPException(status_code=503, detail=str(exc))
+        return JSONResponse(job.to_dict(), status_code=202)
+
+    # pages are extracted from the spooled upload and chunked lazily in worker threads,
+    # overlapped with embedding and storing earlier batches (see store_chunk_stream)
+    path = await spool_upload(file)
+    try:
+        try:
+            chunks = iter_chunk_document(
+                iter_pages(path, file.content_type),
+                chunking_strategy,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                token_counter=get_token_counter(),
+            )
+            # a whitespace-only document can still produce one blank sentence chunk
+            chunks = (chunk for chunk in chunks if chunk.strip())
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+        if incremental:
+            # the diff needs every chunk of the new version before anything is replaced
+            chunk_list = await asyncio.to_thread(list, chunks)
+            if not chunk_list:
+                raise HTTPException(status_code=400, detail="No text extracted from file")
+            result = await sync_file_chunks(file.filename, chunk_list, emb_service, vs, dedup=dedup, lexical=lexical)
+            return JSONResponse({"status": "success", "file": file.filename, "chunks": len(chunk_list), **result})
+
+        # Embeddings + store vectors: batched embedding requests, bulk upsert to vector DB,
+        # and chunk metadata written to SQL in one transaction per batch; near-duplicates of
+        # stored chunks reuse their embedding instead of being embedded again
+        saved_meta = await store_chunk_stream(file.filename, chunks, emb_service, vs, dedup=dedup, lexical=lexical)
+    finally:
+        os.remove(path)
+    if not saved_meta:
         raise HTTPException(status_code=400, detail="No text extracted from file")
 
-    # Chunking
-    if chunking_strategy == "fixed":
-        chunks = chunk_text_fixed(raw_text, chunk_size=chunk_size)
-    elif chunking_strategy == "sentence":
-        chunks = chunk_text_sentences(raw_text, chunk_size=chunk_size)
-    elif chunking_strategy == "recursive":
-        chunks = chunk_text_recursive(raw_text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    else:
-        raise HTTPException(status_code=400, detail=f"Unknown chunking strategy: {chunking_strategy}")
-
-    # Embeddings + store vectors
-    emb_service = EmbeddingService()
-    vs = VectorStore()
-    saved_meta = []
-    # store each chunk: generate embedding and upsert to vector DB, save metadata in SQL
-    for idx, chunk_text in enumerate(chunks):
-        emb = emb_service.embed_text(chunk_text)
-        vec_id = vs.upsert_vector(vector=emb, payload={"file_name": file.filename, "chunk_id": idx, "text": chunk_text})
-        # Save metadata to SQL DB
-        session = get_db_session()
-        meta = FileChunkMeta(file_name=file.filename, chunk_id=idx, chunk_text=chunk_text, embedding_id=str(vec_id))
-        session.add(meta)
-        session.commit()
-        saved_meta.append({"chunk_id": idx, "embedding_id": str(vec_id)})
-
-    return JSONResponse({"status": "success", "file": file.filename, "chunks": len(chunks), "saved": saved_meta})
\ No newline at end of file
+    return JSONResponse({"status": "success", "file": file.filename, "chunks": len(saved_meta), "saved": saved_meta})
+
+@router.get("/jobs/{job_id}", response_model=Dict)
+async def get_ingestion_job(job_id: str, jobs: IngestionJobQueue = Depends(get_ingestion_jobs)) -> Dict:
+    """Report status and progress (pages extracted, chunks embedded / stored) of a background ingestion."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
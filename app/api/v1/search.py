@@ -0,0 +1,59 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel, Field, field_validator
+from app.services.embeddings import EmbeddingService
+from app.services.payload_filter import validate_filter
+from app.services.vectorstore import VectorStore
+from app.api.v1.deps import get_embedding_service, get_vector_store
+
+# Most queries accepted by one /search/batch request. search_vectors scores the stored
+# rows in SEARCH_BATCH_BLOCK_ROWS blocks, so memory grows with queries x block rows.
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "512"))
+
+router = APIRouter()
+
+class SearchBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=SEARCH_BATCH_MAX_QUERIES)
+    top_k: int = Field(5, ge=1)
+    # same payload conditions as ChatRequest.filter, applied to every query
+    filter: Optional[Dict[str, Any]] = None
+
+    @field_validator("filter")
+    @classmethod
+    def _check_filter(cls, value: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return validate_filter(value)
+
+class SearchHit(BaseModel):
+    id: Any
+    score: float
+    payload: Dict[str, Any]
+
+class SearchResult(BaseModel):
+    query: str
+    hits: List[SearchHit]
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchResult]
+
+@router.post("/batch", response_model=SearchBatchResponse)
+async def search_batch_endpoint(
+    payload: SearchBatchRequest,
+    vs: VectorStore = Depends(get_vector_store),
+    emb: EmbeddingService = Depends(get_embedding_service),
+) -> SearchBatchResponse:
+    """
+    Retrieval only, for many queries at once (no LLM call).
+    - Embed all queries in one batched embedding request
+    - Rank chunks for all of them in one VectorStore.search_vectors call
+      (matrix-matrix top-k in the in-memory store, batch search API on Qdrant)
+    - Return the ranked chunks per query, in request order
+    """
+    vectors = await emb.aembed_texts(payload.queries)
+    hits = await asyncio.to_thread(
+        vs.search_vectors, vectors, top_k=payload.top_k, payload_filter=payload.filter
+    )
+    return SearchBatchResponse(
+        results=[SearchResult(query=q, hits=h) for q, h in zip(payload.queries, hits)]
+    )
@@ -1,11 +1,65 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import asyncio
 from fastapi import FastAPI
-from app.api.v1 import ingestion, chat  # Updated import path
+from app.api.v1 import ingestion, chat, search  # Updated import path
+from app.services.dedup import INGEST_DEDUP, NearDuplicateIndex
+from app.services.embedding_cache import close_embedding_cache
+from app.services.embeddings import EmbeddingService
+from app.services.ingestion_jobs import IngestionJobQueue
+from app.services.http_client import aclose_async_client, close_session
+from app.services.lexical_index import LEXICAL_INDEX, LexicalIndex
+from app.services.reranking import RERANKER, make_reranker
+from app.services.text_extractor import shutdown_extraction_pool
+from app.services.vectorstore import LOCAL_VECTOR_STORE_PATH, USE_QDRANT, VectorStore
+from app.utils.redis_memory import RedisMemory
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Create process-wide clients once at startup and release them on shutdown."""
+    app.state.vector_store = VectorStore()
+    app.state.embedding_service = EmbeddingService()
+    app.state.memory = RedisMemory()
+    # the in-memory store starts empty; Qdrant and a LOCAL_VECTOR_STORE_PATH store
+    # already hold the recorded chunks
+    persistent = USE_QDRANT or bool(LOCAL_VECTOR_STORE_PATH)
+    # a worker whose local store fell back to read-only (see VectorLog) refuses ingestion,
+    # so it has no use for the dedup index; its BM25 index follows the writer's log
+    read_only = app.state.vector_store.read_only
+    app.state.dedup_index = NearDuplicateIndex() if INGEST_DEDUP and not read_only else None
+    if app.state.dedup_index is not None and persistent:
+        await asyncio.to_thread(app.state.dedup_index.load_from_db)
+    app.state.lexical_index = LexicalIndex() if LEXICAL_INDEX else None
+    if app.state.lexical_index is not None and persistent:
+        await asyncio.to_thread(app.state.lexical_index.load_from_db)
+        if read_only:
+            app.state.vector_store.on_refresh(app.state.lexical_index.follow)
+    # loading a cross-encoder reads the model from disk
+    app.state.reranker = await asyncio.to_thread(make_reranker, RERANKER)
+    app.state.ingestion_jobs = IngestionJobQueue(
+        app.state.embedding_service,
+        app.state.vector_store,
+        dedup=app.state.dedup_index,
+        lexical=app.state.lexical_index,
+    )
+    app.state.ingestion_jobs.start()
+    try:
+        yield
+    finally:
+        await app.state.ingestion_jobs.stop()
+        await app.state.memory.close()
+        app.state.vector_store.close()
+        close_embedding_cache()
+        close_session()
+        await aclose_async_client()
+        shutdown_extraction_pool()
 
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
-    app = FastAPI(title="Modular RAG Service")
+    app = FastAPI(title="Modular RAG Service", lifespan=lifespan)
     app.include_router(ingestion.router, prefix="/ingest", tags=["ingestion"])
     app.include_router(chat.router, prefix="/chat", tags=["chat"])
+    app.include_router(search.router, prefix="/search", tags=["search"])
     return app
 
-app = create_app()
\ No newline at end of file
+app = create_app()
@@ -0,0 +1,222 @@
+from array import array
+from typing import Any, List, Optional, Sequence, Tuple
+import math
+import os
+import threading
+import time
+import numpy as np
+
+# Approximate search for the in-memory store: "ivf" or "none" (exact brute force).
+LOCAL_ANN_INDEX = os.getenv("LOCAL_ANN_INDEX", "none").lower()
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))  # 0 = about 4 * sqrt(rows) at training time
+ANN_N_PROBE = int(os.getenv("ANN_N_PROBE", "8"))
+ANN_MIN_TRAIN = int(os.getenv("ANN_MIN_TRAIN", "10000"))  # below this brute force is fast enough
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "100000"))
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "4"))
+# Train (and retrain) in a background thread instead of inside the upsert that triggers it.
+ANN_TRAIN_BACKGROUND = os.getenv("ANN_TRAIN_BACKGROUND", "true").lower() in ("1", "true", "yes")
+
+_ASSIGN_BLOCK = 8192
+
+def _nearest(rows: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for each (unit) row, computed in blocks."""
+    out = np.empty(len(rows), dtype=np.int64)
+    for start in range(0, len(rows), _ASSIGN_BLOCK):
+        block = rows[start:start + _ASSIGN_BLOCK]
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+def spherical_kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids clustering unit rows by cosine similarity."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = np.bincount(assign, minlength=k) == 0
+        # reseed empty clusters with random rows
+        sums[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+def _file(lists: List[array], centroids: np.ndarray, matrix: np.ndarray, start: int, end: int) -> None:
+    """Append rows [start, end) of matrix to the list of their nearest centroid."""
+    assign = _nearest(matrix[start:end], centroids)
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(len(lists) + 1))
+    rows = order + start
+    for c in np.flatnonzero(np.diff(bounds)):
+        lists[c].extend(rows[bounds[c]:bounds[c + 1]].tolist())
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over the rows of SimpleVectorStore's matrix.
+
+    Once `min_train` rows exist, spherical k-means picks `nlist` coarse centroids and
+    every row is filed under its nearest centroid; later upserts are assigned
+    incrementally. A query scans only the rows of its `n_probe` nearest lists, so more
+    probes trade latency for recall. The index is retrained when the store grows
+    `retrain_growth` times past the size it was trained at. Until trained, candidates()
+    returns None and the store searches exactly.
+
+    With background=True (ANN_TRAIN_BACKGROUND) k-means and the initial filing run in
+    a daemon thread over the matrix as it was when training started, so the upsert
+    that triggers training (and the searches waiting on the store lock) do not wait
+    for it. The result is swapped in by the next add() or candidates(), which files
+    the rows added meanwhile; until then searches stay exact, or keep the previous
+    index while retraining. A compaction (remap) during training discards the result
+    and the next add() starts over.
+    """
+    def __init__(
+        self,
+        nlist: int = ANN_NLIST,
+        n_probe: int = ANN_N_PROBE,
+        min_train: int = ANN_MIN_TRAIN,
+        train_sample: int = ANN_TRAIN_SAMPLE,
+        retrain_growth: float = ANN_RETRAIN_GROWTH,
+        iterations: int = 10,
+        seed: int = 0,
+        background: bool = ANN_TRAIN_BACKGROUND,
+    ) -> None:
+        self.nlist = nlist
+        self.n_probe = n_probe
+        self.min_train = max(1, min_train)
+        self.train_sample = train_sample
+        self.retrain_growth = retrain_growth
+        self.iterations = iterations
+        self.seed = seed
+        self.background = background
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[array] = []
+        self._trained_size = 0
+        # background training: the thread, its finished result (centroids, lists, size),
+        # and the matrix and row count of the latest add() to catch up from
+        self._lock = threading.Lock()
+        self._training: Optional[threading.Thread] = None
+        self._ready: Optional[Tuple[np.ndarray, List[array], int]] = None
+        self._epoch = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._end = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, matrix: np.ndarray, size: int) -> None:
+        """Cluster (a sample of) the first `size` rows and file all of them, in this thread."""
+        self.centroids, self._lists, self._trained_size = self._build(matrix, size)
+
+    def _build(self, matrix: np.ndarray, size: int) -> Tuple[np.ndarray, List[array], int]:
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or int(4 * math.sqrt(size))
+        nlist = max(1, min(nlist, size))
+        sample = matrix[:size]
+        if size > self.train_sample:
+            sample = sample[np.sort(rng.choice(size, size=self.train_sample, replace=False))]
+        centroids = spherical_kmeans(sample, nlist, self.iterations, self.seed)
+        lists = [array("q") for _ in range(nlist)]
+        _file(lists, centroids, matrix, 0, size)
+        return centroids, lists, size
+
+    def _train_in_background(self, matrix: np.ndarray, size: int) -> None:
+        epoch = self._epoch
+
+        def run() -> None:
+            result = None
+            try:
+                result = self._build(matrix, size)
+            finally:
+                with self._lock:
+                    self._training = None
+                    if result is not None and self._epoch == epoch:
+                        self._ready = result
+
+        self._training = threading.Thread(target=run, name="ivf-train", daemon=True)
+        self._training.start()
+
+    def _install_ready(self) -> None:
+        """Swap in a finished background training, filing the rows added since it started."""
+        with self._lock:
+            ready, self._ready = self._ready, None
+        if ready is None:
+            return
+        centroids, lists, size = ready
+        if self._end > size:
+            _file(lists, centroids, self._matrix, size, self._end)
+        self.centroids, self._lists, self._trained_size = centroids, lists, size
+
+    def wait(self) -> None:
+        """Block until a background training has finished and install it (tests, benchmarks)."""
+        training = self._training
+        if training is not None:
+            training.join()
+        self._install_ready()
+
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        """File rows [start, end) that were just written to the store's matrix."""
+        self._install_ready()  # catches up to the previous add(); rows [start, end) are filed below
+        self._matrix, self._end = matrix, end
+        due = end >= self.min_train if not self.trained else end >= self._trained_size * self.retrain_growth
+        if due and not self.background:
+            self.train(matrix, end)
+            return
+        if self.trained:
+            # a retrain in progress keeps the current lists up to date until it is swapped in
+            _file(self._lists, self.centroids, matrix, start, end)
+        if due and self._training is None:
+            self._train_in_background(matrix, end)
+
+    def remap(self, keep: np.ndarray, old_size: int) -> None:
+        """Follow a compaction of the store: row keep[i] moved to row i, others were dropped."""
+        with self._lock:
+            # row numbers of a training in progress are stale now
+            self._epoch += 1
+            self._ready = None
+        self._end = len(keep)
+        if not self.trained:
+            return
+        new_row = np.full(old_size, -1, dtype=np.int64)
+        new_row[keep] = np.arange(len(keep))
+        for c, rows in enumerate(self._lists):
+            moved = new_row[np.frombuffer(rows, dtype=np.int64)] if rows else np.empty(0, dtype=np.int64)
+            self._lists[c] = array("q", moved[moved >= 0].tolist())
+
+    def candidates(self, query: np.ndarray, n_probe: Optional[int] = None) -> Optional[np.ndarray]:
+        """Rows filed under the query's n_probe nearest centroids, or None if untrained."""
+        self._install_ready()
+        if not self.trained:
+            return None
+        n_probe = min(n_probe or self.n_probe, len(self._lists))
+        sims = self.centroids @ query
+        probe = np.argpartition(-sims, n_probe - 1)[:n_probe] if n_probe < len(sims) else range(len(sims))
+        parts = [np.frombuffer(self._lists[c], dtype=np.int64) for c in probe if self._lists[c]]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+def measure_recall(store: Any, queries: Sequence[Sequence[float]], top_k: int = 10, **search_kwargs) -> dict:
+    """
+    Recall@top_k of the store's approximate search against its exact search, with
+    mean latencies in milliseconds, e.g. measure_recall(vs, queries, 10, n_probe=16).
+    """
+    hits = 0
+    expected = 0
+    approx_ms = exact_ms = 0.0
+    for query in queries:
+        t0 = time.perf_counter()
+        approx = store.search_vector(query, top_k=top_k, **search_kwargs)
+        t1 = time.perf_counter()
+        exact = store.search_vector(query, top_k=top_k, exact=True)
+        t2 = time.perf_counter()
+        approx_ms += (t1 - t0) * 1000
+        exact_ms += (t2 - t1) * 1000
+        truth = {r["id"] for r in exact}
+        hits += len(truth.intersection(r["id"] for r in approx))
+        expected += len(truth)
+    n = max(1, len(queries))
+    return {
+        "recall": hits / expected if expected else 1.0,
+        "approx_ms": approx_ms / n,
+        "exact_ms": exact_ms / n,
+    }
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from typing import AbstractSet, Dict, List, Optional, Sequence, Union
+import os
+import threading
+import zlib
+import numpy as np
+from app.services.embedding_cache import normalize_text
+
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "true").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "3"))
+
+# MinHash permutations h -> (a * h + b) mod p over 32-bit shingle hashes.
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+
+# What resolve() reports per chunk: a stored embedding id, the position of an earlier
+# chunk in the same call, or None for a new chunk.
+Match = Optional[Union[str, int]]
+
+class NearDuplicateIndex:
+    """
+    MinHash + LSH index of stored chunks, used to skip embedding near-duplicates.
+
+    Each chunk is fingerprinted by the MinHash of its word shingles. Signatures are
+    cut into `bands` bands; chunks sharing any band bucket are candidates, and a
+    candidate is a duplicate when the estimated Jaccard similarity (fraction of
+    equal signature slots) reaches `threshold`.
+    """
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = DEDUP_NUM_PERM,
+        bands: int = DEDUP_BANDS,
+        shingle_size: int = DEDUP_SHINGLE_SIZE,
+        seed: int = 1,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # a, b < 2**32 keep a * h + b inside uint64 for 32-bit hashes h
+        self._a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+        self._buckets: Dict[bytes, List[int]] = defaultdict(list)
+        self._signatures: List[np.ndarray] = []
+        self._ids: List[Optional[str]] = []
+        self._positions: Dict[str, List[int]] = defaultdict(list)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (num_perm uint64 values) of the text's word shingles."""
+        words = normalize_text(text).lower().split()
+        k = self.shingle_size
+        shingles = [" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))]
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        # (num_perm, shingles) permuted hashes, minimum per permutation
+        permuted = (self._a[:, None] * hashes[None, :] % _PRIME + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1)
+
+    def signatures(self, texts: Sequence[str]) -> List[np.ndarray]:
+        return [self.signature(text) for text in texts]
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        rows = self.rows
+        return [bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def _best_match(self, signature: np.ndarray, exclude: AbstractSet[str] = frozenset()) -> Optional[int]:
+        candidates = {pos for key in self._band_keys(signature) for pos in self._buckets.get(key, ())}
+        best, best_score = None, self.threshold
+        for pos in candidates:
+            if self._ids[pos] is None or self._ids[pos] in exclude:
+                continue  # removed, or not to be linked to
+            score = float(np.mean(self._signatures[pos] == signature))
+            if score >= best_score:
+                best, best_score = pos, score
+        return best
+
+    def _insert(self, signature: np.ndarray, embedding_id: str) -> None:
+        pos = len(self._signatures)
+        self._signatures.append(signature)
+        self._ids.append(embedding_id)
+        self._positions[embedding_id].append(pos)
+        for key in self._band_keys(signature):
+            self._buckets[key].append(pos)
+
+    def find(self, signature: np.ndarray, exclude: AbstractSet[str] = frozenset()) -> Optional[str]:
+        """Embedding id of a stored near-duplicate, if any, other than the `exclude` ids."""
+        with self._lock:
+            pos = self._best_match(signature, exclude)
+            return None if pos is None else self._ids[pos]
+
+    def resolve(self, signatures: Sequence[np.ndarray], exclude: AbstractSet[str] = frozenset()) -> List[Match]:
+        """
+        Match each signature against the stored chunks (except the `exclude` ids) and
+        against the earlier signatures of the same call, so repeats inside one batch
+        are embedded once.
+        """
+        local = NearDuplicateIndex(self.threshold, self.num_perm, self.bands, self.shingle_size, self.seed)
+        matches: List[Match] = []
+        for i, signature in enumerate(signatures):
+            stored = self.find(signature, exclude)
+            if stored is not None:
+                matches.append(stored)
+                continue
+            earlier = local.find(signature)
+            matches.append(None if earlier is None else int(earlier))
+            if earlier is None:
+                local._insert(signature, str(i))
+        return matches
+
+    def add_many(self, signatures: Sequence[np.ndarray], embedding_ids: Sequence[str]) -> None:
+        with self._lock:
+            for signature, embedding_id in zip(signatures, embedding_ids):
+                self._insert(signature, str(embedding_id))
+
+    def remove(self, embedding_ids: Sequence[str]) -> None:
+        """Forget stored chunks; their bucket entries are skipped from now on."""
+        with self._lock:
+            for embedding_id in embedding_ids:
+                for pos in self._positions.pop(str(embedding_id), ()):
+                    self._ids[pos] = None
+
+    def load_from_db(self) -> int:
+        """
+        Fingerprint the chunks already recorded in FileChunkMeta, one per embedding id.
+        Only meaningful when the vector store persists across restarts (Qdrant, or a
+        SimpleVectorStore with LOCAL_VECTOR_STORE_PATH).
+        """
+        from sqlalchemy import func
+        from app.utils.db import FileChunkMeta, session_scope
+        with session_scope() as session:
+            rows = (
+                session.query(FileChunkMeta.embedding_id, func.min(FileChunkMeta.chunk_text))
+                .group_by(FileChunkMeta.embedding_id)
+                .all()
+            )
+        self.add_many(self.signatures([text or "" for _, text in rows]), [eid for eid, _ in rows])
+        return len(rows)
@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+
+USE_EMBEDDING_CACHE = os.getenv("USE_EMBEDDING_CACHE", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+CacheKey = Tuple[str, int, str]
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially reformatted text shares a cache entry."""
+    return " ".join(text.split())
+
+def text_hash(text: str) -> str:
+    """Content hash of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model, dimension, normalized-text hash).
+
+    A bounded in-memory LRU sits in front of an optional SQLite table; vectors are
+    stored on disk as raw float32 bytes. Hit/miss counters are kept per tier.
+    """
+    def __init__(self, path: Optional[str] = EMBEDDING_CACHE_PATH, max_items: int = EMBEDDING_CACHE_SIZE) -> None:
+        self.max_items = max_items
+        self._memory: "OrderedDict[CacheKey, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, dim INTEGER NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, dim, text_hash))"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, dim: int, text: str) -> CacheKey:
+        return (model, dim, text_hash(text))
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_items": len(self._memory),
+        }
+
+    def _remember(self, key: CacheKey, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: CacheKey) -> Optional[List[float]]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[List[float]]]:
+        """Look up keys in memory, then on disk; disk hits are promoted to memory."""
+        out: List[Optional[List[float]]] = [None] * len(keys)
+        with self._lock:
+            pending: List[int] = []
+            for i, key in enumerate(keys):
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    out[i] = vec
+                else:
+                    pending.append(i)
+            for i in pending:
+                vec = self._read_disk(keys[i])
+                if vec is not None:
+                    self.disk_hits += 1
+                    self._remember(keys[i], vec)
+                    out[i] = vec
+                else:
+                    self.misses += 1
+        return out
+
+    def put(self, key: CacheKey, vector: List[float]) -> None:
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: Iterable[Tuple[CacheKey, List[float]]]) -> None:
+        items = list(items)
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if self._conn is not None and items:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, dim, text_hash, vector) VALUES (?, ?, ?, ?)",
+                    [(k[0], k[1], k[2], np.asarray(v, dtype=np.float32).tobytes()) for k, v in items],
+                )
+                self._conn.commit()
+
+    def _read_disk(self, key: CacheKey) -> Optional[List[float]]:
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT vector FROM embeddings WHERE model = ? AND dim = ? AND text_hash = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide cache, or None when disabled via USE_EMBEDDING_CACHE."""
+    global _default_cache
+    if not USE_EMBEDDING_CACHE:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+        return _default_cache
+
+def close_embedding_cache() -> None:
+    """Close and drop the process-wide cache if it was created."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is not None:
+            _default_cache.close()
+            _default_cache = None
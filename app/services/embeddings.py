@@ -1,14 +1,23 @@
+import asyncio
+import json
 import os
 import time
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import httpx
 import requests
 from dotenv import load_dotenv
+from app.services.embedding_cache import CacheKey, EmbeddingCache, get_embedding_cache
+from app.services.http_client import get_async_client, get_session, get_timeout
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8000"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
 
 def _simple_fallback_embedding(text: str, dim: int = 1536) -> List[float]:
     """Deterministic lightweight fallback embedding for local testing."""
@@ -18,24 +27,47 @@ def _simple_fallback_embedding(text: str, dim: int = 1536) -> List[float]:
         vec[i % dim] += (hash(t) % 1000) / 1000.0
     return vec
 
-def embed_text(text: str, max_retries: int = 4, backoff: float = 1.0) -> List[float]:
+def _approx_token_count(text: str) -> int:
+    """Rough token estimate (~4 characters per token) used for request batching."""
+    return max(1, len(text) // 4)
+
+def _make_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
     """
-    Create an embedding using OpenAI with retries and exponential backoff.
-    Falls back to a simple local embedding if API calls fail or no key is set.
+    Group input indices into batches bounded by item count and approximate token budget.
+    A single input larger than the token budget still gets its own batch.
     """
-    if not OPENAI_API_KEY:
-        return _simple_fallback_embedding(text)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = _approx_token_count(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
 
+def _request_embeddings(inputs: List[str], max_retries: int, backoff: float) -> Optional[List[List[float]]]:
+    """
+    POST one batch of inputs to the embeddings endpoint with retries and exponential backoff.
+    Returns vectors in input order, or None if the batch could not be embedded.
+    """
     url = f"{OPENAI_BASE_URL}/embeddings"
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-    payload = {"model": EMBEDDING_MODEL, "input": text}
+    payload = {"model": EMBEDDING_MODEL, "input": inputs}
 
     for attempt in range(1, max_retries + 1):
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=30)
+            resp = get_session().post(url, headers=headers, json=payload, timeout=get_timeout("embeddings"))
             resp.raise_for_status()
-            data = resp.json()
-            return data["data"][0]["embedding"]
+            data = resp.json()["data"]
+            # the API tags each item with its input index; don't rely on response order
+            data = sorted(data, key=lambda item: item.get("index", 0))
+            return [item["embedding"] for item in data]
         except requests.exceptions.HTTPError as e:
             status = getattr(e.response, "status_code", None)
             # treat 429 and 5xx as retryable
@@ -44,24 +76,230 @@ def embed_text(text: str, max_retries: int = 4, backoff: float = 1.0) -> List[fl
                 time.sleep(sleep)
                 continue
             # non-retryable HTTP error -> fallback
-            return _simple_fallback_embedding(text)
+            return None
         except Exception:
             # network or other error -> retry with backoff
             sleep = backoff * (2 ** (attempt - 1))
             time.sleep(sleep)
             continue
+    return None
+
+async def _arequest_embeddings(inputs: List[str], max_retries: int, backoff: float) -> Optional[List[List[float]]]:
+    """Async counterpart of _request_embeddings; backs off with asyncio.sleep instead of blocking."""
+    url = f"{OPENAI_BASE_URL}/embeddings"
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    payload = {"model": EMBEDDING_MODEL, "input": inputs}
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            resp = await get_async_client().post(url, headers=headers, json=payload, timeout=get_timeout("embeddings"))
+            resp.raise_for_status()
+            data = resp.json()["data"]
+            data = sorted(data, key=lambda item: item.get("index", 0))
+            return [item["embedding"] for item in data]
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status == 429 or 500 <= status < 600:
+                await asyncio.sleep(backoff * (2 ** (attempt - 1)))
+                continue
+            return None
+        except Exception:
+            await asyncio.sleep(backoff * (2 ** (attempt - 1)))
+            continue
+    return None
+
+def embed_text(text: str, max_retries: int = 4, backoff: float = 1.0) -> List[float]:
+    """
+    Create an embedding using OpenAI with retries and exponential backoff.
+    Falls back to a simple local embedding if API calls fail or no key is set.
+    """
+    if not OPENAI_API_KEY:
+        return _simple_fallback_embedding(text)
+
+    vectors = _request_embeddings([text], max_retries=max_retries, backoff=backoff)
+    if vectors is None:
+        # final fallback
+        return _simple_fallback_embedding(text)
+    return vectors[0]
+
+def _embed_batches(
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+    max_retries: int = 4,
+    backoff: float = 1.0,
+) -> List[Optional[List[float]]]:
+    """Embed texts via the API in batches; entries of batches that failed are None."""
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    for batch in _make_batches(texts, max_items=batch_size, max_tokens=max_batch_tokens):
+        inputs = [texts[i] for i in batch]
+        vectors = _request_embeddings(inputs, max_retries=max_retries, backoff=backoff)
+        if vectors is None or len(vectors) != len(inputs):
+            continue
+        for i, vec in zip(batch, vectors):
+            results[i] = vec
+    return results
+
+async def _aembed_batches(
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+    max_retries: int = 4,
+    backoff: float = 1.0,
+) -> List[Optional[List[float]]]:
+    """Async counterpart of _embed_batches; up to EMBEDDING_MAX_CONCURRENCY batches are in flight."""
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
+
+    async def run(batch: List[int]) -> None:
+        inputs = [texts[i] for i in batch]
+        async with semaphore:
+            vectors = await _arequest_embeddings(inputs, max_retries=max_retries, backoff=backoff)
+        if vectors is None or len(vectors) != len(inputs):
+            return
+        for i, vec in zip(batch, vectors):
+            results[i] = vec
+
+    await asyncio.gather(*(run(b) for b in _make_batches(texts, max_items=batch_size, max_tokens=max_batch_tokens)))
+    return results
+
+def embed_texts(
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+    max_retries: int = 4,
+    backoff: float = 1.0,
+) -> List[List[float]]:
+    """
+    Embed many texts, packing them into as few requests as the item/token limits allow.
+    Results are returned in input order. Retries apply per batch, so one failing batch
+    does not resend the others; a batch that still fails uses the local fallback embedding.
+    """
+    if not OPENAI_API_KEY:
+        return [_simple_fallback_embedding(t) for t in texts]
+
+    vectors = _embed_batches(texts, batch_size, max_batch_tokens, max_retries, backoff)
+    return [vec if vec is not None else _simple_fallback_embedding(t) for t, vec in zip(texts, vectors)]
+
+async def aembed_texts(
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+    max_retries: int = 4,
+    backoff: float = 1.0,
+) -> List[List[float]]:
+    """Async version of embed_texts for use inside request handlers."""
+    if not OPENAI_API_KEY:
+        return [_simple_fallback_embedding(t) for t in texts]
 
-    # final fallback
-    return _simple_fallback_embedding(text)
+    vectors = await _aembed_batches(texts, batch_size, max_batch_tokens, max_retries, backoff)
+    return [vec if vec is not None else _simple_fallback_embedding(t) for t, vec in zip(texts, vectors)]
+
+async def aembed_text(text: str, max_retries: int = 4, backoff: float = 1.0) -> List[float]:
+    """Async version of embed_text."""
+    return (await aembed_texts([text], max_retries=max_retries, backoff=backoff))[0]
 
 class EmbeddingService:
+    """
+    Embedding client used by ingestion and chat.
+
+    API results are looked up in and written to an EmbeddingCache (the process-wide
+    one by default). Local fallback embeddings are never cached.
+    """
+    def __init__(self, cache: Optional[EmbeddingCache] = None) -> None:
+        self.cache = cache if cache is not None else get_embedding_cache()
+
     def embed_text(self, text: str) -> List[float]:
-        return embed_text(text)
+        return self.embed_texts([text])[0]
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None or not OPENAI_API_KEY:
+            return embed_texts(texts)
+        keys, results, to_fetch = self._lookup(texts)
+        if to_fetch:
+            fetched = _embed_batches([texts[i] for i in to_fetch])
+            self._fill(texts, keys, results, to_fetch, fetched)
+        return results
+
+    async def aembed_text(self, text: str) -> List[float]:
+        return (await self.aembed_texts([text]))[0]
+
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None or not OPENAI_API_KEY:
+            return await aembed_texts(texts)
+        # the cache reads and writes SQLite: keep that off the event loop
+        keys, results, to_fetch = await asyncio.to_thread(self._lookup, texts)
+        if to_fetch:
+            fetched = await _aembed_batches([texts[i] for i in to_fetch])
+            await asyncio.to_thread(self._fill, texts, keys, results, to_fetch, fetched)
+        return results
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[CacheKey], List[Optional[List[float]]], List[int]]:
+        """Return cache keys, cached vectors (None on miss) and one index per distinct missing text."""
+        keys = [EmbeddingCache.make_key(EMBEDDING_MODEL, EMBEDDING_DIM, t) for t in texts]
+        results = self.cache.get_many(keys)
+        unique: Dict[CacheKey, int] = {}
+        for i, vec in enumerate(results):
+            if vec is None:
+                unique.setdefault(keys[i], i)
+        return keys, results, list(unique.values())
+
+    def _fill(
+        self,
+        texts: List[str],
+        keys: List[CacheKey],
+        results: List[Optional[List[float]]],
+        fetched_idx: List[int],
+        fetched: List[Optional[List[float]]],
+    ) -> None:
+        """Store fetched vectors in the cache and fill every miss (fallback for failed batches)."""
+        by_key: Dict[CacheKey, List[float]] = {}
+        for i, vec in zip(fetched_idx, fetched):
+            if vec is not None:
+                by_key[keys[i]] = vec
+        self.cache.put_many(by_key.items())
+        for i, vec in enumerate(results):
+            if vec is None:
+                results[i] = by_key.get(keys[i]) or _simple_fallback_embedding(texts[i])
 
 # Add completion helper used by chat endpoint
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
 LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-oss-120b")
+COMPLETION_FALLBACK_REPLY = "Sorry, I couldn't generate a response at the moment."
+
+def _groq_request(prompt: str, model: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    return {
+        "url": f"{GROQ_BASE_URL}/chat/completions",
+        "headers": {
+            "Authorization": f"Bearer {GROQ_API_KEY}",
+            "Content-Type": "application/json",
+        },
+        "json": {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        },
+    }
+
+def _openai_request(prompt: str, model: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    return {
+        "url": f"{OPENAI_BASE_URL}/completions",
+        "headers": {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
+        "json": {"model": model, "prompt": prompt, "max_tokens": max_tokens, "temperature": temperature},
+    }
+
+def _groq_reply(data: Dict[str, Any]) -> Optional[str]:
+    if "choices" in data and data["choices"]:
+        choice = data["choices"][0]
+        return (choice.get("message") or {}).get("content") or str(choice)
+    return None
+
+def _openai_reply(data: Dict[str, Any]) -> Optional[str]:
+    if "choices" in data and data["choices"]:
+        return data["choices"][0].get("text", "")
+    return None
 
 def call_groq_completion(prompt: str, model: Optional[str] = None, max_tokens: int = 512, temperature: float = 0.0) -> str:
     """
@@ -73,25 +311,14 @@ def call_groq_completion(prompt: str, model: Optional[str] = None, max_tokens: i
     # Try Groq if configured
     if GROQ_API_KEY:
         try:
-            resp = requests.post(
-                f"{GROQ_BASE_URL}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {GROQ_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model, 
-                    "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": max_tokens, 
-                    "temperature": temperature
-                },
-                timeout=60,
+            resp = get_session().post(
+                **_groq_request(prompt, model, max_tokens, temperature),
+                timeout=get_timeout("completions"),
             )
             resp.raise_for_status()
-            data = resp.json()
-            if "choices" in data and data["choices"]:
-                choice = data["choices"][0]
-                return (choice.get("message") or {}).get("content") or str(choice)
+            reply = _groq_reply(resp.json())
+            if reply is not None:
+                return reply
         except Exception:
             # swallow and attempt fallback
             pass
@@ -99,18 +326,87 @@ def call_groq_completion(prompt: str, model: Optional[str] = None, max_tokens: i
     # Fallback: OpenAI completions (if key present)
     if OPENAI_API_KEY:
         try:
-            resp = requests.post(
-                f"{OPENAI_BASE_URL}/completions",
-                headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-                json={"model": model, "prompt": prompt, "max_tokens": max_tokens, "temperature": temperature},
-                timeout=60,
+            resp = get_session().post(
+                **_openai_request(prompt, model, max_tokens, temperature),
+                timeout=get_timeout("completions"),
             )
             resp.raise_for_status()
-            data = resp.json()
-            if "choices" in data and data["choices"]:
-                return data["choices"][0].get("text", "")
+            reply = _openai_reply(resp.json())
+            if reply is not None:
+                return reply
         except Exception:
             pass
 
     # Final fallback string
-    return "Sorry, I couldn't generate a response at the moment."
\ No newline at end of file
+    return COMPLETION_FALLBACK_REPLY
+
+async def acall_groq_completion(prompt: str, model: Optional[str] = None, max_tokens: int = 512, temperature: float = 0.0) -> str:
+    """Async version of call_groq_completion using the shared pooled httpx client."""
+    model = model or LLM_MODEL
+    client = get_async_client()
+
+    if GROQ_API_KEY:
+        try:
+            resp = await client.post(
+                **_groq_request(prompt, model, max_tokens, temperature),
+                timeout=get_timeout("completions"),
+            )
+            resp.raise_for_status()
+            reply = _groq_reply(resp.json())
+            if reply is not None:
+                return reply
+        except Exception:
+            pass
+
+    if OPENAI_API_KEY:
+        try:
+            resp = await client.post(
+                **_openai_request(prompt, model, max_tokens, temperature),
+                timeout=get_timeout("completions"),
+            )
+            resp.raise_for_status()
+            reply = _openai_reply(resp.json())
+            if reply is not None:
+                return reply
+        except Exception:
+            pass
+
+    return COMPLETION_FALLBACK_REPLY
+
+async def astream_groq_completion(
+    prompt: str, model: Optional[str] = None, max_tokens: int = 512, temperature: float = 0.0
+) -> AsyncIterator[str]:
+    """
+    Stream completion deltas from Groq's OpenAI-compatible SSE endpoint.
+    If streaming is unavailable or fails before the first delta, yields the
+    non-streamed reply from acall_groq_completion as a single chunk.
+    """
+    model = model or LLM_MODEL
+    emitted = False
+    if GROQ_API_KEY:
+        request = _groq_request(prompt, model, max_tokens, temperature)
+        request["json"]["stream"] = True
+        try:
+            async with get_async_client().stream(
+                "POST", **request, timeout=get_timeout("completions")
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or []
+                    delta = ((choices[0].get("delta") or {}).get("content") if choices else None)
+                    if delta:
+                        emitted = True
+                        yield delta
+        except Exception:
+            # a stream that already produced text is not restarted
+            if emitted:
+                return
+        if emitted:
+            return
+
+    yield await acall_groq_completion(prompt, model=model, max_tokens=max_tokens, temperature=temperature)
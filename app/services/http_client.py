@@ -0,0 +1,67 @@
+from typing import Dict, Optional
+import os
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared, pooled HTTP clients for outbound model calls (embeddings, completions, llama-parse).
+# Reusing connections avoids a fresh TCP + TLS handshake on every request.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    "embeddings": float(os.getenv("EMBEDDINGS_TIMEOUT", "30")),
+    "completions": float(os.getenv("COMPLETIONS_TIMEOUT", "60")),
+    "parse": float(os.getenv("LLAMA_PARSE_TIMEOUT", "30")),
+}
+DEFAULT_TIMEOUT = 30.0
+
+_session: Optional[requests.Session] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+
+def get_timeout(endpoint: str) -> float:
+    """Return the configured timeout (seconds) for a named endpoint."""
+    return ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+
+def get_session() -> requests.Session:
+    """Return the process-wide keep-alive requests.Session, creating it on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled httpx.AsyncClient, creating it on first use."""
+    global _async_client
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            limits = httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            )
+            _async_client = httpx.AsyncClient(limits=limits, timeout=DEFAULT_TIMEOUT)
+        return _async_client
+
+def close_session() -> None:
+    """Close the shared sync session (its pooled connections are dropped)."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+async def aclose_async_client() -> None:
+    """Close the shared async client."""
+    global _async_client
+    with _lock:
+        client, _async_client = _async_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
@@ -0,0 +1,222 @@
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+import time
+import uuid
+from app.services.dedup import NearDuplicateIndex
+from app.services.embeddings import EmbeddingService
+from app.services.ingestion_pipeline import store_chunk_stream, sync_file_chunks
+from app.services.lexical_index import LexicalIndex
+from app.services.text_extractor import Source, iter_pages
+from app.services.vectorstore import VectorStore
+from app.utils.chunking import iter_chunk_document
+from app.utils.token_counting import get_token_counter
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+class JobQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept another job."""
+
+@dataclass
+class IngestionJob:
+    """Progress record for one background ingestion."""
+    id: str
+    file_name: str
+    status: str = "queued"  # queued | running | succeeded | failed
+    stage: str = "queued"  # queued | extracting | embedding | done
+    pages_extracted: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    chunks_deduplicated: int = 0
+    chunks_unchanged: int = 0  # incremental jobs: chunks whose stored embedding was kept
+    chunks_removed: int = 0  # incremental jobs: stored chunks no longer in the file
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+@dataclass
+class _JobInput:
+    job: IngestionJob
+    content: Source  # bytes, or the path of a spooled upload the job deletes when done
+    content_type: str
+    chunking_strategy: str
+    chunk_size: int
+    chunk_overlap: int
+    incremental: bool = False
+
+def _discard_source(content: Source) -> None:
+    if isinstance(content, str):
+        try:
+            os.remove(content)
+        except FileNotFoundError:
+            pass
+
+class IngestionJobQueue:
+    """
+    Bounded in-process job queue served by asyncio worker tasks.
+
+    Workers are started lazily on first submit (or explicitly via start()) in the
+    running event loop. Pages are extracted and chunked lazily in a worker thread
+    while earlier batches are embedded, upserted and written to SQL through
+    store_chunk_stream, so progress is visible while a large document is still being processed.
+    chunks_total counts the chunks produced so far until the job is done.
+    """
+    def __init__(
+        self,
+        emb_service: EmbeddingService,
+        vs: VectorStore,
+        workers: int = INGEST_WORKERS,
+        max_queued: int = INGEST_QUEUE_SIZE,
+        history: int = INGEST_JOB_HISTORY,
+        dedup: Optional[NearDuplicateIndex] = None,
+        lexical: Optional[LexicalIndex] = None,
+    ) -> None:
+        self.emb_service = emb_service
+        self.vs = vs
+        self.dedup = dedup
+        self.lexical = lexical
+        self.workers = workers
+        self.max_queued = max_queued
+        self.history = history
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel workers; queued jobs that never started are marked failed."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue is not None and not self._queue.empty():
+            _discard_source(self._queue.get_nowait().content)
+        for job in self._jobs.values():
+            if job.status in ("queued", "running"):
+                self._finish(job, error="ingestion service shut down")
+
+    def submit(
+        self,
+        file_name: str,
+        content: Source,
+        content_type: str,
+        chunking_strategy: str = "fixed",
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        incremental: bool = False,
+    ) -> IngestionJob:
+        self.start()
+        job = IngestionJob(id=str(uuid.uuid4()), file_name=file_name)
+        try:
+            self._queue.put_nowait(
+                _JobInput(job, content, content_type, chunking_strategy, chunk_size, chunk_overlap, incremental)
+            )
+        except asyncio.QueueFull as exc:
+            raise JobQueueFull("Ingestion queue is full, retry later") from exc
+        self._jobs[job.id] = job
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def _evict_finished(self) -> None:
+        """Drop the oldest finished jobs once more than `history` are tracked."""
+        if len(self._jobs) <= self.history:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at is not None]:
+            if len(self._jobs) <= self.history:
+                break
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _finish(job: IngestionJob, error: Optional[str] = None) -> None:
+        job.status = "failed" if error else "succeeded"
+        job.stage = "done"
+        job.error = error
+        job.finished_at = time.time()
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._run(item)
+            except Exception as exc:
+                self._finish(item.job, error=str(exc))
+            finally:
+                _discard_source(item.content)
+                self._queue.task_done()
+
+    async def _run(self, item: _JobInput) -> None:
+        job = item.job
+        job.status = "running"
+
+        job.stage = "extracting"
+
+        def on_page(done: int) -> None:
+            job.pages_extracted = done
+
+        def counted_chunks():
+            # pages are extracted and chunked lazily while earlier batches are embedded and stored
+            pages = iter_pages(item.content, item.content_type, on_page)
+            chunks = iter_chunk_document(
+                pages, item.chunking_strategy, item.chunk_size, item.chunk_overlap, token_counter=get_token_counter()
+            )
+            for chunk in chunks:
+                if not chunk.strip():
+                    continue
+                job.stage = "embedding"
+                job.chunks_total += 1
+                yield chunk
+
+        if item.incremental:
+            # the diff needs every chunk of the new version before anything is replaced
+            chunks = await asyncio.to_thread(list, counted_chunks())
+            if not chunks:
+                self._finish(job, error="No text extracted from file")
+                return
+            result = await sync_file_chunks(
+                job.file_name, chunks, self.emb_service, self.vs, dedup=self.dedup, lexical=self.lexical
+            )
+            job.chunks_embedded = result["embedded"]
+            job.chunks_stored = len(chunks)
+            job.chunks_deduplicated = result["deduplicated"]
+            job.chunks_unchanged = result["unchanged"]
+            job.chunks_removed = result["removed"]
+            self._finish(job)
+            return
+
+        def on_embedded(done: int, total: Optional[int]) -> None:
+            job.chunks_embedded = done
+
+        def on_stored(done: int, total: Optional[int]) -> None:
+            job.chunks_stored = done
+
+        saved = await store_chunk_stream(
+            job.file_name,
+            counted_chunks(),
+            self.emb_service,
+            self.vs,
+            on_embedded=on_embedded,
+            on_stored=on_stored,
+            dedup=self.dedup,
+            lexical=self.lexical,
+        )
+        if not saved:
+            self._finish(job, error="No text extracted from file")
+            return
+        job.chunks_deduplicated = sum(1 for meta in saved if meta["deduplicated"])
+        self._finish(job)
@@ -0,0 +1,289 @@
+from collections import defaultdict
+import asyncio
+import itertools
+import os
+from typing import AbstractSet, Any, Callable, Dict, Iterator, List, Optional, Tuple
+from app.services.dedup import Match, NearDuplicateIndex
+from app.services.embedding_cache import text_hash
+from app.services.embeddings import EmbeddingService
+from app.services.lexical_index import LexicalIndex
+from app.services.vectorstore import VectorStore
+from app.utils.db import bulk_insert_chunk_meta, load_chunk_meta, referenced_embedding_ids, replace_chunk_meta
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "128"))
+
+# Called with (done, total); total is None while a chunk stream is still being consumed.
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+async def store_chunks(
+    file_name: str,
+    chunks: List[str],
+    emb_service: EmbeddingService,
+    vs: VectorStore,
+    batch_size: int = INGEST_BATCH_SIZE,
+    on_embedded: Optional[ProgressCallback] = None,
+    on_stored: Optional[ProgressCallback] = None,
+    dedup: Optional[NearDuplicateIndex] = None,
+    lexical: Optional[LexicalIndex] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Embed chunks, upsert the vectors and write FileChunkMeta rows, batch_size chunks at a time.
+
+    Blocking vector-store and SQL calls run in worker threads so the event loop stays free.
+    The optional callbacks receive (done, total) after each batch is embedded / stored.
+    With a dedup index, near-duplicates of stored chunks (or of earlier chunks in the same
+    batch) are not embedded again: a chunk with the same text reuses the existing
+    embedding_id, any other one gets a point of its own carrying the matched vector.
+    Newly embedded chunks are also added to the lexical (BM25) index, if given.
+    """
+    return await store_chunk_stream(
+        file_name, iter(chunks), emb_service, vs, batch_size, on_embedded, on_stored, total=len(chunks), dedup=dedup, lexical=lexical
+    )
+
+async def store_chunk_stream(
+    file_name: str,
+    chunks: Iterator[str],
+    emb_service: EmbeddingService,
+    vs: VectorStore,
+    batch_size: int = INGEST_BATCH_SIZE,
+    on_embedded: Optional[ProgressCallback] = None,
+    on_stored: Optional[ProgressCallback] = None,
+    total: Optional[int] = None,
+    dedup: Optional[NearDuplicateIndex] = None,
+    lexical: Optional[LexicalIndex] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Like store_chunks, but pulls chunks from an iterator (e.g. iter_chunk_document) batch by
+    batch. The next batch is produced in a worker thread while the current one is embedded
+    and stored, so chunking overlaps with embedding and upsert.
+    """
+    def next_batch() -> List[str]:
+        return list(itertools.islice(chunks, batch_size))
+
+    saved: List[Dict[str, Any]] = []
+    start = 0
+    batch = await asyncio.to_thread(next_batch)
+    while batch:
+        pending = asyncio.create_task(asyncio.to_thread(next_batch))
+        try:
+            chunk_ids = list(range(start, start + len(batch)))
+            vec_ids, deduplicated = await _embed_batch(file_name, chunk_ids, batch, emb_service, vs, dedup, lexical)
+            done = start + len(batch)
+            if on_embedded is not None:
+                on_embedded(done, total)
+
+            rows = [
+                {"file_name": file_name, "chunk_id": chunk_id, "chunk_text": chunk_text, "embedding_id": vec_id}
+                for chunk_id, chunk_text, vec_id in zip(chunk_ids, batch, vec_ids)
+            ]
+            await asyncio.to_thread(bulk_insert_chunk_meta, rows)
+            saved.extend(
+                {"chunk_id": row["chunk_id"], "embedding_id": row["embedding_id"], "deduplicated": flag}
+                for row, flag in zip(rows, deduplicated)
+            )
+            if on_stored is not None:
+                on_stored(done, total)
+        except BaseException:
+            # let the producer thread finish before the iterator is dropped
+            await asyncio.gather(pending, return_exceptions=True)
+            raise
+        start = done
+        batch = await pending
+    return saved
+
+async def _embed_batch(
+    file_name: str,
+    chunk_ids: List[int],
+    texts: List[str],
+    emb_service: EmbeddingService,
+    vs: VectorStore,
+    dedup: Optional[NearDuplicateIndex],
+    lexical: Optional[LexicalIndex],
+    exclude: AbstractSet[str] = frozenset(),
+) -> Tuple[List[str], List[bool]]:
+    """
+    Embed and upsert one batch of chunks. Returns the embedding id of every chunk and
+    whether it reused the embedding of an existing (or earlier in-batch) near-duplicate
+    instead of being embedded. A chunk with the same text as its match is linked to the
+    match's vector, which gets `file_name` added to its "file_names"; any other
+    near-duplicate is stored as a new point with its own text and payload and a copy of
+    the match's vector, so searches never return the other version's text. The
+    `exclude` ids are never matched.
+    """
+    # matches[i]: embedding id of a stored near-duplicate, index of an earlier
+    # chunk in this batch, or None when the chunk has to be embedded
+    matches: List[Match] = [None] * len(texts)
+    if dedup is not None:
+        signatures = await asyncio.to_thread(dedup.signatures, texts)
+        matches = await asyncio.to_thread(dedup.resolve, signatures, exclude)
+    hashes = [text_hash(text) for text in texts]
+    stored = {match for match in matches if isinstance(match, str)}
+    stored_payloads = await asyncio.to_thread(vs.get_payloads, list(stored)) if stored else {}
+    stored_hashes = {vec_id: text_hash((payload or {}).get("text") or "") for vec_id, payload in stored_payloads.items()}
+
+    # copies[i]: the match whose vector chunk i reuses under a point of its own
+    copies: Dict[int, Match] = {}
+    for i, match in enumerate(matches):
+        if match is not None:
+            match_hash = hashes[match] if isinstance(match, int) else stored_hashes.get(match)
+            if match_hash != hashes[i]:
+                copies[i] = match
+    copied = {match for match in copies.values() if isinstance(match, str)}
+    stored_vectors = await asyncio.to_thread(vs.get_vectors, list(copied)) if copied else {}
+    for i, match in list(copies.items()):
+        if isinstance(match, str) and match not in stored_vectors:
+            # the stored vector is gone; embed the chunk after all
+            del copies[i]
+            matches[i] = None
+    new = [i for i, match in enumerate(matches) if match is None]
+
+    embeddings = await emb_service.aembed_texts([texts[i] for i in new]) if new else []
+    embedding_of = dict(zip(new, embeddings))
+    fresh = new + sorted(copies)
+    vectors = list(embeddings) + [
+        stored_vectors[copies[i]] if isinstance(copies[i], str) else embedding_of[copies[i]] for i in sorted(copies)
+    ]
+    payloads = [
+        {"file_name": file_name, "file_names": [file_name], "chunk_id": chunk_ids[i], "text": texts[i]}
+        for i in fresh
+    ]
+    fresh_ids = [str(vec_id) for vec_id in await asyncio.to_thread(vs.upsert_vectors, vectors, payloads)]
+    if dedup is not None:
+        dedup.add_many([signatures[i] for i in fresh], fresh_ids)
+    if lexical is not None:
+        await asyncio.to_thread(lexical.add_many, fresh_ids, payloads)
+    linked = {match for i, match in enumerate(matches) if isinstance(match, str) and i not in copies}
+    if linked:
+        await _update_file_names(file_name, linked, vs, lexical, link=True)
+    id_of = dict(zip(fresh, fresh_ids))
+    vec_ids = [
+        id_of[i] if i in id_of else id_of[match] if isinstance(match, int) else match
+        for i, match in enumerate(matches)
+    ]
+    return vec_ids, [match is not None for match in matches]
+
+async def _update_file_names(
+    file_name: str, vec_ids, vs: VectorStore, lexical: Optional[LexicalIndex], link: bool
+) -> None:
+    """
+    Add `file_name` to (link) or drop it from the "file_names" of stored vectors, so
+    file filters match a deduplicated chunk under every file that links to it. A
+    vector whose "file_name" is dropped takes the next file that still links to it.
+    """
+    payloads = await asyncio.to_thread(vs.get_payloads, list(vec_ids))
+    updates: Dict[str, Dict[str, Any]] = {}
+    for vec_id, payload in payloads.items():
+        payload = payload or {}
+        names = [name for name in payload.get("file_names") or [payload.get("file_name")] if name is not None]
+        if link and file_name not in names:
+            updates[vec_id] = {"file_names": names + [file_name]}
+        elif not link and file_name in names:
+            names.remove(file_name)
+            updates[vec_id] = {"file_names": names}
+            if payload.get("file_name") == file_name and names:
+                updates[vec_id]["file_name"] = names[0]
+    if updates:
+        await asyncio.to_thread(vs.update_payloads, updates)
+        if lexical is not None:
+            lexical.update_payloads(updates)
+
+async def sync_file_chunks(
+    file_name: str,
+    chunks: List[str],
+    emb_service: EmbeddingService,
+    vs: VectorStore,
+    batch_size: int = INGEST_BATCH_SIZE,
+    dedup: Optional[NearDuplicateIndex] = None,
+    lexical: Optional[LexicalIndex] = None,
+) -> Dict[str, Any]:
+    """
+    Incremental re-ingestion of a file: diff `chunks` against the chunks stored for
+    `file_name` by content hash, embed and upsert only the chunks that are new, and
+    delete the vectors of stored chunks that disappeared (unless another FileChunkMeta
+    row still references them, in which case the file is dropped from their
+    "file_names"). The file's FileChunkMeta rows are replaced in one transaction so
+    chunk_ids follow the new order, and the payloads of reused vectors this file owns
+    get their new chunk_id too. A recorded vector that is no longer in the store (an
+    in-memory store after a restart, with a persistent database) is embedded again
+    like a changed chunk. Changed chunks are never deduplicated against the file's
+    superseded vectors, so an edit is embedded afresh instead of inheriting the
+    embedding of the text it replaces.
+    """
+    stored = await asyncio.to_thread(load_chunk_meta, file_name)
+    # hash -> embedding ids of stored chunks with that content, consumed as they are matched
+    available: Dict[str, List[str]] = defaultdict(list)
+    for row in stored:
+        available[text_hash(row["chunk_text"] or "")].append(row["embedding_id"])
+
+    vec_ids: List[Optional[str]] = []
+    for chunk in chunks:
+        reusable = available.get(text_hash(chunk))
+        vec_ids.append(reusable.pop(0) if reusable else None)
+    reused = {vec_id for vec_id in vec_ids if vec_id is not None}
+    existing = await asyncio.to_thread(vs.get_payloads, list(reused)) if reused else {}
+    vec_ids = [vec_id if vec_id in existing else None for vec_id in vec_ids]
+    changed = [i for i, vec_id in enumerate(vec_ids) if vec_id is None]
+    superseded = {row["embedding_id"] for row in stored} - set(vec_ids)
+
+    # reused vectors of this file whose chunk moved; a vector shared by several chunks
+    # keeps the first one's chunk_id
+    moved: Dict[str, Dict[str, Any]] = {}
+    seen = set()
+    for i, vec_id in enumerate(vec_ids):
+        if vec_id is None or vec_id in seen:
+            continue
+        seen.add(vec_id)
+        payload = existing[vec_id] or {}
+        if payload.get("file_name") == file_name and payload.get("chunk_id") != i:
+            moved[vec_id] = {"chunk_id": i}
+    if moved:
+        await asyncio.to_thread(vs.update_payloads, moved)
+        if lexical is not None:
+            lexical.update_payloads(moved)
+
+    deduplicated = [False] * len(chunks)
+    for b in range(0, len(changed), batch_size):
+        positions = changed[b : b + batch_size]
+        ids, flags = await _embed_batch(
+            file_name, positions, [chunks[i] for i in positions], emb_service, vs, dedup, lexical, superseded
+        )
+        for i, vec_id, flag in zip(positions, ids, flags):
+            vec_ids[i] = vec_id
+            deduplicated[i] = flag
+
+    rows = [
+        {"file_name": file_name, "chunk_id": i, "chunk_text": chunk_text, "embedding_id": vec_id}
+        for i, (chunk_text, vec_id) in enumerate(zip(chunks, vec_ids))
+    ]
+    await asyncio.to_thread(replace_chunk_meta, file_name, rows)
+
+    removed = [vec_id for ids in available.values() for vec_id in ids]
+    candidates = set(removed) - set(vec_ids)
+    shared = await asyncio.to_thread(referenced_embedding_ids, candidates) if candidates else set()
+    orphans = list(candidates - shared)
+    if shared:
+        await _update_file_names(file_name, shared, vs, lexical, link=False)
+    if orphans:
+        await asyncio.to_thread(vs.delete_vectors, orphans)
+        if dedup is not None:
+            dedup.remove(orphans)
+        if lexical is not None:
+            lexical.remove(orphans)
+
+    unchanged = set(range(len(chunks))) - set(changed)
+    return {
+        "saved": [
+            {
+                "chunk_id": row["chunk_id"],
+                "embedding_id": row["embedding_id"],
+                "deduplicated": deduplicated[i],
+                "unchanged": i in unchanged,
+            }
+            for i, row in enumerate(rows)
+        ],
+        "unchanged": len(unchanged),
+        "embedded": len(changed) - sum(deduplicated),
+        "deduplicated": sum(deduplicated),
+        "removed": len(removed),
+        "vectors_deleted": len(orphans),
+    }
@@ -0,0 +1,202 @@
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+import os
+import re
+import threading
+import numpy as np
+from app.services.payload_filter import PayloadFilter, matches
+
+LEXICAL_INDEX = os.getenv("LEXICAL_INDEX", "true").lower() in ("1", "true", "yes")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Rebuild the postings without removed chunks once this fraction of indexed docs is removed.
+LEXICAL_COMPACT_RATIO = float(os.getenv("LEXICAL_COMPACT_RATIO", "0.25"))
+
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; identifiers like "SKU-1234" become ["sku", "1234"]."""
+    return _TOKEN.findall(text.lower())
+
+class LexicalIndex:
+    """
+    In-process inverted index with BM25 scoring over ingested chunks.
+
+    Chunks are keyed by their embedding id so lexical hits line up with vector hits.
+    Each term maps to two compact arrays — ascending internal doc numbers (uint32) and
+    term frequencies (uint16) — which are appended to as chunks are ingested and scored
+    with vectorized numpy operations at query time. Removed chunks are tombstoned;
+    once more than `compact_ratio` of the docs are, the postings are rebuilt without
+    them and the live docs renumbered (without re-tokenizing).
+    """
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B, compact_ratio: float = LEXICAL_COMPACT_RATIO) -> None:
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self._docs: Dict[str, array] = {}
+        self._freqs: Dict[str, array] = {}
+        self._lengths = array("I")
+        self._alive = bytearray()
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._positions: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add_many(self, embedding_ids: Sequence[str], payloads: Sequence[Dict[str, Any]]) -> None:
+        """Index chunks by their payload "text"; an id that is already indexed is replaced."""
+        tokenized = [Counter(tokenize(payload.get("text", ""))) for payload in payloads]
+        with self._lock:
+            self._remove(str(embedding_id) for embedding_id in embedding_ids)
+            for embedding_id, payload, counts in zip(embedding_ids, payloads, tokenized):
+                doc = len(self._ids)
+                self._ids.append(str(embedding_id))
+                self._payloads.append(payload)
+                self._positions[str(embedding_id)] = doc
+                length = sum(counts.values())
+                self._lengths.append(length)
+                self._alive.append(1)
+                self._total_length += length
+                for term, tf in counts.items():
+                    docs = self._docs.get(term)
+                    if docs is None:
+                        docs = self._docs[term] = array("I")
+                        self._freqs[term] = array("H")
+                    docs.append(doc)
+                    self._freqs[term].append(min(tf, 0xFFFF))
+
+    def update_payloads(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        """Merge fields into the payloads of indexed chunks ({embedding id: fields})."""
+        with self._lock:
+            for embedding_id, fields in updates.items():
+                doc = self._positions.get(str(embedding_id))
+                if doc is not None:
+                    self._payloads[doc] = {**self._payloads[doc], **fields}
+
+    def remove(self, embedding_ids: Sequence[str]) -> None:
+        with self._lock:
+            self._remove(str(embedding_id) for embedding_id in embedding_ids)
+
+    def follow(self, added: Sequence[Tuple[str, Dict[str, Any]]], removed: Sequence[str], reset: bool) -> None:
+        """SimpleVectorStore.on_refresh listener: mirror a read-only worker's store."""
+        if reset:
+            # index the writer's compacted store aside, then swap it in under the lock
+            fresh = LexicalIndex(self.k1, self.b, self.compact_ratio)
+            fresh.add_many([vec_id for vec_id, _ in added], [payload for _, payload in added])
+            with self._lock:
+                self._docs, self._freqs, self._lengths, self._alive = fresh._docs, fresh._freqs, fresh._lengths, fresh._alive
+                self._ids, self._payloads, self._positions = fresh._ids, fresh._payloads, fresh._positions
+                self._total_length = fresh._total_length
+            return
+        if added:
+            self.add_many([vec_id for vec_id, _ in added], [payload for _, payload in added])
+        if removed:
+            self.remove(removed)
+
+    def _remove(self, embedding_ids) -> None:
+        for embedding_id in embedding_ids:
+            doc = self._positions.pop(embedding_id, None)
+            if doc is None:
+                continue
+            self._total_length -= self._lengths[doc]
+            self._alive[doc] = 0
+            self._ids[doc] = None
+            self._payloads[doc] = None
+        if len(self._ids) - len(self._positions) > self.compact_ratio * len(self._ids):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Drop removed docs from the postings and side tables, renumbering the live ones."""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        new_doc = (np.cumsum(alive) - 1).astype(np.uint32)
+        docs: Dict[str, array] = {}
+        freqs: Dict[str, array] = {}
+        for term, postings in self._docs.items():
+            doc_ids = np.frombuffer(postings, dtype=np.uint32)
+            keep = alive[doc_ids]
+            if keep.any():
+                docs[term] = array("I", new_doc[doc_ids[keep]].tobytes())
+                freqs[term] = array("H", np.frombuffer(self._freqs[term], dtype=np.uint16)[keep].tobytes())
+        self._docs, self._freqs = docs, freqs
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+        live = np.flatnonzero(alive)
+        self._ids = [self._ids[doc] for doc in live]
+        self._payloads = [self._payloads[doc] for doc in live]
+        self._positions = {doc_id: doc for doc, doc_id in enumerate(self._ids)}
+        self._alive = bytearray(b"\x01" * len(self._ids))
+
+    def search(
+        self, query: str, top_k: int = 5, payload_filter: Optional[PayloadFilter] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        BM25 top_k as [{"id", "score", "payload"}], the shape of VectorStore.search_vector.
+        With payload_filter only matching chunks compete for the top_k slots.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            live = len(self._positions)
+            if not terms or live == 0 or top_k <= 0:
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            avg_length = self._total_length / live or 1.0
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+            alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            for term in terms:
+                if term in self._docs:
+                    self._score_term(term, live, alive, norm, scores)
+            scores[~alive] = 0.0
+            ids = list(self._ids)
+            payloads = list(self._payloads)
+
+        hits = np.flatnonzero(scores > 0)
+        if payload_filter:
+            hits = hits[[matches(payloads[i], payload_filter) for i in hits]] if len(hits) else hits
+        if hits.size > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [
+            {"id": ids[i], "score": float(scores[i]), "payload": payloads[i]}
+            for i in hits
+        ]
+
+    def _score_term(self, term: str, live: int, alive: np.ndarray, norm: np.ndarray, scores: np.ndarray) -> None:
+        # the numpy views over the posting arrays must not outlive the lock (arrays
+        # exporting a buffer cannot grow), so they stay local to this call
+        doc_ids = np.frombuffer(self._docs[term], dtype=np.uint32)
+        # tombstoned postings remain until the next compaction; df counts live docs only
+        df = len(doc_ids) if live == len(alive) else int(alive[doc_ids].sum())
+        idf = math.log(1.0 + (live - df + 0.5) / (df + 0.5))
+        tf = np.frombuffer(self._freqs[term], dtype=np.uint16).astype(np.float32)
+        scores[doc_ids] += idf * tf * (self.k1 + 1.0) / (tf + norm[doc_ids])
+
+    def load_from_db(self) -> int:
+        """
+        Index the chunks already recorded in FileChunkMeta, one per embedding id, with
+        every file that links to it under "file_names".
+        Only meaningful when the vector store persists across restarts (Qdrant, or a
+        SimpleVectorStore with LOCAL_VECTOR_STORE_PATH).
+        """
+        from app.utils.db import FileChunkMeta, session_scope
+        payloads: Dict[str, Dict[str, Any]] = {}
+        with session_scope() as session:
+            rows = session.query(
+                FileChunkMeta.embedding_id,
+                FileChunkMeta.file_name,
+                FileChunkMeta.chunk_id,
+                FileChunkMeta.chunk_text,
+            ).order_by(FileChunkMeta.id)
+            for eid, name, cid, text in rows.yield_per(1000):
+                payload = payloads.get(eid)
+                if payload is None:
+                    # the first row recorded for a vector is the one that embedded it
+                    payloads[eid] = {"file_name": name, "file_names": [name], "chunk_id": cid, "text": text or ""}
+                elif name not in payload["file_names"]:
+                    payload["file_names"].append(name)
+        self.add_many(list(payloads), list(payloads.values()))
+        return len(payloads)
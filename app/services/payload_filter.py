@@ -0,0 +1,137 @@
+from array import array
+from typing import Any, Dict, List, Optional, Sequence
+import os
+import numpy as np
+from app.services.vector_log import decode_payload
+
+# Payload fields the in-memory store keeps an inverted (value -> rows) index for.
+LOCAL_PAYLOAD_INDEX_FIELDS = [
+    f.strip() for f in os.getenv("LOCAL_PAYLOAD_INDEX_FIELDS", "file_name").split(",") if f.strip()
+]
+
+# {field: value} equality, {field: [values]} membership, {field: {"gte": 1, "lt": 5}} range;
+# all conditions must hold.
+PayloadFilter = Dict[str, Any]
+
+RANGE_OPS = ("gt", "gte", "lt", "lte")
+# Qdrant matches only keywords, integers and booleans by value; floats go in ranges.
+_MATCH_VALUES = (str, int, bool)
+
+def field_values(payload: Dict[str, Any], field: str) -> List[Any]:
+    """
+    The values a condition on `field` is tested against. A chunk deduplicated across
+    files keeps the first file in "file_name" and every file in "file_names", so a
+    condition on file_name matches any of them.
+    """
+    if field == "file_name" and payload.get("file_names"):
+        return payload["file_names"]
+    return [payload.get(field)]
+
+def validate_filter(payload_filter: Optional[PayloadFilter]) -> Optional[PayloadFilter]:
+    """Check the filter's shape; raises ValueError for unsupported conditions."""
+    if payload_filter is None:
+        return None
+    if not isinstance(payload_filter, dict):
+        raise ValueError("filter must be an object of field conditions")
+    for field, condition in payload_filter.items():
+        if isinstance(condition, dict):
+            if not condition or set(condition) - set(RANGE_OPS):
+                raise ValueError(f"range condition on {field!r} takes only {', '.join(RANGE_OPS)}")
+            if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in condition.values()):
+                raise ValueError(f"range bounds on {field!r} must be numbers")
+        elif isinstance(condition, list):
+            if not condition:
+                raise ValueError(f"value list for {field!r} is empty")
+            if not all(isinstance(v, _MATCH_VALUES) for v in condition):
+                raise ValueError(f"values for {field!r} must be strings, integers or booleans")
+        elif not isinstance(condition, _MATCH_VALUES):
+            raise ValueError(
+                f"value for {field!r} must be a string, integer or boolean (use a range for floats)"
+            )
+    return payload_filter
+
+def _in_range(value: Any, bounds: Dict[str, float]) -> bool:
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return False
+    return (
+        ("gt" not in bounds or value > bounds["gt"])
+        and ("gte" not in bounds or value >= bounds["gte"])
+        and ("lt" not in bounds or value < bounds["lt"])
+        and ("lte" not in bounds or value <= bounds["lte"])
+    )
+
+def _condition_holds(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict):
+        return _in_range(value, condition)
+    if isinstance(condition, list):
+        return value in condition
+    return value == condition
+
+def matches(payload: Dict[str, Any], payload_filter: Optional[PayloadFilter]) -> bool:
+    """Whether a payload satisfies every condition of the filter."""
+    if not payload_filter:
+        return True
+    return all(
+        any(_condition_holds(value, cond) for value in field_values(payload, field))
+        for field, cond in payload_filter.items()
+    )
+
+class PayloadIndex:
+    """
+    Inverted payload index of SimpleVectorStore rows: for each indexed field, the rows
+    (compact int64 arrays) holding each value. A filter becomes a boolean row mask built
+    from the posting lists of indexed fields; conditions on other fields fall back to a
+    scan of the candidate rows' payloads.
+    """
+    def __init__(self, fields: Sequence[str] = tuple(LOCAL_PAYLOAD_INDEX_FIELDS)) -> None:
+        self.fields = list(fields)
+        self._postings: Dict[str, Dict[Any, array]] = {field: {} for field in self.fields}
+
+    def add(self, payloads: Sequence[Any], start: int) -> None:
+        """Index rows start, start + 1, ... holding `payloads` (dicts or raw JSON)."""
+        for offset, payload in enumerate(payloads):
+            payload = decode_payload(payload)
+            for field in self.fields:
+                for value in field_values(payload, field):
+                    if value is None or isinstance(value, (dict, list)):
+                        continue
+                    self._postings[field].setdefault(value, array("q")).append(start + offset)
+
+    def remap(self, keep: np.ndarray, old_size: int) -> None:
+        """Follow a compaction of the store: row keep[i] moved to row i, others were dropped."""
+        new_row = np.full(old_size, -1, dtype=np.int64)
+        new_row[keep] = np.arange(len(keep))
+        for field, postings in self._postings.items():
+            for value in list(postings):
+                moved = new_row[np.frombuffer(postings[value], dtype=np.int64)]
+                moved = moved[moved >= 0]
+                if len(moved):
+                    postings[value] = array("q", moved.tolist())
+                else:
+                    del postings[value]
+
+    def mask(self, payload_filter: PayloadFilter, size: int, payloads: Sequence[Any]) -> np.ndarray:
+        """Boolean mask over rows [0, size) of the rows matching the filter."""
+        mask = np.ones(size, dtype=bool)
+        scanned: Dict[str, Any] = {}
+        for field, condition in payload_filter.items():
+            postings = self._postings.get(field)
+            if postings is None:
+                scanned[field] = condition
+                continue
+            if isinstance(condition, dict):
+                values = [v for v in postings if _in_range(v, condition)]
+            elif isinstance(condition, list):
+                values = [v for v in condition if v in postings]
+            else:
+                values = [condition] if condition in postings else []
+            allowed = np.zeros(size, dtype=bool)
+            for value in values:
+                rows = np.frombuffer(postings[value], dtype=np.int64)
+                allowed[rows[rows < size]] = True
+            mask &= allowed
+        if scanned:
+            for row in np.flatnonzero(mask):
+                if not matches(decode_payload(payloads[row]), scanned):
+                    mask[row] = False
+        return mask
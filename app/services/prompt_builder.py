@@ -0,0 +1,167 @@
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Sequence
+import os
+import re
+from app.utils.token_counting import TokenCounter, WhitespaceTokenCounter, get_token_counter
+
+# Token budget of the whole prompt (system text, context, history and query), counted
+# with the CHUNK_TOKENIZER_PATH vocabulary when set, whitespace words otherwise.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4096"))
+# Most tokens history may take while context still wants room; unused context goes to history.
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "1024"))
+# A chunk that does not fit is cut to the remaining room if that is at least this many
+# tokens, and dropped otherwise.
+PROMPT_MIN_CHUNK_TOKENS = int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", "32"))
+# Shortest run of words shared by two chunks' edges that counts as chunker overlap.
+PROMPT_OVERLAP_MIN_WORDS = int(os.getenv("PROMPT_OVERLAP_MIN_WORDS", "3"))
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant that answers questions using the provided context.\n"
+    "If the context does not contain the answer, say you don’t know.\n"
+    "Use prior conversation memory to maintain continuity."
+)
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+_WORD = re.compile(r"\S+")
+
+@dataclass
+class BuiltPrompt:
+    text: str
+    # tokens per section ("system", "context", "history", "query", "total") plus what
+    # was kept, deduplicated, cut and dropped to stay within the budget
+    usage: Dict[str, int] = field(default_factory=dict)
+
+def _edge_overlap(left: List[str], right: List[str], min_words: int) -> int:
+    """Length of the longest run of words ending `left` that also starts `right`."""
+    if not right:
+        return 0
+    first = right[0]
+    longest = min(len(left), len(right))
+    # candidate runs start where left holds right's first word, longest first
+    for start in range(len(left) - longest, len(left) - min_words + 1):
+        if left[start] == first and left[start:] == right[:len(left) - start]:
+            return len(left) - start
+    return 0
+
+def dedupe_chunks(
+    results: Sequence[Dict[str, Any]], min_words: int = PROMPT_OVERLAP_MIN_WORDS
+) -> List[Dict[str, Any]]:
+    """
+    Retrieved chunks (best first) with repeated text removed. A chunk whose text is
+    contained in a better-ranked chunk is dropped; the words it shares with the edge of
+    a better-ranked chunk of the same file (the overlap the chunkers carry between
+    neighbouring chunks) are cut from it. Cut hits get the remaining text, with its
+    original spacing, under payload["text"].
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_words: List[List[str]] = []
+    for result in results:
+        payload = result.get("payload") or {}
+        text = payload.get("text", "")
+        spans = [m.span() for m in _WORD.finditer(text)]
+        words = [text[start:end] for start, end in spans]
+        lo, hi = 0, len(words)
+        file_name = payload.get("file_name")
+        for other, other_words in zip(kept, kept_words):
+            if lo >= hi:
+                break
+            if f" {' '.join(words[lo:hi])} " in f" {' '.join(other_words)} ":
+                lo = hi
+                break
+            if file_name != (other.get("payload") or {}).get("file_name"):
+                continue
+            # this chunk continues the other one, or leads into it
+            lo += _edge_overlap(other_words, words[lo:hi], min_words)
+            hi -= _edge_overlap(words[lo:hi], other_words, min_words)
+        if lo >= hi:
+            continue
+        if (lo, hi) != (0, len(words)):
+            payload = {**payload, "text": text[spans[lo][0]:spans[hi - 1][1]]}
+        kept.append({**result, "payload": payload})
+        kept_words.append(words[lo:hi])
+    return kept
+
+def _head(text: str, n: int, counter: TokenCounter) -> str:
+    """The leading whitespace-separated words of `text` that fit in `n` tokens."""
+    spans = [m.span() for m in _WORD.finditer(text)]
+    totals = accumulate(counter.count_batch([text[start:end] for start, end in spans]))
+    fit = next((i for i, total in enumerate(totals) if total > n), len(spans))
+    return text[:spans[fit - 1][1]] if fit else ""
+
+def _format_message(message: Dict[str, Any]) -> str:
+    return f"{message.get('role', 'user')}: {message.get('content', '')}"
+
+def build_prompt(
+    query: str,
+    results: Sequence[Dict[str, Any]],
+    history: Sequence[Dict[str, Any]],
+    budget: int = PROMPT_TOKEN_BUDGET,
+    history_tokens: int = PROMPT_HISTORY_TOKENS,
+    token_counter: Optional[TokenCounter] = None,
+) -> BuiltPrompt:
+    """
+    Compose the chat prompt within `budget` tokens.
+
+    The system text and query are always included. Retrieved chunks (best first) are
+    deduplicated, then added in rank order while they fit; the first that does not fit
+    is cut to the remaining room (or dropped if under PROMPT_MIN_CHUNK_TOKENS) and the
+    rest are dropped. History keeps its most recent messages, up to `history_tokens`
+    while context needs the room and up to whatever context leaves over otherwise.
+    """
+    counter = token_counter or get_token_counter() or WhitespaceTokenCounter()
+    query_text = f"User: {query}\nAssistant:"
+    template = f"{SYSTEM_PROMPT}\n\nContext:\n{{}}\n\nConversation history:\n{{}}\n\n"
+    fixed = counter.count(template.format("", "")) + counter.count(query_text)
+    room = max(0, budget - fixed)
+
+    messages = [_format_message(m) for m in history]
+    message_tokens = counter.count_batch(messages)
+    history_need = sum(message_tokens)
+
+    chunks = dedupe_chunks(results)
+    context_room = room - min(history_need, history_tokens, room)
+    separator = counter.count(CONTEXT_SEPARATOR)
+    texts = [c["payload"].get("text", "") for c in chunks]
+    parts: List[str] = []
+    used = 0
+    truncated = 0
+    for text, tokens in zip(texts, counter.count_batch(texts)):
+        cost = tokens + (separator if parts else 0)
+        if used + cost <= context_room:
+            parts.append(text)
+            used += cost
+            continue
+        left = context_room - used - (separator if parts else 0)
+        if left >= PROMPT_MIN_CHUNK_TOKENS:
+            parts.append(_head(text, left, counter))
+            truncated = 1
+        break
+    context = CONTEXT_SEPARATOR.join(parts)
+
+    history_room = room - counter.count(context) if context else room
+    kept: List[str] = []
+    spent = 0
+    for message, tokens in zip(reversed(messages), reversed(message_tokens)):
+        if spent + tokens > history_room:
+            break
+        kept.append(message)
+        spent += tokens
+    history_text = "\n".join(reversed(kept))
+
+    text = template.format(context, history_text) + query_text
+    usage = {
+        "system": counter.count(template.format("", "")),
+        "context": counter.count(context) if context else 0,
+        "history": counter.count(history_text) if history_text else 0,
+        "query": counter.count(query_text),
+        "total": counter.count(text),
+        "budget": budget,
+        "chunks_retrieved": len(results),
+        "chunks_deduplicated": len(results) - len(chunks),
+        "chunks_used": len(parts),
+        "chunks_truncated": truncated,
+        "history_messages": len(kept),
+        "history_dropped": len(messages) - len(kept),
+    }
+    return BuiltPrompt(text=text, usage=usage)
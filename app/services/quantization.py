@@ -0,0 +1,293 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+import os
+import threading
+import numpy as np
+
+# Compressed vector codes for the in-memory store: "none", "int8" or "pq".
+LOCAL_QUANTIZATION = os.getenv("LOCAL_QUANTIZATION", "none").lower()
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "96"))  # bytes per vector; must divide the dimension
+PQ_MIN_TRAIN = int(os.getenv("PQ_MIN_TRAIN", "10000"))
+PQ_TRAIN_SAMPLE = int(os.getenv("PQ_TRAIN_SAMPLE", "65536"))
+# Train the PQ codebooks in a background thread instead of inside the upsert that triggers it.
+PQ_TRAIN_BACKGROUND = os.getenv("PQ_TRAIN_BACKGROUND", "true").lower() in ("1", "true", "yes")
+# Candidates re-ranked with float32 vectors per requested result; PQ codes are coarser.
+INT8_RERANK_FACTOR = int(os.getenv("INT8_RERANK_FACTOR", "4"))
+PQ_RERANK_FACTOR = int(os.getenv("PQ_RERANK_FACTOR", "16"))
+
+# rows converted to float32 at a time when scoring int8 codes (stays cache-sized)
+_SCORE_BLOCK = 2048
+
+def _grow(buf: Optional[np.ndarray], size: int, extra: int, row_shape: tuple, dtype) -> np.ndarray:
+    """Return `buf` (or a geometrically grown copy) with room for `extra` more rows."""
+    needed = size + extra
+    if buf is not None and needed <= len(buf):
+        return buf
+    capacity = max(1024, needed if buf is None else len(buf))
+    while capacity < needed:
+        capacity *= 2
+    grown = np.zeros((capacity,) + row_shape, dtype=dtype)
+    if buf is not None:
+        grown[:size] = buf[:size]
+    return grown
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Euclidean k-means centroids of the rows of `data`."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        # argmin |x - c|^2 == argmax x.c - |c|^2 / 2
+        assign = np.argmax(data @ centroids.T - 0.5 * (centroids * centroids).sum(axis=1), axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = ~filled
+        centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+    return centroids
+
+class Quantizer(ABC):
+    """
+    Compressed codes for the rows of SimpleVectorStore's matrix, used to shortlist
+    candidates that are then re-ranked with the float32 vectors. Rows are fed through
+    add() as they are written; scores() estimates query . row for all or some rows.
+    """
+    trained = True
+    rerank_factor = INT8_RERANK_FACTOR
+
+    def check_dim(self, dim: int) -> None:
+        """Raise ValueError if vectors of this dimension cannot be encoded."""
+
+    def ready(self) -> bool:
+        """True once scores() can be used; called under the store lock before searching."""
+        return self.trained
+
+    @abstractmethod
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        """Encode rows [start, end) that were just written to the store's matrix."""
+
+    @abstractmethod
+    def remap(self, keep: np.ndarray) -> None:
+        """Follow a compaction of the store: row keep[i] moved to row i."""
+
+    @abstractmethod
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray], size: int) -> np.ndarray:
+        """Approximate similarities for `rows`, or for rows [0, size) when rows is None."""
+
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Memory held by the codes (and codebooks), in bytes."""
+
+class ScalarQuantizer(Quantizer):
+    """int8 codes with one float32 scale per row: row ~= scale * code (4x smaller)."""
+
+    def __init__(self) -> None:
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._size = 0
+
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        rows = np.asarray(matrix[start:end], dtype=np.float32)
+        scales = np.abs(rows).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self._codes = _grow(self._codes, self._size, len(rows), rows.shape[1:], np.int8)
+        self._scales = _grow(self._scales, self._size, len(rows), (), np.float32)
+        self._codes[self._size:self._size + len(rows)] = np.rint(rows / scales[:, None])
+        self._scales[self._size:self._size + len(rows)] = scales
+        self._size += len(rows)
+
+    def remap(self, keep: np.ndarray) -> None:
+        if self._codes is None:
+            return
+        self._codes[:len(keep)] = self._codes[keep]
+        self._scales[:len(keep)] = self._scales[keep]
+        self._size = len(keep)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray], size: int) -> np.ndarray:
+        if rows is not None:
+            return (self._codes[rows].astype(np.float32) @ query) * self._scales[rows]
+        out = np.empty(size, dtype=np.float32)
+        for start in range(0, size, _SCORE_BLOCK):
+            end = min(size, start + _SCORE_BLOCK)
+            out[start:end] = (self._codes[start:end].astype(np.float32) @ query) * self._scales[start:end]
+        return out
+
+    def nbytes(self) -> int:
+        return self._size * (self._codes.shape[1] + 4) if self._codes is not None else 0
+
+class ProductQuantizer(Quantizer):
+    """
+    Product quantization: each vector is cut into `subvectors` pieces and every piece
+    replaced by the id of its nearest of 256 k-means centroids, so a vector costs
+    `subvectors` bytes. Query scores are sums of per-subspace lookup tables (asymmetric
+    distance). Codebooks are trained once `min_train` rows exist; until then the store
+    searches its float32 vectors exactly.
+
+    With background=True (PQ_TRAIN_BACKGROUND) the k-means fits and the initial
+    encoding run in a daemon thread over the matrix as it was when training started,
+    like IVFIndex: the result is swapped in by the next add() or ready(), which encodes
+    the rows added meanwhile, and a compaction (remap) during training discards it.
+    """
+    rerank_factor = PQ_RERANK_FACTOR
+
+    def __init__(
+        self,
+        subvectors: int = PQ_SUBVECTORS,
+        min_train: int = PQ_MIN_TRAIN,
+        train_sample: int = PQ_TRAIN_SAMPLE,
+        iterations: int = 10,
+        seed: int = 0,
+        background: bool = PQ_TRAIN_BACKGROUND,
+    ) -> None:
+        self.subvectors = subvectors
+        self.min_train = max(1, min_train)
+        self.train_sample = train_sample
+        self.iterations = iterations
+        self.seed = seed
+        self.background = background
+        self.codebooks: Optional[np.ndarray] = None  # (subvectors, ksub, dsub)
+        self._codes: Optional[np.ndarray] = None
+        self._size = 0
+        # background training: the thread, its finished result (codebooks, codes, size),
+        # and the matrix and row count of the latest add() to catch up from
+        self._lock = threading.Lock()
+        self._training: Optional[threading.Thread] = None
+        self._ready: Optional[Tuple[np.ndarray, np.ndarray, int]] = None
+        self._epoch = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._end = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def check_dim(self, dim: int) -> None:
+        if dim % self.subvectors:
+            raise ValueError(f"PQ subvectors ({self.subvectors}) must divide the dimension ({dim})")
+
+    def train(self, matrix: np.ndarray, size: int) -> None:
+        """Fit codebooks on (a sample of) the first `size` rows and encode them, in this thread."""
+        self.codebooks, self._codes, self._size = self._build(matrix, size)
+
+    def _build(self, matrix: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        dim = matrix.shape[1]
+        self.check_dim(dim)
+        rng = np.random.default_rng(self.seed)
+        sample = np.asarray(matrix[:size], dtype=np.float32)
+        if size > self.train_sample:
+            sample = sample[np.sort(rng.choice(size, size=self.train_sample, replace=False))]
+        dsub = dim // self.subvectors
+        ksub = min(256, len(sample))
+        codebooks = np.stack([
+            kmeans(sample[:, j * dsub:(j + 1) * dsub], ksub, self.iterations, self.seed + j)
+            for j in range(self.subvectors)
+        ])
+        codes, size = _pq_encode(codebooks, None, 0, matrix, 0, size)
+        return codebooks, codes, size
+
+    def _train_in_background(self, matrix: np.ndarray, size: int) -> None:
+        epoch = self._epoch
+
+        def run() -> None:
+            result = None
+            try:
+                result = self._build(matrix, size)
+            finally:
+                with self._lock:
+                    self._training = None
+                    if result is not None and self._epoch == epoch:
+                        self._ready = result
+
+        self._training = threading.Thread(target=run, name="pq-train", daemon=True)
+        self._training.start()
+
+    def _install_ready(self) -> None:
+        """Swap in a finished background training, encoding the rows added since it started."""
+        with self._lock:
+            ready, self._ready = self._ready, None
+        if ready is None:
+            return
+        codebooks, codes, size = ready
+        if self._end > size:
+            codes, size = _pq_encode(codebooks, codes, size, self._matrix, size, self._end)
+        self.codebooks, self._codes, self._size = codebooks, codes, size
+
+    def wait(self) -> None:
+        """Block until a background training has finished and install it (tests, benchmarks)."""
+        training = self._training
+        if training is not None:
+            training.join()
+        self._install_ready()
+
+    def ready(self) -> bool:
+        self._install_ready()
+        return self.trained
+
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        self._install_ready()  # catches up to the previous add(); rows [start, end) are encoded below
+        self._matrix, self._end = matrix, end
+        if self.trained:
+            self._codes, self._size = _pq_encode(self.codebooks, self._codes, self._size, matrix, start, end)
+        elif end >= self.min_train and not self.background:
+            self.train(matrix, end)
+        elif end >= self.min_train and self._training is None:
+            self._train_in_background(matrix, end)
+
+    def remap(self, keep: np.ndarray) -> None:
+        with self._lock:
+            # row numbers of a training in progress are stale now
+            self._epoch += 1
+            self._ready = None
+        self._end = len(keep)
+        if self._codes is None:
+            return
+        self._codes[:, :len(keep)] = self._codes[:, keep]
+        self._size = len(keep)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray], size: int) -> np.ndarray:
+        m, ksub, dsub = self.codebooks.shape
+        # asymmetric distance: one lookup table of query . centroid per subspace
+        table = np.einsum("md,mkd->mk", query.reshape(m, dsub), self.codebooks)
+        codes = self._codes[:, :size] if rows is None else self._codes[:, rows]
+        out = np.zeros(codes.shape[1], dtype=np.float32)
+        for j in range(m):
+            out += table[j].take(codes[j])
+        return out
+
+    def nbytes(self) -> int:
+        return self._size * self.subvectors + (self.codebooks.nbytes if self.codebooks is not None else 0)
+
+def _pq_encode(
+    codebooks: np.ndarray, codes: Optional[np.ndarray], size: int, matrix: np.ndarray, start: int, end: int
+) -> Tuple[np.ndarray, int]:
+    """Append the PQ codes of rows [start, end) to `codes` (or a grown copy) after `size` rows."""
+    m, ksub, dsub = codebooks.shape
+    # codes are stored one contiguous row per subspace: (subvectors, capacity)
+    needed = size + end - start
+    if codes is None or needed > codes.shape[1]:
+        capacity = max(1024, needed if codes is None else codes.shape[1])
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((m, capacity), dtype=np.uint8)
+        if codes is not None:
+            grown[:, :size] = codes[:, :size]
+        codes = grown
+    half_norms = 0.5 * (codebooks * codebooks).sum(axis=2)  # (m, ksub)
+    for block in range(start, end, _SCORE_BLOCK):
+        rows = np.asarray(matrix[block:min(end, block + _SCORE_BLOCK)], dtype=np.float32)
+        for j in range(m):
+            # nearest centroid per subspace: argmax x.c - |c|^2 / 2
+            sims = rows[:, j * dsub:(j + 1) * dsub] @ codebooks[j].T - half_norms[j]
+            codes[j, size:size + len(rows)] = np.argmax(sims, axis=1)
+        size += len(rows)
+    return codes, size
+
+def make_quantizer(kind: str) -> Optional[Quantizer]:
+    if kind in ("", "none"):
+        return None
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer()
+    raise ValueError(f"Unknown quantization: {kind}")
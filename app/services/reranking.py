@@ -0,0 +1,121 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence
+import os
+import time
+import numpy as np
+from app.services.lexical_index import tokenize
+
+# Second-stage scorer for retrieved chunks: "none", "lexical" (query-term overlap)
+# or "onnx" (cross-encoder exported to ONNX, see OnnxCrossEncoderReranker).
+RERANKER = os.getenv("RERANKER", "none").lower()
+# Candidates fetched per requested result for the re-ranker to choose from.
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "4"))
+# Time the re-ranker may spend per query; unscored candidates follow the scored ones
+# in their retrieval order.
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+RERANK_ONNX_MODEL = os.getenv("RERANK_ONNX_MODEL", "")
+RERANK_ONNX_TOKENIZER = os.getenv("RERANK_ONNX_TOKENIZER", "")  # tokenizer.json of the same model
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+
+class Reranker(ABC):
+    """Scores (query, chunk text) pairs; higher is more relevant. Subclasses implement score()."""
+
+    @abstractmethod
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        """One score per text, in order."""
+
+    def rerank(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        top_k: int,
+        budget_ms: float = RERANK_BUDGET_MS,
+        batch_size: int = RERANK_BATCH_SIZE,
+    ) -> List[Dict[str, Any]]:
+        """
+        The top_k of `results` (retrieval hits, best first) by re-rank score.
+
+        Candidates are scored in batches in retrieval order while the budget lasts (no
+        batch is started once it is spent, not even the first). The scored ones are
+        ranked by score (ties keep retrieval order) in a tier above the unscored ones,
+        which keep their retrieval order. Each returned hit carries the original
+        "retrieval_score"; "score" is the re-rank score, or None for an unscored hit,
+        so the two scales are never mixed.
+        """
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        scores: List[float] = []
+        for start in range(0, len(results), max(1, batch_size)):
+            if time.perf_counter() >= deadline:
+                break
+            batch = results[start:start + batch_size]
+            scores.extend(self.score(query, [r["payload"].get("text", "") for r in batch]))
+        order = sorted(range(len(scores)), key=lambda i: -scores[i])
+        scored = [{**results[i], "score": float(scores[i]), "retrieval_score": results[i]["score"]} for i in order]
+        unscored = [{**r, "score": None, "retrieval_score": r["score"]} for r in results[len(scores):]]
+        return (scored + unscored)[:top_k]
+
+class LexicalOverlapReranker(Reranker):
+    """
+    Fraction of the query's distinct terms found in the chunk, plus a smaller bonus for
+    matching query bigrams in order. Cheap enough to re-rank every candidate.
+    """
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        terms = tokenize(query)
+        unique = set(terms)
+        bigrams = set(zip(terms, terms[1:]))
+        if not unique:
+            return [0.0] * len(texts)
+        out = []
+        for text in texts:
+            tokens = tokenize(text)
+            coverage = len(unique.intersection(tokens)) / len(unique)
+            phrase = len(bigrams.intersection(zip(tokens, tokens[1:]))) / len(bigrams) if bigrams else 0.0
+            out.append(coverage + 0.5 * phrase)
+        return out
+
+class OnnxCrossEncoderReranker(Reranker):
+    """
+    Cross-encoder (e.g. a MiniLM MS MARCO model) exported to ONNX and run on CPU with
+    onnxruntime; the query and chunk are encoded together with the model's Hugging Face
+    tokenizer.json, truncated to max_length tokens. The score is the model's relevance logit.
+    """
+    def __init__(self, model_path: str, tokenizer_path: str, max_length: int = RERANK_MAX_LENGTH) -> None:
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ModuleNotFoundError as exc:
+            raise RuntimeError(
+                "RERANKER=onnx needs onnxruntime and tokenizers. Run: pip install onnxruntime tokenizers"
+            ) from exc
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        if not texts:
+            return []
+        encodings = self.tokenizer.encode_batch([(query, text) for text in texts])
+        feed = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {name: value for name, value in feed.items() if name in self._inputs})[0]
+        # (n, 1) relevance logits, or (n, 2) not-relevant / relevant
+        logits = np.asarray(logits, dtype=np.float32).reshape(len(texts), -1)
+        return logits[:, -1].tolist()
+
+def make_reranker(kind: str) -> Optional[Reranker]:
+    if kind in ("", "none"):
+        return None
+    if kind == "lexical":
+        return LexicalOverlapReranker()
+    if kind == "onnx":
+        if not RERANK_ONNX_MODEL or not RERANK_ONNX_TOKENIZER:
+            raise ValueError("RERANKER=onnx needs RERANK_ONNX_MODEL and RERANK_ONNX_TOKENIZER")
+        return OnnxCrossEncoderReranker(RERANK_ONNX_MODEL, RERANK_ONNX_TOKENIZER)
+    raise ValueError(f"Unknown reranker: {kind}")
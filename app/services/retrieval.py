@@ -0,0 +1,91 @@
+from typing import Any, Dict, List, Optional, Sequence
+import asyncio
+import os
+from app.services.embeddings import EmbeddingService
+from app.services.lexical_index import LexicalIndex
+from app.services.payload_filter import PayloadFilter
+from app.services.reranking import RERANK_CANDIDATES, Reranker
+from app.services.vectorstore import VectorStore
+
+# Reciprocal rank fusion constant and how many candidates each retriever contributes
+# per requested result in hybrid mode.
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[List[Dict[str, Any]]], top_k: int, k: int = HYBRID_RRF_K
+) -> List[Dict[str, Any]]:
+    """
+    Fuse ranked result lists by reciprocal rank: score(d) = sum 1 / (k + rank(d)).
+    Results are matched by "id"; the first list a result appears in supplies its payload.
+    """
+    fused: Dict[str, float] = {}
+    first: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            key = str(result["id"])
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            first.setdefault(key, result)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [{"id": first[key]["id"], "score": fused[key], "payload": first[key]["payload"]} for key in ranked]
+
+async def retrieve(
+    query: str,
+    vs: VectorStore,
+    emb: EmbeddingService,
+    lexical: Optional[LexicalIndex] = None,
+    top_k: int = 5,
+    mode: str = "vector",
+    payload_filter: Optional[PayloadFilter] = None,
+    reranker: Optional[Reranker] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Top_k chunks for a query as [{"id", "score", "payload"}].
+
+    - "vector": dense similarity through VectorStore.search_vector
+    - "lexical": BM25 over the lexical index
+    - "hybrid": both, over-fetched by HYBRID_CANDIDATES and fused by reciprocal rank;
+      the lexical search runs in a worker thread while the query is embedded
+    Without a lexical index every mode falls back to vector search. payload_filter
+    restricts every retriever to matching chunks before its top-k. With a reranker,
+    top_k * RERANK_CANDIDATES chunks are retrieved and the reranker keeps the best top_k
+    within its latency budget.
+    """
+    if reranker is None:
+        return await _retrieve(query, vs, emb, lexical, top_k, mode, payload_filter)
+    candidates = await _retrieve(query, vs, emb, lexical, top_k * RERANK_CANDIDATES, mode, payload_filter)
+    return await asyncio.to_thread(reranker.rerank, query, candidates, top_k)
+
+async def _retrieve(
+    query: str,
+    vs: VectorStore,
+    emb: EmbeddingService,
+    lexical: Optional[LexicalIndex],
+    top_k: int,
+    mode: str,
+    payload_filter: Optional[PayloadFilter],
+) -> List[Dict[str, Any]]:
+    if lexical is not None and mode != "vector" and vs.read_only:
+        # a read-only worker's lexical index follows the writer only through the store's
+        # refresh, which a lexical search alone would never trigger
+        await asyncio.to_thread(vs.refresh)
+    if lexical is None or mode == "vector":
+        query_emb = await emb.aembed_text(query)
+        # Qdrant search is a blocking HTTP call
+        return await asyncio.to_thread(vs.search_vector, query_emb, top_k, payload_filter=payload_filter)
+    if mode == "lexical":
+        return await asyncio.to_thread(lexical.search, query, top_k, payload_filter)
+    if mode != "hybrid":
+        raise ValueError(f"Unknown search mode: {mode}")
+
+    candidates = top_k * HYBRID_CANDIDATES
+    lexical_task = asyncio.create_task(asyncio.to_thread(lexical.search, query, candidates, payload_filter))
+    try:
+        query_emb = await emb.aembed_text(query)
+        dense = await asyncio.to_thread(vs.search_vector, query_emb, candidates, payload_filter=payload_filter)
+    except BaseException:
+        await asyncio.gather(lexical_task, return_exceptions=True)
+        raise
+    return reciprocal_rank_fusion([dense, await lexical_task], top_k)
@@ -1,22 +1,136 @@
-import io
-from typing import Union
+import asyncio
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Union
 from fastapi import UploadFile
-import requests
 import os
+from app.services.http_client import get_session, get_timeout
 
 LLAMA_API_KEY = os.getenv("LLAMA_CLOUD_API_KEY", "")
+LLAMA_PARSE_URL = os.getenv("LLAMA_PARSE_URL", "https://api.llama.cloud/parse")
+# Large PDFs are split into page ranges extracted in parallel worker processes.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+# Uploads are copied to disk in chunks of this many bytes instead of being read whole.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+# Streaming extraction reads TXT files in blocks of about this many characters.
+TEXT_READ_BLOCK = int(os.getenv("TEXT_READ_BLOCK", str(256 * 1024)))
 
-async def extract_text_from_file(file: UploadFile) -> str:
+# Extraction input: raw bytes, or the path of a file spooled to disk (see spool_upload).
+Source = Union[bytes, str]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that already runs threads (uvicorn, asyncio.to_thread) is unsafe
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def shutdown_extraction_pool() -> None:
+    """Stop the PDF extraction worker processes, if started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+def _open_pdf(source: Source):
+    import fitz
+    if isinstance(source, str):
+        # opened by path: PyMuPDF reads pages from the file on demand
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+def _extract_page_range(source: Source, start: int, stop: int) -> List[str]:
+    """Worker entry point: open the PDF and extract pages [start, stop)."""
+    with _open_pdf(source) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def _page_ranges(page_count: int, shards: int) -> List[range]:
+    """Split [0, page_count) into at most `shards` contiguous, near-equal ranges."""
+    shards = max(1, min(shards, page_count))
+    step, extra = divmod(page_count, shards)
+    ranges = []
+    start = 0
+    for i in range(shards):
+        stop = start + step + (1 if i < extra else 0)
+        ranges.append(range(start, stop))
+        start = stop
+    return ranges
+
+def _extract_pdf_pages(doc, source: Source) -> List[str]:
+    """Extract all pages, sharding page ranges across the process pool for large documents."""
+    page_count = doc.page_count
+    if PDF_EXTRACT_WORKERS <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        return [page.get_text() for page in doc]
+    ranges = _page_ranges(page_count, PDF_EXTRACT_WORKERS)
+    pool = _get_pool()
+    # workers given a path open the spooled file themselves; only bytes sources are pickled
+    futures = [pool.submit(_extract_page_range, source, r.start, r.stop) for r in ranges]
+    pages: List[str] = []
+    # futures are in page order, so concatenating their results reassembles the document
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+def _llama_parse(source: Source) -> str:
+    """Send a PDF to the llama-parse HTTP API over the shared pooled session."""
+    if isinstance(source, str):
+        with open(source, "rb") as fh:
+            return _llama_parse_upload(fh)
+    return _llama_parse_upload(source)
+
+def _llama_parse_upload(content) -> str:
+    resp = get_session().post(
+        LLAMA_PARSE_URL,
+        headers={"Authorization": f"Bearer {LLAMA_API_KEY}"},
+        files={"file": ("upload.pdf", content)},
+        timeout=get_timeout("parse"),
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("text", "")
+
+async def spool_upload(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Copy an upload to a temporary file chunk by chunk and return its path, so the
+    whole upload is never held in memory. The caller is responsible for deleting it.
     """
-    Extract text from an uploaded PDF or TXT file.
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def extract_pages(source: Source, content_type: str) -> List[str]:
+    """
+    Extract text from PDF or TXT content, one string per page (a TXT file is a single page).
+    `source` is either the raw bytes or the path of a spooled upload.
 
     - Uses PyMuPDF (pymupdf) for PDFs if available (lazy import).
     - Falls back to llama-parse HTTP API if pymupdf is not installed and LLAMA_API_KEY is set.
     - Raises RuntimeError with actionable message if neither option is available.
     """
-    content = await file.read()
-    if file.content_type == "text/plain":
-        return content.decode(errors="ignore")
+    if content_type == "text/plain":
+        if isinstance(source, str):
+            with open(source, "r", encoding="utf-8", errors="ignore") as fh:
+                return [fh.read()]
+        return [source.decode(errors="ignore")]
 
     # Lazy import PyMuPDF to avoid import-time failures if it's not installed.
     try:
@@ -28,32 +142,106 @@ async def extract_text_from_file(file: UploadFile) -> str:
                 "PyMuPDF (pymupdf) is required to parse PDFs but is not installed. "
                 "Install it with: pip install pymupdf"
             )
-        resp = requests.post(
-            "https://api.llama.cloud/parse",
-            headers={"Authorization": f"Bearer {LLAMA_API_KEY}"},
-            files={"file": ("upload.pdf", content)},
-            timeout=30,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("text", "")
+        return [_llama_parse(source)]
 
     # Use PyMuPDF to parse PDF
     try:
-        pdf_stream = io.BytesIO(content)
-        doc = fitz.open(stream=pdf_stream.read(), filetype="pdf")
-        text_chunks = [page.get_text() for page in doc]
-        return "\n".join(text_chunks)
+        with _open_pdf(source) as doc:
+            return _extract_pdf_pages(doc, source)
     except Exception as exc:
         # If PyMuPDF fails for this PDF, attempt llama-parse if available.
         if LLAMA_API_KEY:
-            resp = requests.post(
-                "https://api.llama.cloud/parse",
-                headers={"Authorization": f"Bearer {LLAMA_API_KEY}"},
-                files={"file": ("upload.pdf", content)},
-                timeout=30,
+            return [_llama_parse(source)]
+        raise RuntimeError(f"Failed to extract PDF text: {exc}") from exc
+
+def _iter_pdf_pages(doc, source: Source) -> Iterator[str]:
+    """_extract_pdf_pages yielding pages as they are extracted (shard by shard in parallel mode)."""
+    page_count = doc.page_count
+    if PDF_EXTRACT_WORKERS <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for page in doc:
+            yield page.get_text()
+        return
+    ranges = _page_ranges(page_count, PDF_EXTRACT_WORKERS)
+    pool = _get_pool()
+    futures = [pool.submit(_extract_page_range, source, r.start, r.stop) for r in ranges]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # the consumer stopped early: shards that have not started are not needed
+        for future in futures:
+            future.cancel()
+
+def _iter_text_blocks(source: Source) -> Iterator[str]:
+    """
+    A TXT file in blocks of whole lines; "\n".join(blocks) gives back the text (up to
+    a trailing newline), which is how the streaming chunkers join their parts.
+    """
+    if not isinstance(source, str):
+        yield source.decode(errors="ignore")
+        return
+    with open(source, "r", encoding="utf-8", errors="ignore") as fh:
+        block: List[str] = []
+        size = 0
+        for line in fh:
+            block.append(line)
+            size += len(line)
+            if size >= TEXT_READ_BLOCK:
+                yield "".join(block)[:-1] if line.endswith("\n") else "".join(block)
+                block = []
+                size = 0
+        if block:
+            text = "".join(block)
+            yield text[:-1] if text.endswith("\n") else text
+
+def iter_pages(
+    source: Source, content_type: str, on_page: Optional[Callable[[int], None]] = None
+) -> Iterator[str]:
+    """
+    Streaming extract_pages for the chunk_document streaming variants: PDF pages are
+    yielded as they are extracted and TXT files in blocks of lines, so chunking and
+    embedding start before the whole document is in memory. on_page receives the number
+    of pages extracted so far (a TXT file counts as one page). The llama-parse fallback
+    returns the document as a single part.
+    """
+    if content_type == "text/plain":
+        yield from _iter_text_blocks(source)
+        if on_page is not None:
+            on_page(1)
+        return
+    try:
+        import fitz  # noqa: F401
+        doc = _open_pdf(source)
+    except ModuleNotFoundError:
+        if not LLAMA_API_KEY:
+            raise RuntimeError(
+                "PyMuPDF (pymupdf) is required to parse PDFs but is not installed. "
+                "Install it with: pip install pymupdf"
             )
-            resp.raise_for_status()
-            data = resp.json()
-            return data.get("text", "")
-        raise RuntimeError(f"Failed to extract PDF text: {exc}") from exc
\ No newline at end of file
+        doc = None
+    except Exception as exc:
+        if not LLAMA_API_KEY:
+            raise RuntimeError(f"Failed to extract PDF text: {exc}") from exc
+        doc = None
+    if doc is None:
+        yield _llama_parse(source)
+        if on_page is not None:
+            on_page(1)
+        return
+    with doc:
+        for done, page in enumerate(_iter_pdf_pages(doc, source), start=1):
+            if on_page is not None:
+                on_page(done)
+            yield page
+
+async def extract_text_from_file(file: UploadFile) -> str:
+    """
+    Extract text from an uploaded PDF or TXT file (see extract_pages) off the event loop.
+    The upload is spooled to a temporary file first and parsed from disk.
+    """
+    path = await spool_upload(file)
+    try:
+        pages = await asyncio.to_thread(extract_pages, path, file.content_type)
+    finally:
+        os.remove(path)
+    return "\n".join(pages)
@@ -0,0 +1,234 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import fcntl
+import json
+import os
+import numpy as np
+
+_META = "meta.json"
+_LOCK = "write.lock"
+_APPEND_LOGS = ("records", "tombstones", "payloads")
+# bytes read at a time when scanning a log backwards for its last complete line
+_TAIL_BLOCK = 65536
+
+def _record(vec_id: str, payload: Any) -> bytes:
+    """A records line; payload is a dict or the raw JSON bytes read back from a log."""
+    if not isinstance(payload, bytes):
+        payload = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return vec_id.encode("utf-8") + b"\t" + payload + b"\n"
+
+def decode_payload(payload: Any) -> Dict[str, Any]:
+    return json.loads(payload) if isinstance(payload, bytes) else payload
+
+class VectorLog:
+    """
+    On-disk format of a persistent SimpleVectorStore, one directory per store.
+
+    Generation g is a snapshot plus an append log:
+      vectors-g.f32     float32 rows, memory-mapped (preallocated past the last row)
+      records-g.tsv     one `id<TAB>payload JSON` line per row, in row order
+      tombstones-g.log  one deleted id per line
+      payloads-g.log    one `id<TAB>payload JSON` line per payload update, replacing the row's payload
+    meta.json names the current generation and the dimension; compaction writes
+    generation g+1 with only live rows and swaps meta.json atomically.
+
+    A row exists once its record line is complete: vectors are written before the
+    record is appended, so readers (other worker processes mapping the same files
+    read-only through the page cache) never see a record without its vector. One
+    process at a time may open the log for writing: it holds an exclusive lock on
+    write.lock, and a log opened for writing while another process holds the lock
+    (the other workers of `uvicorn --workers N`) falls back to read-only. Upserts,
+    deletes and payload updates therefore only succeed in the one writer process.
+
+    Each append is fsynced before it returns. A writer that crashed mid-append leaves a
+    partial last line, which readers skip; the next writer truncates it on open, so
+    its own appends start on a line boundary.
+    """
+    def __init__(self, path: str, read_only: bool = False) -> None:
+        self.path = path
+        self.read_only = read_only
+        self.dim: Optional[int] = None
+        self.generation = 0
+        self._records_offset = 0
+        self._tombstones_offset = 0
+        self._payloads_offset = 0
+        self._lock_fh = None
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+            self._lock_fh = open(os.path.join(path, _LOCK), "a")
+            try:
+                fcntl.flock(self._lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # another process is the writer; follow its log instead
+                self._lock_fh.close()
+                self._lock_fh = None
+                self.read_only = True
+        self._read_meta()
+        if not self.read_only:
+            for kind in _APPEND_LOGS:
+                self._truncate_partial_line(kind)
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> str:
+        suffix = {"vectors": "f32", "records": "tsv", "tombstones": "log", "payloads": "log"}[kind]
+        return os.path.join(self.path, f"{kind}-{self.generation if generation is None else generation}.{suffix}")
+
+    def _read_meta(self) -> None:
+        try:
+            with open(os.path.join(self.path, _META)) as fh:
+                meta = json.load(fh)
+        except FileNotFoundError:
+            return
+        self.dim = meta["dim"]
+        self.generation = meta["generation"]
+
+    def _write_meta(self, generation: int) -> None:
+        tmp = os.path.join(self.path, _META + ".tmp")
+        with open(tmp, "w") as fh:
+            json.dump({"dim": self.dim, "generation": generation}, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, os.path.join(self.path, _META))
+
+    def generation_changed(self) -> bool:
+        """True when another process compacted the store into a new generation."""
+        current = self.generation
+        self._read_meta()
+        changed = self.generation != current
+        self.generation = current
+        return changed
+
+    def load(self) -> Tuple[List[str], List[bytes], List[str], List[Tuple[str, bytes]]]:
+        """
+        Read the current generation from the start: (ids, payloads, tombstoned ids,
+        (id, payload) updates). Payloads are returned as raw JSON bytes; decode them with
+        decode_payload() when used.
+        """
+        self._read_meta()
+        self._records_offset = 0
+        self._tombstones_offset = 0
+        self._payloads_offset = 0
+        return self.read_new()
+
+    def read_new(self) -> Tuple[List[str], List[bytes], List[str], List[Tuple[str, bytes]]]:
+        """Records, tombstones and payload updates appended since the last load() / read_new()."""
+        ids: List[str] = []
+        payloads: List[bytes] = []
+        for line in self._read_lines("records"):
+            vec_id, payload = line.split(b"\t", 1)
+            ids.append(vec_id.decode("utf-8"))
+            payloads.append(payload)
+        tombstones = [line.decode("utf-8") for line in self._read_lines("tombstones")]
+        updates = []
+        for line in self._read_lines("payloads"):
+            vec_id, payload = line.split(b"\t", 1)
+            updates.append((vec_id.decode("utf-8"), payload))
+        return ids, payloads, tombstones, updates
+
+    def _read_lines(self, kind: str) -> List[bytes]:
+        offset_attr = f"_{kind}_offset"
+        try:
+            with open(self._file(kind), "rb") as fh:
+                fh.seek(getattr(self, offset_attr))
+                data = fh.read()
+        except FileNotFoundError:
+            return []
+        # a trailing partial line is still being written; pick it up next time
+        end = data.rfind(b"\n") + 1
+        setattr(self, offset_attr, getattr(self, offset_attr) + end)
+        return data[:end].splitlines()
+
+    def _truncate_partial_line(self, kind: str) -> None:
+        """Drop a partial last line left by a writer that crashed mid-append."""
+        try:
+            fh = open(self._file(kind), "r+b")
+        except FileNotFoundError:
+            return
+        with fh:
+            size = end = os.fstat(fh.fileno()).st_size
+            while end > 0:
+                start = max(0, end - _TAIL_BLOCK)
+                fh.seek(start)
+                newline = fh.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                fh.truncate(end)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+    def map_vectors(self, rows: int) -> Optional[np.ndarray]:
+        """
+        Map the vector file. Writers extend it to `rows` rows first; readers map what
+        exists (at least `rows` rows once the matching records are visible).
+        """
+        if self.dim is None:
+            return None
+        path = self._file("vectors")
+        if not self.read_only:
+            if not os.path.exists(path):
+                open(path, "wb").close()
+            with open(path, "r+b") as fh:
+                if os.fstat(fh.fileno()).st_size < rows * self.dim * 4:
+                    fh.truncate(rows * self.dim * 4)
+        available = os.path.getsize(path) // (self.dim * 4) if os.path.exists(path) else 0
+        if available == 0:
+            return None
+        mode = "r" if self.read_only else "r+"
+        return np.memmap(path, dtype=np.float32, mode=mode, shape=(available, self.dim))
+
+    def init_dim(self, dim: int) -> None:
+        if self.dim is None:
+            self.dim = dim
+            self._write_meta(self.generation)
+
+    def append_records(self, ids: Sequence[str], payloads: Sequence[Dict[str, Any]]) -> None:
+        self._append("records", b"".join(_record(vec_id, payload) for vec_id, payload in zip(ids, payloads)))
+
+    def append_tombstones(self, ids: Sequence[str]) -> None:
+        self._append("tombstones", "".join(f"{vec_id}\n" for vec_id in ids).encode("utf-8"))
+
+    def append_payloads(self, ids: Sequence[str], payloads: Sequence[Dict[str, Any]]) -> None:
+        self._append("payloads", b"".join(_record(vec_id, payload) for vec_id, payload in zip(ids, payloads)))
+
+    def _append(self, kind: str, data: bytes) -> None:
+        # one write per batch, so readers see whole lines or nothing new
+        with open(self._file(kind), "ab") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def write_generation(self, blocks: Iterable[np.ndarray], ids: Sequence[str], payloads: Sequence[Any]) -> None:
+        """
+        Snapshot live rows as the next generation, switch to it and drop the old files.
+        The vectors come in blocks of rows, so the caller never materializes them all at once.
+        """
+        old = self.generation
+        new = old + 1
+        vectors_path = self._file("vectors", new)
+        with open(vectors_path, "wb") as fh:
+            for block in blocks:
+                np.ascontiguousarray(block, dtype=np.float32).tofile(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        with open(self._file("records", new), "wb") as fh:
+            for vec_id, payload in zip(ids, payloads):
+                fh.write(_record(vec_id, payload))
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._write_meta(new)
+        self.generation = new
+        self._records_offset = os.path.getsize(self._file("records"))
+        self._tombstones_offset = 0
+        self._payloads_offset = 0
+        for kind in ("vectors", "records", "tombstones", "payloads"):
+            try:
+                # readers that still map the old vector file keep their pages until they reload
+                os.remove(self._file(kind, old))
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        if self._lock_fh is not None:
+            self._lock_fh.close()
+            self._lock_fh = None
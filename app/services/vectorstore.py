@@ -1,34 +1,599 @@
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
 import os
+import tempfile
+import threading
+import time
 import uuid
+import numpy as np
+from app.services.ann_index import LOCAL_ANN_INDEX, IVFIndex
+from app.services.payload_filter import LOCAL_PAYLOAD_INDEX_FIELDS, PayloadFilter, PayloadIndex
+from app.services.quantization import LOCAL_QUANTIZATION, Quantizer, make_quantizer
+from app.services.vector_log import VectorLog, decode_payload
 
 USE_QDRANT = os.getenv("USE_QDRANT", "false").lower() in ("1", "true", "yes")
 QDRANT_URL = os.getenv("QDRANT_URL", "")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "documents")
 EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
+QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+QDRANT_UPSERT_PARALLEL = int(os.getenv("QDRANT_UPSERT_PARALLEL", "1"))
+# Where a quantized in-memory store keeps its float32 vectors (memory-mapped, re-rank only).
+LOCAL_VECTOR_SPILL_DIR = os.getenv("LOCAL_VECTOR_SPILL_DIR", "") or None
+# Directory of a persistent in-memory store (see VectorLog); unset = lives only in the heap.
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "") or None
+# Read-only workers map the files written by a single writer process and follow its log.
+# Without it the first process to open the store becomes the writer and the others
+# fall back to read-only (see VectorLog).
+LOCAL_VECTOR_STORE_READONLY = os.getenv("LOCAL_VECTOR_STORE_READONLY", "false").lower() in ("1", "true", "yes")
+LOCAL_VECTOR_STORE_REFRESH_SECONDS = float(os.getenv("LOCAL_VECTOR_STORE_REFRESH_SECONDS", "1.0"))
+# Compact into a new generation once this fraction of stored rows is tombstoned.
+LOCAL_VECTOR_STORE_COMPACT_RATIO = float(os.getenv("LOCAL_VECTOR_STORE_COMPACT_RATIO", "0.25"))
+# Rows copied per slice when compaction writes the live rows to a new generation.
+LOCAL_VECTOR_STORE_COMPACT_BLOCK_ROWS = int(os.getenv("LOCAL_VECTOR_STORE_COMPACT_BLOCK_ROWS", "65536"))
+# Rows scored per matrix-matrix product in multi-query search.
+SEARCH_BATCH_BLOCK_ROWS = int(os.getenv("SEARCH_BATCH_BLOCK_ROWS", "16384"))
+# Quantization of new Qdrant collections: "none", "int8" (scalar) or "pq" (product).
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_PQ_COMPRESSION = os.getenv("QDRANT_PQ_COMPRESSION", "x16")
+QDRANT_RESCORE_OVERSAMPLING = float(os.getenv("QDRANT_RESCORE_OVERSAMPLING", "2.0"))
+# Payload indexes created on the Qdrant collection, as "field:schema" (keyword, integer, float, ...).
+QDRANT_PAYLOAD_INDEXES = [
+    f.strip() for f in os.getenv("QDRANT_PAYLOAD_INDEXES", "file_name:keyword,file_names:keyword").split(",") if f.strip()
+]
 
 class SimpleVectorStore:
-    """In-memory vector store for local development / tests."""
-    def __init__(self) -> None:
-        self._store: Dict[str, Dict[str, Any]] = {}
+    """
+    In-memory vector store for local development / tests.
+
+    Vectors are L2-normalized on insert and kept in one contiguous float32 matrix
+    that grows geometrically; ids and payloads live in side tables indexed by row.
+    Search is a single matrix-vector product (cosine similarity) plus argpartition.
+    With index="ivf" (LOCAL_ANN_INDEX) an IVFIndex restricts that product to the rows
+    of the query's nearest clusters once enough vectors are stored.
+
+    With quantization="int8" or "pq" (LOCAL_QUANTIZATION) search scans compact codes
+    held in RAM and re-ranks the best top_k * rerank_factor candidates with the
+    float32 vectors, which then live in a memory-mapped file under
+    LOCAL_VECTOR_SPILL_DIR instead of the heap.
+
+    With a path (LOCAL_VECTOR_STORE_PATH) the matrix is a memory-mapped file in that
+    directory and every upsert / delete is appended to a VectorLog, so a restart maps
+    the files instead of re-ingesting. Deletes become tombstones, compacted into a new
+    generation past LOCAL_VECTOR_STORE_COMPACT_RATIO. Only one process writes: the
+    other workers open the store read-only, share the writer's pages and pick up its
+    appends every LOCAL_VECTOR_STORE_REFRESH_SECONDS. The ANN index and quantized codes are rebuilt
+    from the mapped vectors at load. Indexes kept outside the store (BM25) follow the
+    writer through on_refresh(), as of the last refresh().
+
+    search_vector(payload_filter=...) restricts the search to matching payloads before
+    top-k. Fields in LOCAL_PAYLOAD_INDEX_FIELDS are served by a PayloadIndex built on
+    the first filtered search and maintained on upsert / delete from then on.
+    """
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        initial_capacity: int = 1024,
+        index: str = LOCAL_ANN_INDEX,
+        quantization: str = LOCAL_QUANTIZATION,
+        path: Optional[str] = LOCAL_VECTOR_STORE_PATH,
+        read_only: bool = LOCAL_VECTOR_STORE_READONLY,
+    ) -> None:
+        self.dim = dim
+        self._initial_capacity = max(1, initial_capacity)
+        self._capacity = self._initial_capacity
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        # persistent stores keep payloads read back from disk as raw JSON until returned
+        self._payloads: List[Any] = []
+        self._index_kind = index
+        self._quantization_kind = quantization
+        self._ann: Optional[IVFIndex] = IVFIndex() if index == "ivf" else None
+        self._quantizer: Optional[Quantizer] = make_quantizer(quantization)
+        self._spill_path: Optional[str] = None
+        self._payload_index: Optional[PayloadIndex] = None
+        # persistent stores only: row of each live id, tombstoned rows
+        self._log: Optional[VectorLog] = None
+        self._row_of: Dict[str, int] = {}
+        self._dead: Set[int] = set()
+        self._dead_rows: Optional[np.ndarray] = None
+        self._refreshed_at = 0.0
+        self._listeners: List[Callable[[List[Tuple[str, Dict[str, Any]]], List[str], bool], None]] = []
+        self._lock = threading.RLock()
+        if dim is not None:
+            self._check_dim(dim)
+        if path:
+            self._log = VectorLog(path, read_only=read_only)
+            self._load()
+
+    def __len__(self) -> int:
+        return self._size - len(self._dead)
+
+    @property
+    def read_only(self) -> bool:
+        """True for a persistent store opened (or fallen back to) read-only; writes raise."""
+        return self._log is not None and self._log.read_only
+
+    def on_refresh(self, listener: Callable[[List[Tuple[str, Dict[str, Any]]], List[str], bool], None]) -> None:
+        """
+        Read-only stores: call listener(added, removed, reset) with what each refresh
+        picked up from the writer — (id, payload) of new rows and payload updates, and
+        tombstoned ids. After the writer compacted, reset is True and added holds every
+        live row. Listeners run under the store lock, so they see changes in log order.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, added: List[Tuple[str, Dict[str, Any]]], removed: List[str], reset: bool = False) -> None:
+        for listener in self._listeners:
+            listener(added, removed, reset)
+
+    def _ensure_capacity(self, extra: int) -> None:
+        """Allocate or grow the backing matrix so that `extra` more rows fit."""
+        needed = self._size + extra
+        if self._matrix is None:
+            self._capacity = max(self._capacity, needed)
+            self._matrix = self._allocate(self._capacity)
+            return
+        if needed <= self._capacity:
+            return
+        new_capacity = self._capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        if self._spill_path is not None or self._log is not None:
+            # the file is extended in place, existing rows stay where they are
+            self._matrix = self._allocate(new_capacity)
+        else:
+            grown = self._allocate(new_capacity)
+            grown[: self._size] = self._matrix[: self._size]
+            self._matrix = grown
+        self._capacity = new_capacity
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self._log is not None:
+            self._log.init_dim(self.dim)
+            return self._log.map_vectors(capacity)
+        if self._quantizer is None:
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+        if self._spill_path is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix="vectors-", suffix=".f32", dir=LOCAL_VECTOR_SPILL_DIR)
+            os.close(fd)
+        with open(self._spill_path, "r+b") as fh:
+            fh.truncate(capacity * self.dim * 4)
+        return np.memmap(self._spill_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _as_unit_rows(self, vectors: Any) -> np.ndarray:
+        """Convert vectors to a 2-D float32 array of unit-length rows."""
+        arr = np.asarray(vectors, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if self.dim is None:
+            self._check_dim(int(arr.shape[1]))
+            self.dim = int(arr.shape[1])
+        if arr.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {arr.shape[1]}")
+        norms = np.linalg.norm(arr, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return arr / norms
+
+    def _check_dim(self, dim: int) -> None:
+        """Refuse a dimension the quantizer cannot encode (PQ_SUBVECTORS) before any row is written."""
+        if self._quantizer is not None:
+            self._quantizer.check_dim(dim)
 
     def upsert_vector(self, vector: List[float], payload: Dict[str, Any]) -> str:
-        vec_id = str(uuid.uuid4())
-        self._store[vec_id] = {"vector": vector, "payload": payload}
-        return vec_id
+        return self.upsert_vectors([vector], [payload])[0]
 
-    def search_vector(self, vector: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        # Very simple placeholder ranking: return last inserted items
-        out = []
-        items = list(self._store.items())[-top_k:]
-        for vid, data in items:
-            out.append({"id": vid, "score": 1.0, "payload": data["payload"]})
-        return out
+    def upsert_vectors(self, vectors: Sequence[List[float]], payloads: Sequence[Dict[str, Any]]) -> List[str]:
+        """Append many vectors in one vectorized normalize + slice copy."""
+        if len(vectors) != len(payloads):
+            raise ValueError("vectors and payloads must have the same length")
+        if len(vectors) == 0:
+            return []
+        if self._log is not None and self._log.read_only:
+            raise RuntimeError("Vector store is read-only")
+        with self._lock:
+            rows = self._as_unit_rows(vectors)
+            self._ensure_capacity(len(rows))
+            ids = [str(uuid.uuid4()) for _ in range(len(rows))]
+            self._matrix[self._size : self._size + len(rows)] = rows
+            self._ids.extend(ids)
+            self._payloads.extend(payloads)
+            if self._payload_index is not None:
+                self._payload_index.add(payloads, self._size)
+            if self._log is not None:
+                # the record makes the rows visible to readers, so it goes after the vectors,
+                # and the vectors reach the disk before the (fsynced) record does
+                self._matrix.flush()
+                self._log.append_records(ids, payloads)
+                self._row_of.update((vec_id, self._size + i) for i, vec_id in enumerate(ids))
+            self._size += len(rows)
+            if self._ann is not None:
+                self._ann.add(self._matrix, self._size - len(rows), self._size)
+            if self._quantizer is not None:
+                self._quantizer.add(self._matrix, self._size - len(rows), self._size)
+        return ids
+
+    def delete_vectors(self, ids: Sequence[str]) -> int:
+        """Remove vectors by id, compacting the matrix in place; returns how many were removed."""
+        doomed = set(map(str, ids))
+        if self._log is not None:
+            return self._tombstone(doomed)
+        with self._lock:
+            keep = [i for i, vec_id in enumerate(self._ids) if vec_id not in doomed]
+            removed = self._size - len(keep)
+            if removed:
+                # in place a slice at a time: keep is ascending, so keep[i] >= i and no
+                # slice overwrites a row a later slice still reads
+                step = LOCAL_VECTOR_STORE_COMPACT_BLOCK_ROWS
+                for start in range(0, len(keep), step):
+                    end = min(start + step, len(keep))
+                    self._matrix[start:end] = self._matrix[keep[start:end]]
+                self._ids = [self._ids[i] for i in keep]
+                self._payloads = [self._payloads[i] for i in keep]
+                if self._ann is not None:
+                    self._ann.remap(np.asarray(keep, dtype=np.int64), self._size)
+                if self._quantizer is not None:
+                    self._quantizer.remap(np.asarray(keep, dtype=np.int64))
+                if self._payload_index is not None:
+                    self._payload_index.remap(np.asarray(keep, dtype=np.int64), self._size)
+                self._size = len(keep)
+        return removed
+
+    def _rows_of(self, ids: Sequence[str]) -> Dict[str, int]:
+        if self._log is not None:
+            return {vec_id: self._row_of[vec_id] for vec_id in ids if vec_id in self._row_of}
+        wanted = set(ids)
+        return {vec_id: row for row, vec_id in enumerate(self._ids) if vec_id in wanted}
+
+    def get_payloads(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Payloads of the given ids that are stored; missing ids are left out."""
+        self.refresh()
+        with self._lock:
+            rows = self._rows_of([str(vec_id) for vec_id in ids])
+            return {vec_id: decode_payload(self._payloads[row]) for vec_id, row in rows.items()}
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, List[float]]:
+        """Stored (unit-length) vectors of the given ids; missing ids are left out."""
+        self.refresh()
+        with self._lock:
+            rows = self._rows_of([str(vec_id) for vec_id in ids])
+            return {vec_id: self._matrix[row].tolist() for vec_id, row in rows.items()}
+
+    def update_payloads(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Merge fields into the payloads of stored vectors ({id: fields}, like Qdrant's
+        set_payload); returns how many were updated. Missing ids are skipped.
+        """
+        if self._log is not None and self._log.read_only:
+            raise RuntimeError("Vector store is read-only")
+        with self._lock:
+            rows = self._rows_of([str(vec_id) for vec_id in updates])
+            if not rows:
+                return 0
+            payloads = []
+            for vec_id, row in rows.items():
+                self._payloads[row] = {**decode_payload(self._payloads[row]), **updates[vec_id]}
+                payloads.append(self._payloads[row])
+            if self._log is not None:
+                self._log.append_payloads(list(rows), payloads)
+            # rebuilt from the current payloads on the next filtered search
+            self._payload_index = None
+        return len(rows)
+
+    def search_vector(
+        self,
+        vector: List[float],
+        top_k: int = 5,
+        n_probe: Optional[int] = None,
+        exact: bool = False,
+        payload_filter: Optional[PayloadFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top_k rows by cosine similarity. With a trained ANN index only the rows of the
+        n_probe nearest clusters are scored, and with a trained quantizer they are scored
+        on codes first and only a shortlist on float32 vectors, unless exact=True.
+        With payload_filter only matching rows compete for the top_k slots; a selective
+        filter is served by scoring just its rows.
+        """
+        self.refresh()
+        if self._size == 0 or top_k <= 0:
+            return []
+        query = self._as_unit_rows(vector)[0]
+        with self._lock:
+            rows = None if exact or self._ann is None else self._ann.candidates(query, n_probe)
+            if payload_filter:
+                mask = self._filter_mask(payload_filter)
+                allowed = np.flatnonzero(mask)
+                if len(allowed) == 0:
+                    return []
+                if rows is not None:
+                    # keep the ANN candidates that pass, unless that leaves too few
+                    passing = rows[mask[rows]]
+                    rows = passing if len(passing) >= top_k and len(passing) < len(allowed) else allowed
+                else:
+                    rows = allowed
+            if not exact and self._quantizer is not None and self._quantizer.ready():
+                rows = self._shortlist(query, rows, top_k * self._quantizer.rerank_factor)
+            if rows is None:
+                scores = self._matrix[: self._size] @ query
+            else:
+                scores = self._matrix[rows] @ query
+            self._mask_dead(scores, rows)
+            ids = self._ids
+            payloads = self._payloads
+        if self._dead:
+            live = np.flatnonzero(scores > -np.inf)
+            scores = scores[live]
+            rows = live if rows is None else rows[live]
+        size = len(scores)
+        k = min(top_k, size)
+        if k == 0:
+            return []
+        if k < size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if rows is not None:
+            return [
+                {"id": ids[rows[i]], "score": float(scores[i]), "payload": decode_payload(payloads[rows[i]])}
+                for i in top
+            ]
+        return [
+            {"id": ids[i], "score": float(scores[i]), "payload": decode_payload(payloads[i])}
+            for i in top
+        ]
+
+    def search_vectors(
+        self,
+        vectors: Sequence[List[float]],
+        top_k: int = 5,
+        n_probe: Optional[int] = None,
+        exact: bool = False,
+        payload_filter: Optional[PayloadFilter] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        search_vector for many queries at once. Exact search runs as blocked
+        matrix-matrix products keeping a running top_k per query; with a trained ANN
+        index or quantizer (and exact=False) each query takes the approximate path.
+        """
+        self.refresh()
+        if len(vectors) == 0:
+            return []
+        if self._size == 0 or top_k <= 0:
+            return [[] for _ in range(len(vectors))]
+        queries = self._as_unit_rows(vectors)
+        with self._lock:
+            approximate = (self._ann is not None and self._ann.trained) or (
+                self._quantizer is not None and self._quantizer.ready()
+            )
+        if approximate and not exact:
+            return [self.search_vector(q, top_k, n_probe=n_probe, payload_filter=payload_filter) for q in queries]
+
+        with self._lock:
+            size = self._size
+            # rows no query may return: filtered out or tombstoned
+            excluded = None
+            if payload_filter:
+                excluded = ~self._filter_mask(payload_filter)
+            if self._dead:
+                if excluded is None:
+                    excluded = np.zeros(size, dtype=bool)
+                excluded[[row for row in self._dead if row < size]] = True
+            k = min(top_k, size)
+            best_scores = np.empty((len(queries), 0), dtype=np.float32)
+            best_rows = np.empty((len(queries), 0), dtype=np.int64)
+            for start in range(0, size, SEARCH_BATCH_BLOCK_ROWS):
+                end = min(size, start + SEARCH_BATCH_BLOCK_ROWS)
+                block = queries @ self._matrix[start:end].T  # (queries, rows)
+                if excluded is not None:
+                    block[:, excluded[start:end]] = -np.inf
+                scores = np.concatenate([best_scores, block], axis=1)
+                rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), block.shape)], axis=1)
+                if scores.shape[1] > k:
+                    keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                    scores = np.take_along_axis(scores, keep, axis=1)
+                    rows = np.take_along_axis(rows, keep, axis=1)
+                best_scores, best_rows = scores, rows
+            ids = self._ids
+            payloads = self._payloads
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return [
+            [
+                {"id": ids[r], "score": float(s), "payload": decode_payload(payloads[r])}
+                for s, r in zip(best_scores[q, order[q]], best_rows[q, order[q]])
+                if s > -np.inf
+            ]
+            for q in range(len(queries))
+        ]
+
+    def _shortlist(self, query: np.ndarray, rows: Optional[np.ndarray], n: int) -> np.ndarray:
+        """The n rows (of `rows`, or of all rows) with the best quantized scores, ascending."""
+        approx = self._quantizer.scores(query, rows, self._size)
+        self._mask_dead(approx, rows)
+        if n < len(approx):
+            best = np.argpartition(-approx, n - 1)[:n]
+        else:
+            best = np.arange(len(approx))
+        # ascending row order keeps memory-mapped reads sequential
+        return np.sort(best if rows is None else rows[best])
+
+    def _filter_mask(self, payload_filter: PayloadFilter) -> np.ndarray:
+        if self._payload_index is None:
+            self._payload_index = PayloadIndex(LOCAL_PAYLOAD_INDEX_FIELDS)
+            self._payload_index.add(self._payloads[: self._size], 0)
+        return self._payload_index.mask(payload_filter, self._size, self._payloads)
+
+    def _mask_dead(self, scores: np.ndarray, rows: Optional[np.ndarray]) -> None:
+        """Set the scores of tombstoned rows to -inf."""
+        if not self._dead:
+            return
+        if self._dead_rows is None:
+            self._dead_rows = np.fromiter(self._dead, dtype=np.int64, count=len(self._dead))
+        if rows is None:
+            scores[self._dead_rows[self._dead_rows < len(scores)]] = -np.inf
+        else:
+            scores[np.isin(rows, self._dead_rows)] = -np.inf
+
+    def _load(self) -> None:
+        """(Re)build the store from the current generation of its VectorLog."""
+        with self._lock:
+            ids, payloads, tombstones, updates = self._log.load()
+            if self._log.dim is not None:
+                if self.dim is not None and self.dim != self._log.dim:
+                    raise ValueError(f"Expected vectors of dimension {self.dim}, store has {self._log.dim}")
+                self.dim = self._log.dim
+            self._matrix = self._log.map_vectors(len(ids))
+            self._capacity = len(self._matrix) if self._matrix is not None else self._initial_capacity
+            self._size = min(len(ids), self._capacity if self._matrix is not None else 0)
+            self._ids = ids[: self._size]
+            self._payloads = payloads[: self._size]
+            self._row_of = {vec_id: row for row, vec_id in enumerate(self._ids)}
+            self._dead = set()
+            self._dead_rows = None
+            self._ann = IVFIndex() if self._index_kind == "ivf" else None
+            self._quantizer = make_quantizer(self._quantization_kind)
+            if self.dim is not None:
+                self._check_dim(self.dim)
+            self._payload_index = None
+            if self._size:
+                if self._ann is not None:
+                    self._ann.add(self._matrix, 0, self._size)
+                if self._quantizer is not None:
+                    self._quantizer.add(self._matrix, 0, self._size)
+            self._mark_dead(tombstones)
+            self._apply_payloads(updates)
+            self._refreshed_at = time.monotonic()
+
+    def refresh(self) -> None:
+        """
+        Read-only stores: pick up rows and tombstones the writer appended since the last
+        look, at most once every LOCAL_VECTOR_STORE_REFRESH_SECONDS. Searches call it
+        themselves; callers reading an index kept in step through on_refresh() (BM25)
+        without searching the store call it first. A no-op for other stores.
+        """
+        if not self.read_only or time.monotonic() - self._refreshed_at < LOCAL_VECTOR_STORE_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if self._log.generation_changed():
+                self._load()
+                if self._listeners:
+                    live = [(vec_id, decode_payload(self._payloads[row])) for vec_id, row in self._row_of.items()]
+                    self._notify(live, [], reset=True)
+                return
+            ids, payloads, tombstones, updates = self._log.read_new()
+            if ids:
+                if self.dim is None:
+                    self._check_dim(self._log.dim)
+                    self.dim = self._log.dim
+                start = self._size
+                self._matrix = self._log.map_vectors(start + len(ids))
+                self._capacity = len(self._matrix)
+                self._ids.extend(ids)
+                self._payloads.extend(payloads)
+                self._row_of.update((vec_id, start + i) for i, vec_id in enumerate(ids))
+                self._size += len(ids)
+                if self._ann is not None:
+                    self._ann.add(self._matrix, start, self._size)
+                if self._quantizer is not None:
+                    self._quantizer.add(self._matrix, start, self._size)
+                if self._payload_index is not None:
+                    self._payload_index.add(payloads, start)
+            self._mark_dead(tombstones)
+            if updates:
+                self._apply_payloads(updates)
+                self._payload_index = None
+            if self._listeners and (ids or tombstones or updates):
+                added = [
+                    (vec_id, decode_payload(payload))
+                    for vec_id, payload in [*zip(ids, payloads), *updates]
+                    if vec_id in self._row_of
+                ]
+                self._notify(added, tombstones)
+            self._refreshed_at = time.monotonic()
+
+    def _apply_payloads(self, updates: Sequence[Tuple[str, bytes]]) -> None:
+        for vec_id, payload in updates:
+            row = self._row_of.get(vec_id)
+            if row is not None:
+                self._payloads[row] = payload
+
+    def _mark_dead(self, ids: Sequence[str]) -> int:
+        rows = [self._row_of.pop(vec_id) for vec_id in ids if vec_id in self._row_of]
+        if rows:
+            self._dead.update(rows)
+            self._dead_rows = None
+        return len(rows)
+
+    def _tombstone(self, ids: Set[str]) -> int:
+        if self._log.read_only:
+            raise RuntimeError("Vector store is read-only")
+        with self._lock:
+            doomed = [vec_id for vec_id in ids if vec_id in self._row_of]
+            if not doomed:
+                return 0
+            self._log.append_tombstones(doomed)
+            removed = self._mark_dead(doomed)
+            if len(self._dead) > LOCAL_VECTOR_STORE_COMPACT_RATIO * self._size:
+                self.compact()
+        return removed
+
+    def compact(self) -> None:
+        """Persistent stores: rewrite live rows as a new generation, dropping tombstones."""
+        with self._lock:
+            if self._log is None or self._log.read_only or not self._dead:
+                return
+            live = np.ones(self._size, dtype=bool)
+            live[[row for row in self._dead if row < self._size]] = False
+            keep = np.flatnonzero(live)
+            ids = [self._ids[i] for i in keep]
+            payloads = [self._payloads[i] for i in keep]
+            # gathered a slice at a time, never as one copy of all live rows
+            step = LOCAL_VECTOR_STORE_COMPACT_BLOCK_ROWS
+            blocks = (self._matrix[keep[start:start + step]] for start in range(0, len(keep), step))
+            self._log.write_generation(blocks, ids, payloads)
+            if self._ann is not None:
+                self._ann.remap(keep, self._size)
+            if self._quantizer is not None:
+                self._quantizer.remap(keep)
+            if self._payload_index is not None:
+                self._payload_index.remap(keep, self._size)
+            self._matrix = self._log.map_vectors(len(keep))
+            self._capacity = len(self._matrix) if self._matrix is not None else self._initial_capacity
+            self._ids = ids
+            self._payloads = payloads
+            self._size = len(keep)
+            self._row_of = {vec_id: row for row, vec_id in enumerate(ids)}
+            self._dead = set()
+            self._dead_rows = None
+
+    def close(self) -> None:
+        """Flush a persistent store, or drop the memory-mapped float32 file of a quantized one."""
+        with self._lock:
+            if self._log is not None:
+                if isinstance(self._matrix, np.memmap) and not self._log.read_only:
+                    self._matrix.flush()
+                self._matrix = None
+                self._log.close()
+                return
+            if self._spill_path is None:
+                return
+            self._matrix = None
+            os.remove(self._spill_path)
+            self._spill_path = None
 
 class QdrantVectorStore:
     """Qdrant-backed vector store. Loads qdrant-client at runtime."""
-    def __init__(self) -> None:
+    # every process writes to the server
+    read_only = False
+
+    def __init__(self, quantization: str = QDRANT_QUANTIZATION) -> None:
+        """
+        Connect and create the collection if missing. With quantization "int8" or "pq"
+        the collection keeps compressed vectors in RAM and the originals on disk, and
+        searches rescore oversampled candidates with the originals.
+        """
         try:
             from qdrant_client import QdrantClient
             from qdrant_client.http import models as rest
@@ -39,31 +604,214 @@ class QdrantVectorStore:
             raise RuntimeError("QDRANT_URL not set in environment")
 
         self.client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+        self.quantization = quantization
 
         # Ensure collection exists (recreate if missing)
         try:
             self.client.get_collection(collection_name=QDRANT_COLLECTION)
         except Exception:
+            quantization_config = _qdrant_quantization_config(quantization)
             self.client.recreate_collection(
                 collection_name=QDRANT_COLLECTION,
-                vectors_config=rest.VectorParams(size=EMBEDDING_DIM, distance=rest.Distance.COSINE),
+                vectors_config=rest.VectorParams(
+                    size=EMBEDDING_DIM,
+                    distance=rest.Distance.COSINE,
+                    on_disk=quantization_config is not None,
+                ),
+                quantization_config=quantization_config,
+            )
+        for spec in QDRANT_PAYLOAD_INDEXES:
+            field, _, schema = spec.partition(":")
+            self.client.create_payload_index(
+                collection_name=QDRANT_COLLECTION,
+                field_name=field,
+                field_schema=rest.PayloadSchemaType(schema or "keyword"),
             )
 
     def upsert_vector(self, vector: List[float], payload: Dict[str, Any]) -> str:
+        return self.upsert_vectors([vector], [payload], batch_size=1, parallel=1)[0]
+
+    def upsert_vectors(
+        self,
+        vectors: Sequence[List[float]],
+        payloads: Sequence[Dict[str, Any]],
+        batch_size: int = QDRANT_UPSERT_BATCH_SIZE,
+        parallel: int = QDRANT_UPSERT_PARALLEL,
+    ) -> List[str]:
+        """
+        Upsert many points, `batch_size` per request. With parallel > 1 the batches
+        are sent concurrently from a thread pool.
+        """
+        from qdrant_client.http import models as rest
+        if len(vectors) != len(payloads):
+            raise ValueError("vectors and payloads must have the same length")
+        ids = [str(uuid.uuid4()) for _ in range(len(vectors))]
+        points = [
+            rest.PointStruct(id=vec_id, vector=list(vector), payload=payload)
+            for vec_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        batches = [points[i : i + batch_size] for i in range(0, len(points), max(1, batch_size))]
+
+        def send(batch: List[Any]) -> None:
+            self.client.upsert(collection_name=QDRANT_COLLECTION, points=batch)
+
+        if parallel > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=min(parallel, len(batches))) as pool:
+                # list() re-raises the first failed batch
+                list(pool.map(send, batches))
+        else:
+            for batch in batches:
+                send(batch)
+        return ids
+
+    def delete_vectors(self, ids: Sequence[str]) -> int:
+        """Delete points by id."""
+        from qdrant_client.http import models as rest
+        if not ids:
+            return 0
+        self.client.delete(
+            collection_name=QDRANT_COLLECTION,
+            points_selector=rest.PointIdsList(points=list(ids)),
+        )
+        return len(ids)
+
+    def get_payloads(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Payloads of the given ids that are stored; missing ids are left out."""
+        if not ids:
+            return {}
+        points = self.client.retrieve(
+            collection_name=QDRANT_COLLECTION, ids=list(ids), with_payload=True, with_vectors=False
+        )
+        return {str(point.id): point.payload for point in points}
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, List[float]]:
+        """Stored vectors of the given ids; missing ids are left out."""
+        if not ids:
+            return {}
+        points = self.client.retrieve(
+            collection_name=QDRANT_COLLECTION, ids=list(ids), with_payload=False, with_vectors=True
+        )
+        return {str(point.id): list(point.vector) for point in points}
+
+    def update_payloads(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """Merge fields into the payloads of stored points ({id: fields}) in one batch request."""
         from qdrant_client.http import models as rest
-        vec_id = str(uuid.uuid4())
-        self.client.upsert(
+        if not updates:
+            return 0
+        self.client.batch_update_points(
             collection_name=QDRANT_COLLECTION,
-            points=[rest.PointStruct(id=vec_id, vector=vector, payload=payload)],
+            update_operations=[
+                rest.SetPayloadOperation(set_payload=rest.SetPayload(payload=fields, points=[vec_id]))
+                for vec_id, fields in updates.items()
+            ],
         )
-        return vec_id
+        return len(updates)
 
-    def search_vector(self, vector: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        results = self.client.search(collection_name=QDRANT_COLLECTION, query_vector=vector, limit=top_k)
+    def search_vector(
+        self,
+        vector: List[float],
+        top_k: int = 5,
+        ef_search: Optional[int] = None,
+        exact: bool = False,
+        payload_filter: Optional[PayloadFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top_k points; ef_search sets Qdrant's HNSW beam width, exact=True skips the index.
+        payload_filter is sent as a native Qdrant filter, applied inside the search.
+        """
+        response = self.client.query_points(
+            collection_name=QDRANT_COLLECTION,
+            query=list(vector),
+            limit=top_k,
+            search_params=self._search_params(ef_search, exact),
+            query_filter=_qdrant_filter(payload_filter) if payload_filter else None,
+            with_payload=True,
+        )
         out = []
-        for r in results:
+        for r in response.points:
             out.append({"id": r.id, "score": r.score, "payload": r.payload})
         return out
 
+    def search_vectors(
+        self,
+        vectors: Sequence[List[float]],
+        top_k: int = 5,
+        ef_search: Optional[int] = None,
+        exact: bool = False,
+        payload_filter: Optional[PayloadFilter] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """search_vector for many queries in one round trip through Qdrant's batch query API."""
+        from qdrant_client.http import models as rest
+        if len(vectors) == 0:
+            return []
+        params = self._search_params(ef_search, exact)
+        query_filter = _qdrant_filter(payload_filter) if payload_filter else None
+        responses = self.client.query_batch_points(
+            collection_name=QDRANT_COLLECTION,
+            requests=[
+                rest.QueryRequest(
+                    query=list(vector), limit=top_k, params=params, filter=query_filter, with_payload=True
+                )
+                for vector in vectors
+            ],
+        )
+        return [
+            [{"id": r.id, "score": r.score, "payload": r.payload} for r in response.points]
+            for response in responses
+        ]
+
+    def _search_params(self, ef_search: Optional[int], exact: bool) -> Any:
+        from qdrant_client.http import models as rest
+        if not (ef_search or exact or self.quantization != "none"):
+            return None
+        rescore = None
+        if self.quantization != "none":
+            rescore = rest.QuantizationSearchParams(rescore=True, oversampling=QDRANT_RESCORE_OVERSAMPLING)
+        return rest.SearchParams(hnsw_ef=ef_search, exact=exact, quantization=rescore)
+
+    def close(self) -> None:
+        self.client.close()
+
+def _qdrant_quantization_config(kind: str) -> Any:
+    """Qdrant quantization config for a new collection, or None."""
+    from qdrant_client.http import models as rest
+    if kind in ("", "none"):
+        return None
+    if kind == "int8":
+        return rest.ScalarQuantization(
+            scalar=rest.ScalarQuantizationConfig(type=rest.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if kind == "pq":
+        return rest.ProductQuantization(
+            product=rest.ProductQuantizationConfig(
+                compression=rest.CompressionRatio(QDRANT_PQ_COMPRESSION), always_ram=True
+            )
+        )
+    raise ValueError(f"Unknown quantization: {kind}")
+
+def _qdrant_condition(key: str, condition: Any) -> Any:
+    from qdrant_client.http import models as rest
+    if isinstance(condition, dict):
+        return rest.FieldCondition(key=key, range=rest.Range(**condition))
+    if isinstance(condition, list):
+        return rest.FieldCondition(key=key, match=rest.MatchAny(any=condition))
+    return rest.FieldCondition(key=key, match=rest.MatchValue(value=condition))
+
+def _qdrant_filter(payload_filter: PayloadFilter) -> Any:
+    """
+    Translate a payload filter into a Qdrant Filter (all conditions must match). A
+    file_name condition also matches any entry of "file_names" (see payload_filter.field_values).
+    """
+    from qdrant_client.http import models as rest
+    must = []
+    for field, condition in payload_filter.items():
+        if field == "file_name":
+            must.append(rest.Filter(should=[
+                _qdrant_condition("file_name", condition), _qdrant_condition("file_names", condition)
+            ]))
+        else:
+            must.append(_qdrant_condition(field, condition))
+    return rest.Filter(must=must)
+
 # Export VectorStore class according to env
 VectorStore = QdrantVectorStore if USE_QDRANT else SimpleVectorStore
\ No newline at end of file
@@ -1,45 +1,89 @@
-from typing import List, Optional
+from bisect import bisect_right
+from itertools import accumulate, compress, count, repeat
+from operator import add, lt
+from typing import Iterable, Iterator, List, Optional, Tuple
 import re
+import numpy as np
+from app.utils.token_counting import TokenCounter, WhitespaceTokenCounter
 
-def chunk_text_fixed(text: str, chunk_size: int = 500) -> List[str]:
+CHUNKING_STRATEGIES = ("fixed", "sentence", "recursive")
+
+DEFAULT_SEPARATORS = [
+    "\n\n",  # Paragraph breaks
+    "\n",    # Single newlines
+    ". ",    # Sentence endings
+    "! ",
+    "? ",
+    "; ",    # Sentence separators
+    ": ",
+    " ",     # Word boundaries
+    "",      # Character-level (fallback)
+]
+
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+_WHITESPACE = WhitespaceTokenCounter()
+
+# Every strategy takes an optional token_counter (see app.utils.token_counting) that
+# measures chunk_size and chunk_overlap; without one, tokens are whitespace-separated words.
+
+def chunk_text_fixed(text: str, chunk_size: int = 500, token_counter: Optional[TokenCounter] = None) -> List[str]:
     """
     Naive fixed-size chunking by whitespace tokens (approximate tokens).
-    Splits text into chunks of chunk_size tokens.
+    Splits text into chunks of chunk_size tokens. With a token_counter, words are
+    grouped greedily so each chunk holds at most chunk_size counted tokens.
     """
     tokens = text.split()
+    if token_counter is not None:
+        return list(_group_words(tokens, token_counter.count_batch(tokens), chunk_size))
     chunks = []
     for i in range(0, len(tokens), chunk_size):
         chunk = " ".join(tokens[i : i + chunk_size])
         chunks.append(chunk)
     return chunks
 
-def chunk_text_sentences(text: str, chunk_size: int = 500) -> List[str]:
+def chunk_text_sentences(
+    text: str, chunk_size: int = 500, token_counter: Optional[TokenCounter] = None
+) -> List[str]:
     """
     Sentence-split chunking: group sentences until approximate chunk_size tokens reached.
     """
     # very simple sentence splitter
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks = []
+    sentences = _SENTENCE_BOUNDARY.split(text)
+    return list(_group_sentences(sentences, chunk_size, token_counter))
+
+def _group_words(words: List[str], counts: List[int], chunk_size: int) -> Iterator[str]:
+    """Greedily join words into chunks of at most chunk_size counted tokens (at least one word each)."""
+    totals = list(accumulate(counts, initial=0))
+    first = 0
+    while first < len(words):
+        stop = max(first + 1, bisect_right(totals, chunk_size + totals[first]) - 1)
+        yield " ".join(words[first:stop])
+        first = stop
+
+def _group_sentences(
+    sentences: Iterable[str], chunk_size: int, token_counter: Optional[TokenCounter] = None
+) -> Iterator[str]:
+    counter = token_counter or _WHITESPACE
     current = []
     current_count = 0
     for s in sentences:
-        toks = s.split()
-        if current_count + len(toks) > chunk_size and current:
-            chunks.append(" ".join(current))
+        tokens = counter.count(s)
+        if current_count + tokens > chunk_size and current:
+            yield " ".join(current)
             current = [s]
-            current_count = len(toks)
+            current_count = tokens
         else:
             current.append(s)
-            current_count += len(toks)
+            current_count += tokens
     if current:
-        chunks.append(" ".join(current))
-    return chunks
+        yield " ".join(current)
 
 def chunk_text_recursive(
     text: str, 
     chunk_size: int = 500, 
     chunk_overlap: int = 50,
-    separators: Optional[List[str]] = None
+    separators: Optional[List[str]] = None,
+    token_counter: Optional[TokenCounter] = None,
 ) -> List[str]:
     """
     Recursive character text splitter with overlap support.
@@ -55,100 +99,342 @@ def chunk_text_recursive(
         chunk_size: Target chunk size in tokens (approximate, using whitespace)
         chunk_overlap: Number of tokens to overlap between chunks
         separators: Custom list of separators (optional)
+        token_counter: Counts tokens for chunk_size / chunk_overlap (default: whitespace words)
     
     Returns:
         List of text chunks with overlap
+
+    Each split is tokenized once and its token count reused for both the recursion
+    check and merging; merge boundaries come from a running token total.
     """
     if separators is None:
-        separators = [
-            "\n\n",  # Paragraph breaks
-            "\n",    # Single newlines
-            ". ",    # Sentence endings
-            "! ", 
-            "? ",
-            "; ",    # Sentence separators
-            ": ",
-            " ",     # Word boundaries
-            "",      # Character-level (fallback)
-        ]
-    
-    # Normalize text
-    text = text.strip()
+        separators = DEFAULT_SEPARATORS
+    chunks, _ = _split_counted(text, chunk_size, chunk_overlap, separators, token_counter)
+    return chunks
+
+def chunk_document(
+    text: str,
+    strategy: str = "fixed",
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    token_counter: Optional[TokenCounter] = None,
+) -> List[str]:
+    """Chunk text with one of CHUNKING_STRATEGIES; chunk_overlap only applies to "recursive"."""
+    if strategy == "fixed":
+        return chunk_text_fixed(text, chunk_size=chunk_size, token_counter=token_counter)
+    if strategy == "sentence":
+        return chunk_text_sentences(text, chunk_size=chunk_size, token_counter=token_counter)
+    if strategy == "recursive":
+        return chunk_text_recursive(
+            text, chunk_size=chunk_size, chunk_overlap=chunk_overlap, token_counter=token_counter
+        )
+    raise ValueError(f"Unknown chunking strategy: {strategy}")
+
+# Streaming variants: they consume an iterable of text parts (pages, paragraphs) and yield
+# chunks as soon as they are complete. The output equals that of the list-based function
+# applied to "\n".join(parts), so overlap and sentence grouping carry across part boundaries.
+
+def iter_chunks_fixed(
+    parts: Iterable[str], chunk_size: int = 500, token_counter: Optional[TokenCounter] = None
+) -> Iterator[str]:
+    """Streaming chunk_text_fixed: yield chunk_size-token chunks as parts arrive."""
+    if token_counter is not None:
+        yield from _iter_counted_words(parts, chunk_size, token_counter)
+        return
+    pending: List[str] = []
+    for part in parts:
+        pending.extend(part.split())
+        while len(pending) >= chunk_size:
+            yield " ".join(pending[:chunk_size])
+            del pending[:chunk_size]
+    if pending:
+        yield " ".join(pending)
+
+def _iter_counted_words(parts: Iterable[str], chunk_size: int, token_counter: TokenCounter) -> Iterator[str]:
+    words: List[str] = []
+    counts: List[int] = []
+    for part in parts:
+        new_words = part.split()
+        words += new_words
+        counts += token_counter.count_batch(new_words)
+        totals = list(accumulate(counts, initial=0))
+        first = 0
+        # a chunk is final once the word that overflows it has arrived
+        while True:
+            stop = max(first + 1, bisect_right(totals, chunk_size + totals[first]) - 1)
+            if stop >= len(words):
+                break
+            yield " ".join(words[first:stop])
+            first = stop
+        del words[:first]
+        del counts[:first]
+    yield from _group_words(words, counts, chunk_size)
+
+def iter_chunks_sentences(
+    parts: Iterable[str], chunk_size: int = 500, token_counter: Optional[TokenCounter] = None
+) -> Iterator[str]:
+    """Streaming chunk_text_sentences: group sentences into chunks as parts arrive."""
+    return _group_sentences(_iter_sentences(parts), chunk_size, token_counter)
+
+def iter_chunks_recursive(
+    parts: Iterable[str],
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    separators: Optional[List[str]] = None,
+    token_counter: Optional[TokenCounter] = None,
+) -> Iterator[str]:
+    """
+    Streaming chunk_text_recursive. The text is cut on the first separator as it
+    arrives; each piece is split further with the remaining separators if it is too
+    large, and pieces are merged with overlap into chunks that are yielded when full.
+    The first separator must be non-empty.
+    """
+    if separators is None:
+        separators = DEFAULT_SEPARATORS
+    separator = separators[0]
+    if not separator:
+        raise ValueError("Streaming recursive chunking needs a non-empty first separator")
+
+    counter = token_counter or _WHITESPACE
+
+    def expand(split: str) -> Iterator[Tuple[str, int]]:
+        tokens = counter.count(split)
+        if len(separators) > 1 and tokens > chunk_size:
+            return zip(*_split_counted(split, chunk_size, chunk_overlap, separators[1:], token_counter, tokens))
+        return iter([(split, tokens)])
+
+    def pieces() -> Iterator[Tuple[str, int]]:
+        # chunk_text_recursive strips the whole document and drops blank splits, so the
+        # latest non-blank split is held back until we know whether only whitespace follows
+        pending = None
+        for split in _iter_splits(parts, separator):
+            if not split.strip():
+                continue
+            if pending is not None:
+                yield from expand(pending)
+            pending = split
+        if pending is not None:
+            yield from expand(pending.rstrip())
+
+    return _iter_merged_with_overlap(pieces(), chunk_size, chunk_overlap, token_counter)
+
+def iter_chunk_document(
+    parts: Iterable[str],
+    strategy: str = "fixed",
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    token_counter: Optional[TokenCounter] = None,
+) -> Iterator[str]:
+    """Streaming chunk_document over an iterable of text parts."""
+    if strategy == "fixed":
+        return iter_chunks_fixed(parts, chunk_size=chunk_size, token_counter=token_counter)
+    if strategy == "sentence":
+        return iter_chunks_sentences(parts, chunk_size=chunk_size, token_counter=token_counter)
+    if strategy == "recursive":
+        return iter_chunks_recursive(
+            parts, chunk_size=chunk_size, chunk_overlap=chunk_overlap, token_counter=token_counter
+        )
+    raise ValueError(f"Unknown chunking strategy: {strategy}")
+
+def _iter_joined(parts: Iterable[str]) -> Iterator[str]:
+    """Yield parts with the "\n" that joins them prepended to all but the first."""
+    first = True
+    for part in parts:
+        yield part if first else "\n" + part
+        first = False
+
+def _iter_sentences(parts: Iterable[str]) -> Iterator[str]:
+    """Yield what _SENTENCE_BOUNDARY.split("\n".join(parts)) returns, incrementally."""
+    buffer = ""
+    for part in _iter_joined(parts):
+        buffer += part
+        start = 0
+        for match in _SENTENCE_BOUNDARY.finditer(buffer):
+            # whitespace running to the end of the buffer may continue in the next part
+            if match.end() == len(buffer):
+                break
+            yield buffer[start:match.start()]
+            start = match.end()
+        buffer = buffer[start:]
+    yield from _SENTENCE_BOUNDARY.split(buffer)
+
+def _iter_splits(parts: Iterable[str], separator: str) -> Iterator[str]:
+    """
+    Yield the splits of "\n".join(parts).lstrip().split(separator), each keeping its
+    separator, incrementally and without dropping blank splits.
+    """
+    buffer = ""
+    started = False
+    for part in _iter_joined(parts):
+        if not started:
+            part = part.lstrip()
+            if not part:
+                continue
+            started = True
+        buffer += part
+        splits = buffer.split(separator)
+        # every separator found is final: str.split scans left to right without overlap
+        for split in splits[:-1]:
+            yield split + separator
+        buffer = splits[-1]
+    if started:
+        yield buffer
+
+def _split_counted(
+    text: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    separators: List[str],
+    token_counter: Optional[TokenCounter] = None,
+    tokens: Optional[int] = None,
+) -> Tuple[List[str], List[int]]:
+    """
+    chunk_text_recursive returning the chunks together with their token counts.
+    tokens is the token count of text when the caller already has it.
+    """
+    stripped = text.strip()
+    if len(stripped) != len(text):
+        tokens = None
+    text = stripped
     if not text:
-        return []
-    
-    # Split by the first separator
+        return [], []
+
     separator = separators[0]
-    splits = _split_text(text, separator)
-    
-    # If we have more separators and splits are too large, recurse
-    if len(separators) > 1:
-        chunks = []
-        for split in splits:
-            if _count_tokens(split) > chunk_size:
-                # Recurse with remaining separators
-                sub_chunks = chunk_text_recursive(
-                    split, 
-                    chunk_size=chunk_size, 
-                    chunk_overlap=chunk_overlap,
-                    separators=separators[1:]
-                )
-                chunks.extend(sub_chunks)
-            else:
-                chunks.append(split)
+    if not separator:
+        merged = _merge_chars(text, chunk_size, chunk_overlap, token_counter, last=len(separators) == 1)
+        if merged is not None:
+            return merged
+    if separator:
+        parts = text.split(separator)
+        pieces = list(map(add, parts, repeat(separator)))
+        pieces[-1] = parts[-1]
     else:
-        chunks = splits
-    
-    # Merge chunks with overlap
-    return _merge_chunks_with_overlap(chunks, chunk_size, chunk_overlap)
-
-def _split_text(text: str, separator: str) -> List[str]:
-    """Split text by separator, preserving the separator in the splits."""
-    if separator == "":
-        # Character-level split
-        return list(text)
-    splits = text.split(separator)
-    # Add separator back to all but the last split
-    result = []
-    for i, split in enumerate(splits):
-        if i < len(splits) - 1:
-            result.append(split + separator)
-        else:
-            result.append(split)
-    return [s for s in result if s.strip()]  # Remove empty splits
+        pieces = list(text)
+    if len(pieces) == 1 and tokens is not None:
+        # the separator does not occur: text is still one piece, and already counted
+        counts = [tokens]
+    else:
+        # every piece is tokenized exactly once; the counts drive both recursion and merging
+        counts = (token_counter or _WHITESPACE).count_batch(pieces)
+    if separator:
+        # drop blank splits (for whitespace counting, exactly the pieces with no tokens)
+        blank = counts if token_counter is None else list(map(str.strip, pieces))
+        pieces = list(compress(pieces, blank))
+        counts = list(compress(counts, blank))
 
-def _count_tokens(text: str) -> int:
-    """Approximate token count using whitespace splitting."""
-    return len(text.split())
+    large = list(compress(count(), map(lt, repeat(chunk_size), counts))) if len(separators) > 1 else []
+    if large:
+        # replace each too-large piece with its recursively split chunks
+        split_pieces: List[str] = []
+        split_counts: List[int] = []
+        prev = 0
+        for i in large:
+            split_pieces += pieces[prev:i]
+            split_counts += counts[prev:i]
+            sub_pieces, sub_counts = _split_counted(
+                pieces[i], chunk_size, chunk_overlap, separators[1:], token_counter, counts[i]
+            )
+            split_pieces += sub_pieces
+            split_counts += sub_counts
+            prev = i + 1
+        pieces = split_pieces + pieces[prev:]
+        counts = split_counts + counts[prev:]
+    return _merge_counted(pieces, counts, chunk_size, chunk_overlap, token_counter)
 
-def _merge_chunks_with_overlap(
-    chunks: List[str], 
-    chunk_size: int, 
-    chunk_overlap: int
-) -> List[str]:
-    """Merge chunks ensuring they don't exceed chunk_size, with overlap between chunks."""
-    if not chunks:
-        return []
-    
-    merged = []
+def _merge_counted(
+    pieces: List[str],
+    counts: List[int],
+    chunk_size: int,
+    chunk_overlap: int,
+    token_counter: Optional[TokenCounter] = None,
+) -> Tuple[List[str], List[int]]:
+    """
+    _merge_chunks_with_overlap for pieces with known token counts. Chunk boundaries are
+    found by bisecting the running token total instead of adding pieces one at a time.
+    """
+    merged: List[str] = []
+    merged_counts: List[int] = []
+    if not pieces:
+        return merged, merged_counts
+    counter = token_counter or _WHITESPACE
+    totals = list(accumulate(counts, initial=0))
+    overlap: List[str] = []
+    overlap_count = 0
+    first = 0
+    while True:
+        # the first piece that no longer fits after the overlap and pieces[first:]
+        # (the piece a chunk starts with is always taken)
+        limit = chunk_size - overlap_count + totals[first]
+        stop = min(max(first + 1, bisect_right(totals, limit) - 1), len(pieces))
+        merged_text = " ".join(overlap + pieces[first:stop])
+        merged.append(merged_text)
+        merged_counts.append(overlap_count + totals[stop] - totals[first])
+        if stop == len(pieces):
+            return merged, merged_counts
+        # last chunk_overlap tokens, without splitting the whole chunk
+        overlap, overlap_count = counter.tail(merged_text, chunk_overlap)
+        first = stop
+
+def _merge_chars(
+    text: str, chunk_size: int, chunk_overlap: int, token_counter: Optional[TokenCounter], last: bool
+) -> Optional[Tuple[List[str], List[int]]]:
+    """
+    _merge_counted over the character-level splits of text, with chunk boundaries found
+    on numpy prefix sums over the whole run instead of a list entry per character. None
+    when a character is larger than chunk_size and more separators are left to split it
+    with (the per-split path handles that).
+    """
+    counter = token_counter or _WHITESPACE
+    if text.isascii():
+        codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    else:
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    # each distinct character is counted once
+    unique, inverse = np.unique(codes, return_inverse=True)
+    unique_counts = np.asarray(counter.count_batch([chr(code) for code in unique.tolist()]), dtype=np.int64)
+    if not last and unique_counts.max() > chunk_size:
+        return None
+    totals = np.zeros(len(text) + 1, dtype=np.int64)
+    np.cumsum(unique_counts[inverse], out=totals[1:])
+    merged: List[str] = []
+    merged_counts: List[int] = []
+    overlap: List[str] = []
+    overlap_count = 0
+    first = 0
+    while True:
+        limit = chunk_size - overlap_count + int(totals[first])
+        stop = min(max(first + 1, int(np.searchsorted(totals, limit, side="right")) - 1), len(text))
+        merged_text = " ".join([*overlap, *text[first:stop]])
+        merged.append(merged_text)
+        merged_counts.append(overlap_count + int(totals[stop] - totals[first]))
+        if stop == len(text):
+            return merged, merged_counts
+        overlap, overlap_count = counter.tail(merged_text, chunk_overlap)
+        first = stop
+
+def _iter_merged_with_overlap(
+    chunks: Iterable[Tuple[str, int]],
+    chunk_size: int,
+    chunk_overlap: int,
+    token_counter: Optional[TokenCounter] = None,
+) -> Iterator[str]:
+    """Streaming merge of (chunk, token count) pairs; the overlap is measured by token_counter."""
+    counter = token_counter or _WHITESPACE
     current_chunk = []
     current_size = 0
     
-    for chunk in chunks:
-        chunk_tokens = _count_tokens(chunk)
-        
+    for chunk, chunk_tokens in chunks:
         # If adding this chunk would exceed size, finalize current chunk
         if current_size + chunk_tokens > chunk_size and current_chunk:
             merged_text = " ".join(current_chunk)
-            merged.append(merged_text)
+            yield merged_text
             
             # Start new chunk with overlap from previous
             if chunk_overlap > 0:
                 # Get last N tokens from previous chunk for overlap
-                prev_tokens = merged_text.split()
-                overlap_tokens = prev_tokens[-chunk_overlap:] if len(prev_tokens) > chunk_overlap else prev_tokens
+                overlap_tokens, overlap_count = counter.tail(merged_text, chunk_overlap)
                 current_chunk = overlap_tokens + [chunk]
-                current_size = len(overlap_tokens) + chunk_tokens
+                current_size = overlap_count + chunk_tokens
             else:
                 current_chunk = [chunk]
                 current_size = chunk_tokens
@@ -158,6 +444,4 @@ def _merge_chunks_with_overlap(
     
     # Add final chunk
     if current_chunk:
-        merged.append(" ".join(current_chunk))
-    
-    return merged
\ No newline at end of file
+        yield " ".join(current_chunk)
\ No newline at end of file
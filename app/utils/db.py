@@ -1,10 +1,12 @@
-from typing import Generator
-from sqlalchemy import create_engine, Column, Integer, String, Text
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, Iterable, List, Set
+from sqlalchemy import create_engine, delete, insert, select, Column, Integer, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+DB_INSERT_BATCH_SIZE = int(os.getenv("DB_INSERT_BATCH_SIZE", "500"))
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -34,4 +36,56 @@ def init_db() -> None:
 
 def get_db_session() -> Session:
     """Return a SQLAlchemy session."""
-    return SessionLocal()
\ No newline at end of file
+    return SessionLocal()
+
+@contextmanager
+def session_scope() -> Generator[Session, None, None]:
+    """Yield a session that commits on success, rolls back on error and is always closed."""
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def bulk_insert_chunk_meta(rows: List[Dict[str, Any]], batch_size: int = DB_INSERT_BATCH_SIZE) -> None:
+    """Insert FileChunkMeta rows in a single transaction, as executemany batches of batch_size."""
+    if not rows:
+        return
+    with session_scope() as session:
+        for i in range(0, len(rows), batch_size):
+            session.execute(insert(FileChunkMeta), rows[i : i + batch_size])
+
+def load_chunk_meta(file_name: str) -> List[Dict[str, Any]]:
+    """Stored FileChunkMeta rows of a file, in chunk order."""
+    with session_scope() as session:
+        rows = (
+            session.query(FileChunkMeta)
+            .filter(FileChunkMeta.file_name == file_name)
+            .order_by(FileChunkMeta.chunk_id)
+            .all()
+        )
+        return [
+            {"chunk_id": r.chunk_id, "chunk_text": r.chunk_text, "embedding_id": r.embedding_id}
+            for r in rows
+        ]
+
+def replace_chunk_meta(file_name: str, rows: List[Dict[str, Any]], batch_size: int = DB_INSERT_BATCH_SIZE) -> None:
+    """Replace all FileChunkMeta rows of a file with `rows` in a single transaction."""
+    with session_scope() as session:
+        session.execute(delete(FileChunkMeta).where(FileChunkMeta.file_name == file_name))
+        for i in range(0, len(rows), batch_size):
+            session.execute(insert(FileChunkMeta), rows[i : i + batch_size])
+
+def referenced_embedding_ids(embedding_ids: Iterable[str]) -> Set[str]:
+    """The subset of embedding_ids still referenced by some FileChunkMeta row."""
+    ids = list(embedding_ids)
+    found: Set[str] = set()
+    with session_scope() as session:
+        for i in range(0, len(ids), DB_INSERT_BATCH_SIZE):
+            stmt = select(FileChunkMeta.embedding_id).where(FileChunkMeta.embedding_id.in_(ids[i : i + DB_INSERT_BATCH_SIZE]))
+            found.update(session.execute(stmt).scalars())
+    return found
@@ -60,4 +60,13 @@ class RedisMemory:
             # swallow and keep messages in-memory
             if not isinstance(self.client, InMemoryStore):
                 self.client = InMemoryStore()
-            await self.client.set(key, json.dumps(messages))
\ No newline at end of file
+            await self.client.set(key, json.dumps(messages))
+
+    async def close(self) -> None:
+        """Close the Redis connection pool (no-op for the in-memory fallback)."""
+        if isinstance(self.client, InMemoryStore):
+            return
+        try:
+            await self.client.close()
+        except Exception:
+            pass
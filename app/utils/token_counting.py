@@ -0,0 +1,137 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+import base64
+import os
+import re
+import threading
+
+# Path of a BPE vocabulary in tiktoken format (one "<base64 token> <rank>" per line),
+# e.g. cl100k_base.tiktoken for the OpenAI embedding models. Unset = whitespace tokens.
+CHUNK_TOKENIZER_PATH = os.getenv("CHUNK_TOKENIZER_PATH", "")
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "65536"))
+
+# Pre-tokenizer approximating cl100k_base with the stdlib `re` module (no \p{L} / \p{N}).
+DEFAULT_BPE_PATTERN = (
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+)
+
+class TokenCounter(ABC):
+    """Counts tokens for chunk sizing. Subclasses implement count()."""
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """Number of tokens in `text`."""
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        """Token counts for many texts; repeated texts are counted once."""
+        counts = {text: self.count(text) for text in dict.fromkeys(texts)}
+        return [counts[text] for text in texts]
+
+    def tail(self, text: str, n: int) -> Tuple[List[str], int]:
+        """
+        The trailing whitespace-separated words of `text` that fit in `n` tokens,
+        and their token count. Used for the overlap between consecutive chunks.
+        """
+        if n <= 0:
+            return [], 0
+        # every word is at least one token, so the last n words are enough candidates
+        words = text.rsplit(None, n)[-n:]
+        total = 0
+        keep = len(words)
+        for tokens in reversed(self.count_batch(words)):
+            if total + tokens > n:
+                break
+            total += tokens
+            keep -= 1
+        return words[keep:], total
+
+class WhitespaceTokenCounter(TokenCounter):
+    """Approximate tokens as whitespace-separated words (the chunkers' default)."""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return list(map(len, map(str.split, texts)))
+
+    def tail(self, text: str, n: int) -> Tuple[List[str], int]:
+        if n <= 0:
+            return [], 0
+        words = text.rsplit(None, n)[-n:]
+        return words, len(words)
+
+class BPETokenCounter(TokenCounter):
+    """
+    Byte-pair-encoding token counter over a mergeable-ranks vocabulary.
+
+    Text is pre-tokenized with `pattern`, each piece is BPE-merged by rank and the
+    resulting tokens counted. Counts are memoized per piece and per counted text, so
+    repeated words and repeated segments (headers, footers, boilerplate) are cheap.
+    """
+
+    def __init__(
+        self,
+        ranks: Dict[bytes, int],
+        pattern: str = DEFAULT_BPE_PATTERN,
+        cache_size: int = TOKEN_COUNT_CACHE_SIZE,
+    ) -> None:
+        self.ranks = ranks
+        self.pattern = re.compile(pattern)
+        self._piece_tokens = lru_cache(maxsize=cache_size)(self._bpe_count)
+        self._text_tokens = lru_cache(maxsize=cache_size)(self._count)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "BPETokenCounter":
+        """Load a tiktoken-format vocabulary file: one "<base64 token> <rank>" per line."""
+        ranks: Dict[bytes, int] = {}
+        with open(path, "rb") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+        return cls(ranks, **kwargs)
+
+    def count(self, text: str) -> int:
+        return self._text_tokens(text)
+
+    def _count(self, text: str) -> int:
+        piece_tokens = self._piece_tokens
+        return sum(piece_tokens(piece) for piece in self.pattern.findall(text))
+
+    def _bpe_count(self, piece: str) -> int:
+        """Number of tokens BPE merges `piece` into (lowest-ranked adjacent pair first)."""
+        data = piece.encode("utf-8")
+        ranks = self.ranks
+        if data in ranks:
+            return 1
+        parts = [data[i:i + 1] for i in range(len(data))]
+        while len(parts) > 1:
+            best_rank = None
+            best = -1
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank = rank
+                    best = i
+            if best < 0:
+                break
+            parts[best:best + 2] = [parts[best] + parts[best + 1]]
+        return len(parts)
+
+_default_counter: Optional[TokenCounter] = None
+_default_counter_lock = threading.Lock()
+
+def get_token_counter() -> Optional[TokenCounter]:
+    """
+    Return the process-wide BPE counter loaded from CHUNK_TOKENIZER_PATH, or None
+    (whitespace counting) when no vocabulary is configured.
+    """
+    global _default_counter
+    if not CHUNK_TOKENIZER_PATH:
+        return None
+    with _default_counter_lock:
+        if _default_counter is None:
+            _default_counter = BPETokenCounter.from_file(CHUNK_TOKENIZER_PATH)
+        return _default_counter
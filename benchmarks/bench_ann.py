@@ -0,0 +1,64 @@
+"""
+Recall, latency and memory of SimpleVectorStore's IVF index and quantized codes
+against exact search.
+
+Run from the repository root:
+    python -m benchmarks.bench_ann [--rows 200000 --dim 384 --index ivf --quantization none|int8|pq]
+"""
+import argparse
+import time
+import numpy as np
+from app.services.ann_index import IVFIndex, measure_recall
+from app.services.quantization import ProductQuantizer
+from app.services.vectorstore import SimpleVectorStore
+
+
+def _clustered(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Embedding-like data: points scattered around random topic directions."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=10_000, help="vectors per upsert")
+    parser.add_argument("--index", choices=("ivf", "none"), default="ivf")
+    parser.add_argument("--quantization", choices=("none", "int8", "pq"), default="none")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = _clustered(args.rows + args.queries, args.dim, max(16, args.rows // 500), rng)
+    store = SimpleVectorStore(dim=args.dim, index="none", quantization=args.quantization)
+    if args.index == "ivf":
+        store._ann = IVFIndex(min_train=min(args.rows, 10_000))
+    start = time.perf_counter()
+    for i in range(0, args.rows, args.batch):
+        batch = data[i : i + args.batch]
+        store.upsert_vectors(batch, [{"row": i + j} for j in range(len(batch))])
+    if store._ann is not None:
+        store._ann.wait()  # include the background training in the indexing time
+    if isinstance(store._quantizer, ProductQuantizer):
+        store._quantizer.wait()
+    print(f"indexed {args.rows} x {args.dim} in {time.perf_counter() - start:.1f}s")
+    float_mb = args.rows * args.dim * 4 / 2**20
+    if store._quantizer is not None:
+        print(f"float32 vectors {float_mb:.0f} MB (memory-mapped), codes in RAM {store._quantizer.nbytes() / 2**20:.0f} MB")
+    else:
+        print(f"float32 vectors in RAM {float_mb:.0f} MB")
+
+    queries = data[args.rows :]
+    for n_probe in (1, 4, 8, 16, 32, 64) if args.index == "ivf" else (None,):
+        stats = measure_recall(store, queries, args.top_k, n_probe=n_probe)
+        print(
+            f"n_probe {n_probe or '-':>3}: recall@{args.top_k} {stats['recall']:.3f}  "
+            f"approx {stats['approx_ms']:6.2f} ms  exact {stats['exact_ms']:6.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compare chunk_text_recursive with the string-copying reference implementation.
+
+Run from the repository root:  python -m benchmarks.bench_chunking [--mb 4]
+"""
+import argparse
+import random
+import time
+from app.utils.chunking import chunk_text_recursive
+from benchmarks.chunking_reference import chunk_text_recursive as reference_chunk_text_recursive
+
+
+def _corpora(size: int, seed: int = 0):
+    rnd = random.Random(seed)
+
+    def words(n):
+        return ["".join(rnd.choice("abcdefgh") for _ in range(rnd.randint(1, 9))) for _ in range(n)]
+
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = [" ".join(words(rnd.randint(5, 25))) + "." for _ in range(rnd.randint(2, 8))]
+        paragraphs.append(" ".join(sentences))
+        length += len(paragraphs[-1]) + 2
+    yield "structured", "\n\n".join(paragraphs)[:size]
+    yield "unstructured", " ".join(words(size // 5))[:size]
+    yield "tab-separated", "\t".join(words(size // 40))[: size // 8]
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=4.0, help="input size in megabytes")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    for name, text in _corpora(int(args.mb * 1024 * 1024)):
+        ref_s, expected = _time(reference_chunk_text_recursive, text, args.chunk_size, args.chunk_overlap)
+        new_s, got = _time(chunk_text_recursive, text, args.chunk_size, args.chunk_overlap)
+        assert got == expected, f"{name}: outputs differ"
+        print(
+            f"{name:>14}: {len(text) / 1e6:5.1f} MB  {len(got):6d} chunks  "
+            f"reference {ref_s:7.3f}s  current {new_s:7.3f}s  speedup {ref_s / new_s:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,35 @@
 
 import pytest
 from fastapi.testclient import TestClient
-from app.main import app
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app, create_app
+from app.services import embedding_cache
+from app.utils import db, redis_memory
 
 @pytest.fixture(scope="module")
 def test_client():
     with TestClient(app) as client:
-        yield client
\ No newline at end of file
+        yield client
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """Keep chunk metadata and the embedding cache under tmp_path, and chat memory off Redis."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={"check_same_thread": False})
+    monkeypatch.setattr(db, "DATABASE_URL", str(engine.url))
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    db.init_db()
+    # a cache opened on the default path by an earlier test must not be reused
+    embedding_cache.close_embedding_cache()
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache.db"))
+    monkeypatch.setattr(redis_memory, "USE_REDIS", False)
+    yield tmp_path
+    embedding_cache.close_embedding_cache()
+    engine.dispose()
+
+@pytest.fixture
+def client(local_storage):
+    """A started app on local_storage; its resources are on client.app.state."""
+    with TestClient(create_app()) as client:
+        yield client
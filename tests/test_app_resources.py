@@ -0,0 +1,64 @@
+import functools
+from fastapi.testclient import TestClient
+from app import main
+from app.main import create_app
+from app.services.vectorstore import SimpleVectorStore
+from app.utils.db import FileChunkMeta, session_scope
+
+
+def test_lifespan_shares_resources_between_ingest_and_chat(client):
+    state = client.app.state
+    store = state.vector_store
+    resp = client.post(
+        "/ingest",
+        files={"file": ("notes.txt", b"FastAPI lifespan handlers own long-lived clients.", "text/plain")},
+    )
+    assert resp.status_code == 200
+    assert state.vector_store is store
+    assert len(store) == 1
+
+    hits = store.search_vector(state.embedding_service.embed_text("lifespan handlers"), top_k=1)
+    assert hits[0]["payload"]["file_name"] == "notes.txt"
+
+
+def test_ingest_writes_chunk_metadata_in_one_batch(client):
+    text = " ".join(f"word{i}" for i in range(50)).encode()
+    resp = client.post(
+        "/ingest?chunk_size=10",
+        files={"file": ("batched.txt", text, "text/plain")},
+    )
+    assert resp.status_code == 200
+    saved = resp.json()["saved"]
+    assert len(saved) == 5
+
+    with session_scope() as session:
+        rows = session.query(FileChunkMeta).filter(FileChunkMeta.embedding_id.in_([s["embedding_id"] for s in saved])).all()
+        assert sorted(r.chunk_id for r in rows) == [0, 1, 2, 3, 4]
+
+
+def test_sync_ingest_rejects_blank_documents(client):
+    for strategy in ("fixed", "sentence", "recursive"):
+        resp = client.post(
+            f"/ingest?chunking_strategy={strategy}",
+            files={"file": ("blank.txt", b"  \n \n  ", "text/plain")},
+        )
+        assert resp.status_code == 400
+    assert len(client.app.state.vector_store) == 0
+
+
+def test_persistent_local_store_rebuilds_side_indexes(monkeypatch, local_storage):
+    path = str(local_storage / "vectors")
+    monkeypatch.setattr(main, "LOCAL_VECTOR_STORE_PATH", path)
+    monkeypatch.setattr(main, "VectorStore", functools.partial(SimpleVectorStore, path=path))
+    term = "persistentterm"
+    with TestClient(create_app()) as client:
+        saved = client.post("/ingest", files={"file": ("kept.txt", f"{term} survives restarts".encode(), "text/plain")}).json()["saved"]
+        # a second worker on the same directory only reads
+        with TestClient(create_app()) as other:
+            resp = other.post("/ingest", files={"file": ("other.txt", b"not stored here", "text/plain")})
+            assert resp.status_code == 503
+
+    app = create_app()  # a restart: the store reopens from disk, the side indexes reload from app.db
+    with TestClient(app):
+        assert app.state.lexical_index.search(term, top_k=1)[0]["id"] == saved[0]["embedding_id"]
+        assert app.state.dedup_index.find(app.state.dedup_index.signature(f"{term} survives restarts")) == saved[0]["embedding_id"]
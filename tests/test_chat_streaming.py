@@ -0,0 +1,54 @@
+import json
+from app.api.v1 import chat
+from app.utils import redis_memory
+
+
+def _setup(monkeypatch):
+    saved = {}
+
+    async def fake_stream(prompt):
+        saved.setdefault("prompts", []).append(prompt)
+        for delta in ("Hel", "lo", "!"):
+            yield delta
+
+    async def fake_append(self, user_id, message):
+        saved.setdefault(user_id, []).append(message)
+
+    monkeypatch.setattr(chat, "astream_groq_completion", fake_stream)
+    monkeypatch.setattr(redis_memory.RedisMemory, "append_message", fake_append)
+    return saved
+
+
+def test_chat_stream_sse(monkeypatch, client):
+    saved = _setup(monkeypatch)
+    with client.stream("POST", "/chat/stream", json={"user_id": "u1", "query": "hi"}) as resp:
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        body = "".join(resp.iter_text())
+
+    events = [e for e in body.split("\n\n") if e]
+    deltas = [json.loads(e[len("data: "):])["delta"] for e in events if e.startswith("data: ")]
+    assert deltas == ["Hel", "lo", "!"]
+    assert events[0].startswith("event: usage\ndata: ")  # before the first delta
+    usage = json.loads(events[0].split("data: ", 1)[1])
+    assert usage["total"] == len(saved["prompts"][0].split()) and usage["query"] > 0
+    assert events[-1] == 'event: done\ndata: {"reply": "Hello!"}'
+    assert saved["u1"][-1] == {"role": "assistant", "content": "Hello!"}
+
+
+def test_chat_websocket(monkeypatch, client):
+    saved = _setup(monkeypatch)
+    with client.websocket_connect("/chat/ws") as ws:
+        ws.send_text(json.dumps({"user_id": "u2", "query": "hi"}))
+        frames = []
+        while True:
+            frame = ws.receive_json()
+            frames.append(frame)
+            if frame["type"] == "done":
+                break
+        ws.send_text("{}")
+        assert ws.receive_json()["type"] == "error"
+
+    assert [f["content"] for f in frames if f["type"] == "delta"] == ["Hel", "lo", "!"]
+    assert frames[0]["type"] == "usage" and frames[0]["usage"]["total"] == len(saved["prompts"][0].split())
+    assert frames[-1] == {"type": "done", "reply": "Hello!"}
+    assert saved["u2"] == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "Hello!"}]
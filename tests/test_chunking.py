@@ -0,0 +1,49 @@
+import pytest
+from app.utils import chunking
+from benchmarks.chunking_reference import chunk_text_recursive as reference_chunk_text_recursive
+
+PAGES = [
+    "Intro line one. Second sentence here! A question?\n\nNext paragraph starts",
+    "and continues on the next page; with clauses: many of them.",
+    "",
+    "  Final page.\n\n\n  trailing words and more words to split up  ",
+]
+
+
+@pytest.mark.parametrize("strategy", chunking.CHUNKING_STRATEGIES)
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(3, 0), (5, 2), (50, 10)])
+def test_streaming_matches_whole_document(strategy, chunk_size, chunk_overlap):
+    expected = chunking.chunk_document("\n".join(PAGES), strategy, chunk_size, chunk_overlap)
+    streamed = chunking.iter_chunk_document(iter(PAGES), strategy, chunk_size, chunk_overlap)
+    assert list(streamed) == expected
+
+
+def test_streaming_yields_before_input_is_exhausted():
+    consumed = []
+
+    def pages():
+        for i in range(3):
+            consumed.append(i)
+            yield " ".join(f"w{i}_{j}" for j in range(4))
+
+    chunks = chunking.iter_chunks_fixed(pages(), chunk_size=4)
+    assert next(chunks) == "w0_0 w0_1 w0_2 w0_3"
+    assert consumed == [0]
+
+
+def test_streaming_recursive_carries_overlap_across_pages():
+    chunks = list(chunking.iter_chunks_recursive(["a b c d", "e f g h"], chunk_size=4, chunk_overlap=2))
+    assert chunks == chunking.chunk_text_recursive("a b c d\ne f g h", chunk_size=4, chunk_overlap=2)
+    assert chunks[1].split()[:2] == chunks[0].split()[-2:]
+
+
+def test_recursive_matches_reference_implementation():
+    import random
+
+    rnd = random.Random(7)
+    alphabet = ["word", "x", ". ", "! ", "? ", "; ", ": ", " ", "\n", "\n\n", "\t", "\t\t"]
+    for _ in range(500):
+        text = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 120)))
+        chunk_size, chunk_overlap = rnd.randint(1, 10), rnd.randint(0, 6)
+        assert chunking.chunk_text_recursive(text, chunk_size, chunk_overlap) == \
+            reference_chunk_text_recursive(text, chunk_size, chunk_overlap)
@@ -0,0 +1,84 @@
+from app.services.dedup import NearDuplicateIndex
+from app.utils.db import FileChunkMeta, session_scope
+
+PAGE = " ".join(f"clause{i} of the standard terms applies" for i in range(40))
+
+
+def test_index_finds_near_duplicates_only():
+    index = NearDuplicateIndex(threshold=0.8)
+    index.add_many(index.signatures([PAGE]), ["vec-1"])
+
+    edited = PAGE.replace("clause39 of", "clause39 in")
+    assert index.find(index.signature(edited)) == "vec-1"
+    assert index.find(index.signature("an unrelated paragraph about something else")) is None
+
+    index.remove(["vec-1"])
+    assert index.find(index.signature(PAGE)) is None
+
+
+def test_resolve_links_repeats_within_a_batch():
+    index = NearDuplicateIndex()
+    index.add_many(index.signatures(["stored chunk text that was ingested earlier"]), ["vec-1"])
+    matches = index.resolve(index.signatures([
+        "a brand new chunk",
+        "stored chunk text that was ingested earlier",
+        "a brand new chunk",
+    ]))
+    assert matches == [None, "vec-1", 0]
+
+
+def test_reingest_reuses_embeddings(client):
+    app = client.app
+    text = "\n\n".join(" ".join(f"s{i}w{j}" for j in range(200)) for i in range(3)).encode()
+    first = client.post("/ingest?chunk_size=300", files={"file": ("v1.txt", text, "text/plain")}).json()
+    stored = len(app.state.vector_store)
+    second = client.post("/ingest?chunk_size=300", files={"file": ("v2.txt", text, "text/plain")}).json()
+
+    assert len(app.state.vector_store) == stored
+    assert all(meta["deduplicated"] for meta in second["saved"])
+    assert [m["embedding_id"] for m in second["saved"]] == [m["embedding_id"] for m in first["saved"]]
+    with session_scope() as session:
+        rows = session.query(FileChunkMeta).filter(FileChunkMeta.file_name == "v2.txt").all()
+        assert {r.embedding_id for r in rows} >= {m["embedding_id"] for m in second["saved"]}
+
+
+def test_file_filter_finds_chunks_deduplicated_from_another_file(client):
+    app = client.app
+    text = b"Warranty claims for the shared handbook are filed within thirty days."
+    client.post("/ingest", files={"file": ("handbook-a.txt", text, "text/plain")})
+    second = client.post("/ingest", files={"file": ("handbook-b.txt", text, "text/plain")}).json()
+    assert all(meta["deduplicated"] for meta in second["saved"])
+
+    query = {"queries": ["warranty claims"], "filter": {"file_name": "handbook-b.txt"}}
+    hits = client.post("/search/batch", json=query).json()["results"][0]["hits"]
+    assert [h["id"] for h in hits] == [second["saved"][0]["embedding_id"]]
+    assert hits[0]["payload"]["file_names"] == ["handbook-a.txt", "handbook-b.txt"]
+    lexical = app.state.lexical_index.search("warranty claims", payload_filter={"file_name": "handbook-b.txt"})
+    assert [h["id"] for h in lexical] == [second["saved"][0]["embedding_id"]]
+
+    # handbook-a.txt no longer holds the chunk: the vector stays, owned by handbook-b.txt
+    client.post("/ingest?incremental=true", files={"file": ("handbook-a.txt", b"Returns are free.", "text/plain")})
+    payload = app.state.vector_store.get_payloads([second["saved"][0]["embedding_id"]])
+    assert list(payload.values())[0]["file_names"] == ["handbook-b.txt"]
+    assert list(payload.values())[0]["file_name"] == "handbook-b.txt"
+    assert app.state.lexical_index.search("warranty claims", payload_filter={"file_name": "handbook-a.txt"}) == []
+
+
+def test_near_duplicate_versions_keep_their_own_text(client):
+    app = client.app
+    intro = " ".join(f"section{i} of the supply agreement applies" for i in range(30))
+    v1 = f"{intro} The price is 45 dollars per unit.".encode()
+    v2 = f"{intro} The price is 99 dollars per unit.".encode()
+    first = client.post("/ingest", files={"file": ("v1.txt", v1, "text/plain")}).json()
+    second = client.post("/ingest", files={"file": ("v2.txt", v2, "text/plain")}).json()
+
+    # the embedding is reused, the point (and its text) is not
+    assert second["saved"][0]["deduplicated"]
+    assert second["saved"][0]["embedding_id"] != first["saved"][0]["embedding_id"]
+    query = {"queries": ["price per unit"], "filter": {"file_name": "v2.txt"}}
+    hits = client.post("/search/batch", json=query).json()["results"][0]["hits"]
+    assert len(hits) == 1 and "99 dollars" in hits[0]["payload"]["text"]
+    assert hits[0]["payload"]["file_names"] == ["v2.txt"]
+    assert [h["id"] for h in app.state.lexical_index.search("99")] == [second["saved"][0]["embedding_id"]]
+    v1_payload = app.state.vector_store.get_payloads([first["saved"][0]["embedding_id"]])
+    assert list(v1_payload.values())[0]["file_names"] == ["v1.txt"]
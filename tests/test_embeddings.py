@@ -0,0 +1,158 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+import httpx
+import pytest
+import requests
+from app.services import embeddings
+from app.services.embedding_cache import EmbeddingCache
+
+
+class _FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    def json(self):
+        return self._data
+
+
+def test_embed_texts_batches_and_keeps_order(monkeypatch):
+    calls = []
+    failed_once = set()
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        inputs = json["input"]
+        calls.append(list(inputs))
+        # fail the second batch once to check only that batch is retried
+        if inputs[0] == "t3" and "t3" not in failed_once:
+            failed_once.add("t3")
+            return _FakeResponse(503)
+        # return items out of order, tagged with their input index
+        data = [{"index": i, "embedding": [float(t[1:])]} for i, t in enumerate(inputs)]
+        return _FakeResponse(200, {"data": list(reversed(data))})
+
+    monkeypatch.setattr(embeddings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(embeddings, "get_session", lambda: SimpleNamespace(post=fake_post))
+    monkeypatch.setattr(embeddings.time, "sleep", lambda s: None)
+
+    texts = [f"t{i}" for i in range(7)]
+    vectors = embeddings.embed_texts(texts, batch_size=3)
+
+    assert vectors == [[float(i)] for i in range(7)]
+    assert calls == [["t0", "t1", "t2"], ["t3", "t4", "t5"], ["t3", "t4", "t5"], ["t6"]]
+
+
+def test_make_batches_respects_token_budget():
+    texts = ["a" * 40, "b" * 40, "c" * 400, "d"]
+    batches = embeddings._make_batches(texts, max_items=10, max_tokens=25)
+    assert batches == [[0, 1], [2], [3]]
+
+
+def test_embedding_service_uses_cache(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        calls.append(list(json["input"]))
+        data = [{"index": i, "embedding": [float(len(t)), 1.0]} for i, t in enumerate(json["input"])]
+        return _FakeResponse(200, {"data": data})
+
+    monkeypatch.setattr(embeddings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(embeddings, "get_session", lambda: SimpleNamespace(post=fake_post))
+
+    path = str(tmp_path / "cache.db")
+    service = embeddings.EmbeddingService(cache=EmbeddingCache(path=path, max_items=10))
+    first = service.embed_texts(["hello world", "hello   world", "bye"])
+    assert calls == [["hello world", "bye"]]
+    assert first[0] == first[1]
+
+    assert service.embed_text("bye") == first[2]
+    assert len(calls) == 1
+    assert service.cache.memory_hits == 1
+
+    # a fresh process-level cache over the same file serves from disk
+    restarted = embeddings.EmbeddingService(cache=EmbeddingCache(path=path, max_items=10))
+    assert restarted.embed_text("hello world") == first[0]
+    assert restarted.cache.stats()["disk_hits"] == 1
+    assert len(calls) == 1
+
+
+def test_async_embedding_service_reads_cache_off_the_event_loop(monkeypatch, tmp_path):
+    threads = []
+
+    async def fake_batches(texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+    monkeypatch.setattr(embeddings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(embeddings, "_aembed_batches", fake_batches)
+    cache = EmbeddingCache(path=str(tmp_path / "cache.db"), max_items=10)
+    for name in ("get_many", "put_many"):
+        method = getattr(cache, name)
+
+        def recording(*args, _method=method, _name=name):
+            threads.append((_name, threading.get_ident()))
+            return _method(*args)
+
+        monkeypatch.setattr(cache, name, recording)
+
+    async def run():
+        service = embeddings.EmbeddingService(cache=cache)
+        first = await service.aembed_texts(["alpha", "beta"])
+        again = await service.aembed_texts(["alpha"])
+        return threading.get_ident(), first, again
+
+    loop_thread, first, again = asyncio.run(run())
+    assert first == [[5.0, 1.0], [4.0, 1.0]] and again == [first[0]]
+    assert [name for name, _ in threads] == ["get_many", "put_many", "get_many"]
+    assert all(thread != loop_thread for _, thread in threads)
+
+
+def test_async_clients_back_off_without_blocking(monkeypatch):
+    attempts = {"embeddings": 0}
+    sleeps = []
+
+    def handler(request):
+        if request.url.path.endswith("/embeddings"):
+            attempts["embeddings"] += 1
+            if attempts["embeddings"] == 1:
+                return httpx.Response(429)
+            inputs = json.loads(request.content)["input"]
+            return httpx.Response(200, json={"data": [{"index": i, "embedding": [0.5]} for i, _ in enumerate(inputs)]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "pong"}}]})
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(embeddings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(embeddings, "GROQ_API_KEY", "test-key")
+    monkeypatch.setattr(embeddings, "get_async_client", lambda: client)
+    monkeypatch.setattr(embeddings.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(embeddings.time, "sleep", lambda s: pytest.fail("blocking sleep in async path"))
+
+    async def run():
+        vec = await embeddings.aembed_text("ping")
+        reply = await embeddings.acall_groq_completion("ping")
+        return vec, reply
+
+    assert asyncio.run(run()) == ([0.5], "pong")
+    assert sleeps == [1.0]
+
+
+def test_astream_groq_completion_parses_sse(monkeypatch):
+    body = "".join(
+        f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n" for piece in ("a", "b")
+    ) + "data: [DONE]\n\n"
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text=body)))
+    monkeypatch.setattr(embeddings, "GROQ_API_KEY", "test-key")
+    monkeypatch.setattr(embeddings, "get_async_client", lambda: client)
+
+    async def collect():
+        return [delta async for delta in embeddings.astream_groq_completion("hi")]
+
+    assert asyncio.run(collect()) == ["a", "b"]
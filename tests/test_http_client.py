@@ -0,0 +1,52 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from app.services import embeddings, http_client
+
+
+class _StubEmbeddingsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_POST(self):
+        _StubEmbeddingsHandler.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        data = [{"index": i, "embedding": [1.0, 0.0]} for i, _ in enumerate(body["input"])]
+        out = json.dumps({"data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    _StubEmbeddingsHandler.connections = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubEmbeddingsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    http_client.close_session()
+
+
+def test_sync_calls_reuse_one_connection(monkeypatch, stub_server):
+    monkeypatch.setattr(embeddings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(embeddings, "OPENAI_BASE_URL", stub_server)
+    http_client.close_session()
+
+    for text in ("a", "b", "c"):
+        assert embeddings.embed_text(text) == [1.0, 0.0]
+    assert len(_StubEmbeddingsHandler.connections) == 1
+
+
+def test_endpoint_timeouts():
+    assert http_client.get_timeout("completions") == http_client.ENDPOINT_TIMEOUTS["completions"]
+    assert http_client.get_timeout("unknown") == http_client.DEFAULT_TIMEOUT
@@ -0,0 +1,92 @@
+from fastapi.testclient import TestClient
+from app.main import create_app
+from app.utils.db import load_chunk_meta
+
+
+def _paragraphs(tag, n=4, words=149):
+    return ["{} ".format(tag) + " ".join(f"p{i}w{j}" for j in range(words)) for i in range(n)]
+
+
+def test_incremental_reingest_embeds_only_changed_chunks(monkeypatch, client):
+    app = client.app
+    v1 = _paragraphs("inc")
+    v2 = v1[:3] + ["edited " + " ".join(f"new{j}" for j in range(148))]
+    name = "inc.txt"
+    url = "/ingest?chunk_size=300&incremental=true"
+    first = client.post(url, files={"file": (name, "\n\n".join(v1).encode(), "text/plain")}).json()
+    vectors = len(app.state.vector_store)
+    embedded = []
+    original = app.state.embedding_service.aembed_texts
+
+    async def recording(texts):
+        embedded.extend(texts)
+        return await original(texts)
+
+    monkeypatch.setattr(app.state.embedding_service, "aembed_texts", recording)
+    second = client.post(url, files={"file": (name, "\n\n".join(v2).encode(), "text/plain")}).json()
+
+    assert first["embedded"] == first["chunks"] == 2
+    assert second["unchanged"] == 1 and second["embedded"] == 1
+    assert second["removed"] == 1 and second["vectors_deleted"] == 1
+    assert len(embedded) == 1 and "new0" in embedded[0]
+    assert len(app.state.vector_store) == vectors
+    assert second["saved"][0]["embedding_id"] == first["saved"][0]["embedding_id"]
+    stale = first["saved"][1]["embedding_id"]
+    assert stale not in app.state.vector_store._ids
+    rows = load_chunk_meta(name)
+    assert [r["embedding_id"] for r in rows] == [m["embedding_id"] for m in second["saved"]]
+
+
+def test_incremental_reingest_renumbers_moved_chunks(client):
+    app = client.app
+    v1 = _paragraphs("mov")
+    lead = ["lead " + " ".join(f"x{i}y{j}" for j in range(149)) for i in range(2)]
+    v2 = lead + v1  # one new chunk in front of the two stored ones
+    name = "mov.txt"
+    url = "/ingest?chunk_size=300&incremental=true"
+    first = client.post(url, files={"file": (name, "\n\n".join(v1).encode(), "text/plain")}).json()
+    second = client.post(url, files={"file": (name, "\n\n".join(v2).encode(), "text/plain")}).json()
+    hits = app.state.lexical_index.search("mov p3w1", top_k=1)
+
+    assert second["unchanged"] == 2 and second["embedded"] == 1
+    ids = [m["embedding_id"] for m in second["saved"]]
+    assert ids[1:] == [m["embedding_id"] for m in first["saved"]]
+    payloads = app.state.vector_store.get_payloads(ids)
+    assert [payloads[vec_id]["chunk_id"] for vec_id in ids] == [0, 1, 2]
+    assert hits[0]["id"] == ids[2] and hits[0]["payload"]["chunk_id"] == 2
+
+
+def test_incremental_reingest_reembeds_vectors_missing_from_store(local_storage):
+    v1 = _paragraphs("gone")
+    name = "gone.txt"
+    url = "/ingest?chunk_size=300&incremental=true"
+    with TestClient(create_app()) as client:
+        client.post(url, files={"file": (name, "\n\n".join(v1).encode(), "text/plain")})
+    # a restart with an in-memory store: the database still lists the old vectors
+    app = create_app()
+    with TestClient(app) as client:
+        second = client.post(url, files={"file": (name, "\n\n".join(v1).encode(), "text/plain")}).json()
+
+    assert second["unchanged"] == 0 and second["embedded"] == 2
+    assert len(app.state.vector_store) == 2
+    rows = load_chunk_meta(name)
+    assert [r["embedding_id"] for r in rows] == [m["embedding_id"] for m in second["saved"]]
+
+
+def test_incremental_reingest_embeds_a_one_word_edit(client):
+    app = client.app
+    v1 = _paragraphs("edit")
+    v2 = v1[:3] + [v1[3].replace("p3w10 ", "p3w10price45 ")]
+    name = "edit.txt"
+    url = "/ingest?chunk_size=300&incremental=true"
+    first = client.post(url, files={"file": (name, "\n\n".join(v1).encode(), "text/plain")}).json()
+    # near-identical to the chunk it replaces, which must not be linked to instead
+    second = client.post(url, files={"file": (name, "\n\n".join(v2).encode(), "text/plain")}).json()
+    hits = app.state.lexical_index.search("p3w10price45", top_k=1)
+
+    assert second["unchanged"] == 1 and second["embedded"] == 1 and second["deduplicated"] == 0
+    assert second["vectors_deleted"] == 1
+    edited = second["saved"][1]["embedding_id"]
+    assert edited != first["saved"][1]["embedding_id"]
+    assert "p3w10price45" in app.state.vector_store.get_payloads([edited])[edited]["text"]
+    assert [h["id"] for h in hits] == [edited]
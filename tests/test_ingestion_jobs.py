@@ -0,0 +1,25 @@
+import time
+
+
+def test_async_ingest_reports_progress(client):
+    text = " ".join(f"token{i}" for i in range(30)).encode()
+    resp = client.post(
+        "/ingest?mode=async&chunk_size=10",
+        files={"file": ("queued.txt", text, "text/plain")},
+    )
+    assert resp.status_code == 202
+    job_id = resp.json()["id"]
+
+    deadline = time.time() + 5
+    while True:
+        job = client.get(f"/ingest/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed") or time.time() > deadline:
+            break
+        time.sleep(0.01)
+
+    assert job["status"] == "succeeded", job
+    assert job["pages_extracted"] == 1
+    assert job["chunks_total"] == job["chunks_embedded"] == job["chunks_stored"] == 3
+    assert len(client.app.state.vector_store) == 3
+
+    assert client.get("/ingest/jobs/missing").status_code == 404
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from app.api.v1 import chat
+from app.services import vectorstore
+from app.services.lexical_index import LexicalIndex
+from app.services.retrieval import reciprocal_rank_fusion, retrieve
+from app.services.vectorstore import SimpleVectorStore
+
+
+def _index(texts):
+    index = LexicalIndex()
+    index.add_many([f"id{i}" for i in range(len(texts))], [{"text": t} for t in texts])
+    return index
+
+
+def test_bm25_prefers_rare_exact_terms():
+    index = _index([
+        "the widget ships with a charger",
+        "order SKU-48213 ships in two days",
+        "the widget and the charger and the cable",
+    ])
+    hits = index.search("when does SKU-48213 ship", top_k=2)
+    assert hits[0]["id"] == "id1"
+    assert hits[0]["payload"]["text"].startswith("order")
+    assert [h["id"] for h in index.search("charger cable", top_k=5)][0] == "id2"
+    assert index.search("nothing matches", top_k=3) == []
+
+
+def test_index_updates_incrementally_and_skips_removed():
+    index = _index(["alpha beta", "beta gamma"])
+    index.add_many(["id2"], [{"text": "gamma delta"}])
+    assert {h["id"] for h in index.search("gamma", top_k=5)} == {"id1", "id2"}
+    index.remove(["id1"])
+    assert [h["id"] for h in index.search("gamma", top_k=1)] == ["id2"]
+    assert len(index) == 2
+
+
+def test_lexical_search_filters_before_top_k():
+    index = LexicalIndex()
+    index.add_many(["a", "b", "c"], [
+        {"text": "refund policy refund", "file_name": "x.txt"},
+        {"text": "refund policy", "file_name": "y.txt"},
+        {"text": "shipping", "file_name": "y.txt"},
+    ])
+    assert [h["id"] for h in index.search("refund", top_k=1, payload_filter={"file_name": "y.txt"})] == ["b"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [{"id": "a", "payload": {}}, {"id": "b", "payload": {}}, {"id": "c", "payload": {}}]
+    lexical = [{"id": "c", "payload": {}}, {"id": "b", "payload": {}}]
+    assert [r["id"] for r in reciprocal_rank_fusion([dense, lexical], top_k=2)] == ["c", "b"]
+
+
+def test_vector_retrieval_searches_off_the_event_loop():
+    threads = []
+
+    class FakeEmbeddings:
+        async def aembed_text(self, text):
+            return [1.0]
+
+    class BlockingStore:
+        def search_vector(self, vector, top_k=5, payload_filter=None):
+            threads.append(threading.current_thread())
+            return []
+
+    asyncio.run(retrieve("q", BlockingStore(), FakeEmbeddings()))
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_hybrid_chat_retrieves_exact_identifier(monkeypatch, client):
+    prompts = []
+
+    async def fake_completion(prompt):
+        prompts.append(prompt)
+        return "ok"
+
+    monkeypatch.setattr(chat, "acall_groq_completion", fake_completion)
+    code = "ZX-48c1f07a"
+    filler = "\n\n".join(" ".join(f"t{i}w{j}" for j in range(60)) for i in range(8))
+    text = f"{filler}\n\nThe replacement part number is {code} for all units."
+    client.post("/ingest?chunk_size=60", files={"file": ("parts.txt", text.encode(), "text/plain")})
+    # only the code chunk matches lexically, so it ranks in the top 2 whatever the
+    # (hash-seeded) fallback embeddings put first; with top_k=1 it could lose that tie
+    body = {"user_id": "h1", "query": f"part {code}", "top_k": 2, "search_mode": "hybrid"}
+    assert client.post("/chat", json=body).json() == {"reply": "ok"}
+    bad = client.post("/chat", json={**body, "search_mode": "fuzzy"})
+    elsewhere = {**body, "filter": {"file_name": "other.txt"}}
+    assert client.post("/chat", json=elsewhere).json() == {"reply": "ok"}
+    bad_filter = client.post("/chat", json={**body, "filter": {"chunk_id": {"near": 3}}})
+
+    context = [p.split("Conversation history")[0] for p in prompts]
+    assert code in context[0]
+    assert bad.status_code == 422
+    assert code not in context[1]
+    assert bad_filter.status_code == 422
+
+
+def test_lexical_search_on_a_read_only_worker_follows_the_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_REFRESH_SECONDS", 0.0)
+    writer = SimpleVectorStore(path=str(tmp_path))
+    ids = writer.upsert_vectors([[1.0, 0.0]], [{"text": "alpha"}])
+    reader = SimpleVectorStore(path=str(tmp_path), read_only=True)
+    lexical = LexicalIndex()
+    lexical.add_many(ids, [{"text": "alpha"}])  # load_from_db at startup
+    reader.on_refresh(lexical.follow)
+
+    ids += writer.upsert_vectors([[0.0, 1.0]], [{"text": "beta"}])
+    hits = asyncio.run(retrieve("beta", reader, None, lexical, top_k=1, mode="lexical"))
+    assert [h["id"] for h in hits] == [ids[1]]
+    reader.close()
+    writer.close()
+
+
+def test_removed_chunks_are_compacted_away():
+    index = LexicalIndex(compact_ratio=0.5)
+    index.add_many([f"id{i}" for i in range(4)], [{"text": f"common w{i}"} for i in range(4)])
+    for _ in range(5):  # re-ingesting a changed chunk replaces it
+        index.add_many(["id1"], [{"text": "common changed"}])
+    index.remove(["id2"])
+    assert len(index._ids) <= 2 * len(index) and len(index) == 3
+    assert len(index._docs["common"]) == len(index._ids)
+    assert "w1" not in index._docs  # compacted away with the replaced versions of id1
+    assert [h["id"] for h in index.search("changed")] == ["id1"]
+    assert [h["id"] for h in index.search("w3")] == ["id3"]
+    assert {h["id"] for h in index.search("common", top_k=10)} == {"id0", "id1", "id3"}
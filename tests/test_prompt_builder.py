@@ -0,0 +1,55 @@
+import json
+from app.api.v1 import chat
+from app.services.prompt_builder import build_prompt, dedupe_chunks
+from app.utils.chunking import chunk_text_recursive
+
+
+def _hit(text, file_name="doc.txt", score=1.0):
+    return {"id": text[:8], "score": score, "payload": {"text": text, "file_name": file_name}}
+
+
+def test_dedupe_removes_chunker_overlap():
+    text = " ".join(f"w{i}." if i % 10 == 9 else f"w{i}" for i in range(120))
+    chunks = chunk_text_recursive(text, chunk_size=40, chunk_overlap=10)
+    hits = [_hit(c) for c in (chunks[1], chunks[0], chunks[2])]  # ranked out of order
+    deduped = dedupe_chunks(hits + [_hit(chunks[1]), _hit(chunks[1], file_name="other.txt")])
+    assert len(deduped) == 3  # exact repeats are dropped, even from another file
+    assert deduped[0]["payload"]["text"] == chunks[1]  # the best hit is never cut
+    # the 10 words chunk 0 hands over to chunk 1, and chunk 1 to chunk 2, appear once
+    assert deduped[1]["payload"]["text"].split() == chunks[0].split()[:-10]
+    assert deduped[2]["payload"]["text"].split() == chunks[2].split()[10:]
+
+
+def test_build_prompt_keeps_to_budget():
+    hits = [_hit(" ".join(f"c{n}w{i}" for i in range(100)), file_name=f"{n}.txt") for n in range(5)]
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "x " * 30} for i in range(20)]
+
+    built = build_prompt("what is c0?", hits, history, budget=400, history_tokens=100)
+    usage = built.usage
+    assert usage["total"] <= 400
+    assert usage["total"] == usage["system"] + usage["context"] + usage["history"] + usage["query"]
+    assert usage["chunks_used"] == 3 and usage["chunks_truncated"] == 1  # two whole, one cut
+    assert "c0w99" in built.text and "c3w0" not in built.text
+    assert 0 < usage["history"] <= 100 and usage["history_dropped"] > 0
+    assert "turn 19" in built.text and "turn 0 " not in built.text  # most recent history kept
+    assert built.text.endswith("User: what is c0?\nAssistant:")
+
+    # without context, history may use the whole remaining budget
+    roomy = build_prompt("hi", [], history, budget=400, history_tokens=100).usage
+    assert roomy["history"] > 100 and roomy["total"] <= 400
+
+
+def test_chat_reports_prompt_token_usage(monkeypatch, client):
+    prompts = []
+
+    async def fake_completion(prompt):
+        prompts.append(prompt)
+        return "ok"
+
+    monkeypatch.setattr(chat, "acall_groq_completion", fake_completion)
+    client.post("/ingest", files={"file": ("budget.txt", b"Budgets keep prompts short.", "text/plain")})
+    resp = client.post("/chat", json={"user_id": "budget-user", "query": "prompt budgets"})
+    assert resp.json() == {"reply": "ok"}
+    usage = json.loads(resp.headers["X-Prompt-Tokens"])
+    assert usage["total"] == len(prompts[0].split())
+    assert usage["context"] > 0 and usage["query"] == len("User: prompt budgets\nAssistant:".split())
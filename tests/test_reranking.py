@@ -0,0 +1,66 @@
+import asyncio
+import time
+import pytest
+from app.services import retrieval
+from app.services.reranking import LexicalOverlapReranker, Reranker, make_reranker
+from app.services.retrieval import retrieve
+from app.services.vectorstore import SimpleVectorStore
+
+
+def _hits(texts):
+    return [{"id": str(i), "score": 1.0 - i / 10, "payload": {"text": t}} for i, t in enumerate(texts)]
+
+
+def test_lexical_reranker_promotes_term_overlap():
+    hits = _hits(["shipping times vary", "refund policy for damaged items", "our refund policy"])
+    ranked = LexicalOverlapReranker().rerank("refund policy", hits, top_k=2)
+    assert [h["id"] for h in ranked] == ["1", "2"]  # tie keeps retrieval order
+    assert ranked[0]["retrieval_score"] == hits[1]["score"]
+    assert make_reranker("none") is None
+    with pytest.raises(ValueError):
+        make_reranker("onnx")
+
+
+def test_rerank_stops_at_latency_budget():
+    class SlowReranker(Reranker):
+        def __init__(self):
+            self.scored = 0
+
+        def score(self, query, texts):
+            time.sleep(0.02)
+            self.scored += len(texts)
+            return [float(len(t)) for t in texts]
+
+    hits = _hits(["a", "bbb", "cc", "dddd", "eeeee", "ffffff"])
+    slow = SlowReranker()
+    ranked = slow.rerank("q", hits, top_k=4, budget_ms=10, batch_size=2)
+    # one batch fits in the budget; the rest follow in their retrieval order, unscored
+    assert slow.scored == 2
+    assert [h["id"] for h in ranked] == ["1", "0", "2", "3"]
+    assert [h["score"] for h in ranked] == [3.0, 1.0, None, None]
+    assert [h["retrieval_score"] for h in ranked] == [hits[int(h["id"])]["score"] for h in ranked]
+
+    # a spent budget skips scoring altogether
+    spent = SlowReranker()
+    ranked = spent.rerank("q", hits, top_k=3, budget_ms=0, batch_size=2)
+    assert spent.scored == 0
+    assert [h["id"] for h in ranked] == ["0", "1", "2"] and all(h["score"] is None for h in ranked)
+
+
+def test_retrieve_overfetches_for_reranker(monkeypatch):
+    monkeypatch.setattr(retrieval, "RERANK_CANDIDATES", 4)
+
+    class FakeEmbeddings:
+        async def aembed_text(self, text):
+            return [1.0, 0.0]
+
+    vs = SimpleVectorStore()
+    # the vector ranking puts the only chunk naming the part fourth
+    vs.upsert_vectors(
+        [[1.0, 0.0], [0.95, 0.3], [0.9, 0.4], [0.5, 0.5]],
+        [{"text": "general overview"}, {"text": "pricing"}, {"text": "contact us"}, {"text": "part ZX-9 spec"}],
+    )
+    plain = asyncio.run(retrieve("part ZX-9", vs, FakeEmbeddings(), top_k=1))
+    reranked = asyncio.run(retrieve("part ZX-9", vs, FakeEmbeddings(), top_k=1, reranker=LexicalOverlapReranker()))
+    assert plain[0]["payload"]["text"] == "general overview"
+    assert [h["payload"]["text"] for h in reranked] == ["part ZX-9 spec"]
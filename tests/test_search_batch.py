@@ -0,0 +1,40 @@
+from app.api.v1 import chat
+from app.services.vectorstore import SimpleVectorStore
+
+
+def test_search_batch_ranks_chunks_per_query(monkeypatch, client):
+    calls = []
+
+    async def fake_embed(texts):
+        calls.append(list(texts))
+        return [[1.0, 0.0] if "alpha" in t else [0.0, 1.0] for t in texts]
+
+    async def no_llm(prompt):
+        raise AssertionError("search must not call the LLM")
+
+    monkeypatch.setattr(chat, "acall_groq_completion", no_llm)
+    vs = SimpleVectorStore()
+    vs.upsert_vectors(
+        [[1.0, 0.1], [0.1, 1.0], [0.9, 0.3]],
+        [{"text": "a", "file_name": "x.txt"}, {"text": "b", "file_name": "x.txt"}, {"text": "c", "file_name": "y.txt"}],
+    )
+    client.app.state.vector_store = vs
+    monkeypatch.setattr(client.app.state.embedding_service, "aembed_texts", fake_embed)
+
+    resp = client.post("/search/batch", json={"queries": ["alpha", "beta"], "top_k": 2})
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert calls == [["alpha", "beta"]]  # one embedding call for the whole batch
+    assert [r["query"] for r in results] == ["alpha", "beta"]
+    assert [h["payload"]["text"] for h in results[0]["hits"]] == ["a", "c"]
+    assert [h["payload"]["text"] for h in results[1]["hits"]] == ["b", "c"]
+
+    filtered = client.post("/search/batch", json={"queries": ["alpha"], "filter": {"file_name": "y.txt"}})
+    assert [h["payload"]["text"] for h in filtered.json()["results"][0]["hits"]] == ["c"]
+    assert client.post("/search/batch", json={"queries": []}).status_code == 422
+    assert client.post("/search/batch", json={"queries": ["q"], "filter": {"a": {}}}).status_code == 422
+    # Qdrant matches floats only in ranges
+    for bad in ({"score": 0.5}, {"score": [1, 0.5]}):
+        assert client.post("/search/batch", json={"queries": ["q"], "filter": bad}).status_code == 422
+    ranged = client.post("/search/batch", json={"queries": ["alpha"], "filter": {"chunk_id": {"gte": 0.5}}})
+    assert ranged.status_code == 200
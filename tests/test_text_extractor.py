@@ -0,0 +1,71 @@
+import fitz
+from app.services import text_extractor
+
+
+def _make_pdf(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page number {i}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_parallel_extraction_keeps_page_order(monkeypatch):
+    content = _make_pdf(9)
+    monkeypatch.setattr(text_extractor, "PDF_EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(text_extractor, "PDF_PARALLEL_MIN_PAGES", 4)
+    try:
+        pages = text_extractor.extract_pages(content, "application/pdf")
+    finally:
+        text_extractor.shutdown_extraction_pool()
+
+    assert [p.strip() for p in pages] == [f"page number {i}" for i in range(9)]
+
+
+def test_page_ranges_cover_document():
+    ranges = text_extractor._page_ranges(10, 3)
+    assert [(r.start, r.stop) for r in ranges] == [(0, 4), (4, 7), (7, 10)]
+    assert [(r.start, r.stop) for r in text_extractor._page_ranges(2, 8)] == [(0, 1), (1, 2)]
+
+
+def test_extracts_from_spooled_path(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(_make_pdf(3))
+    pages = text_extractor.extract_pages(str(path), "application/pdf")
+    assert [p.strip() for p in pages] == [f"page number {i}" for i in range(3)]
+
+
+def test_spool_upload_copies_in_chunks(tmp_path, monkeypatch):
+    import asyncio
+    import io
+    import os
+    from fastapi import UploadFile
+
+    monkeypatch.setattr(text_extractor, "UPLOAD_SPOOL_DIR", str(tmp_path))
+    data = b"x" * 10_000
+    upload = UploadFile(file=io.BytesIO(data), filename="big.txt")
+    path = asyncio.run(text_extractor.spool_upload(upload, chunk_size=1024))
+    try:
+        assert os.path.dirname(path) == str(tmp_path) and path.endswith(".txt")
+        with open(path, "rb") as fh:
+            assert fh.read() == data
+    finally:
+        os.remove(path)
+
+
+def test_iter_pages_streams_pages_and_text_blocks(tmp_path, monkeypatch):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(_make_pdf(3))
+    progress = []
+    pages = text_extractor.iter_pages(str(path), "application/pdf", progress.append)
+    assert next(pages).strip() == "page number 0" and progress == [1]  # nothing read ahead
+    assert [p.strip() for p in pages] == ["page number 1", "page number 2"]
+
+    monkeypatch.setattr(text_extractor, "TEXT_READ_BLOCK", 100)
+    text = "\n".join(f"line {i} " + "x" * 30 for i in range(20))
+    txt = tmp_path / "doc.txt"
+    txt.write_text(text)
+    blocks = list(text_extractor.iter_pages(str(txt), "text/plain", progress.append))
+    assert len(blocks) > 1 and "\n".join(blocks) == text
+    assert progress[-1] == 1
@@ -0,0 +1,50 @@
+import base64
+from app.utils import chunking
+from app.utils.token_counting import BPETokenCounter, WhitespaceTokenCounter
+
+
+def _write_vocab(path, merges):
+    tokens = [bytes([i]) for i in range(256)] + merges
+    lines = [f"{base64.b64encode(t).decode()} {rank}" for rank, t in enumerate(tokens)]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_bpe_counter_merges_by_rank(tmp_path):
+    vocab = tmp_path / "test.tiktoken"
+    _write_vocab(vocab, [b"ab", b"abc", b"cc", b"ccc"])
+    counter = BPETokenCounter.from_file(str(vocab))
+
+    assert counter.count("abc") == 1
+    # pre-tokenized as "abc", " abc", " ccc"; the leading spaces are never merged
+    assert counter.count("abc abc ccc") == 5
+    assert counter.count_batch(["abc", "xyz", "abc"]) == [1, 3, 1]
+    counter.count("abc abc ccc")
+    assert counter._text_tokens.cache_info().hits >= 1
+
+
+def test_tail_keeps_words_within_overlap_budget(tmp_path):
+    vocab = tmp_path / "test.tiktoken"
+    _write_vocab(vocab, [b"ab"])
+    counter = BPETokenCounter.from_file(str(vocab))
+
+    assert counter.tail("ab xyz ab", 3) == (["ab"], 1)
+    assert WhitespaceTokenCounter().tail("a b c d", 2) == (["c", "d"], 2)
+
+
+def test_chunkers_size_chunks_with_counter(tmp_path):
+    vocab = tmp_path / "test.tiktoken"
+    _write_vocab(vocab, [b"ab"])
+    counter = BPETokenCounter.from_file(str(vocab))
+
+    # words count 1, 3, 1, 3, 1 tokens
+    assert chunking.chunk_text_fixed("ab xyz ab xyz ab", 4, token_counter=counter) == ["ab xyz", "ab xyz", "ab"]
+    sentences = "First one. Second sentence here. Third."
+    assert chunking.chunk_text_sentences(sentences, 6, token_counter=counter) == [
+        "First one.", "Second sentence here.", "Third."
+    ]
+    assert chunking.chunk_text_sentences(sentences, 6) == [sentences]
+
+    pages = ["ab xyz ab. xyz ab", "xyz xyz.", "ab ab xyz ab"]
+    for strategy in chunking.CHUNKING_STRATEGIES:
+        streamed = chunking.iter_chunk_document(pages, strategy, 6, 2, token_counter=counter)
+        assert list(streamed) == chunking.chunk_document("\n".join(pages), strategy, 6, 2, token_counter=counter)
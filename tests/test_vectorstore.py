@@ -0,0 +1,415 @@
+import threading
+import pytest
+import numpy as np
+from app.services import ann_index, quantization
+from app.services.ann_index import IVFIndex, measure_recall
+from app.services.lexical_index import LexicalIndex
+from app.services import vectorstore
+from app.services.quantization import ProductQuantizer
+from app.services.vectorstore import QdrantVectorStore, SimpleVectorStore
+
+
+def test_search_ranks_by_cosine_similarity():
+    vs = SimpleVectorStore(initial_capacity=2)
+    vs.upsert_vector([1.0, 0.0, 0.0], {"text": "x"})
+    vs.upsert_vector([0.0, 1.0, 0.0], {"text": "y"})
+    vs.upsert_vector([0.7, 0.7, 0.0], {"text": "xy"})
+
+    results = vs.search_vector([0.9, 0.1, 0.0], top_k=2)
+    assert [r["payload"]["text"] for r in results] == ["x", "xy"]
+    assert results[0]["score"] > results[1]["score"]
+    assert len(vs) == 3
+
+
+def test_search_matches_brute_force():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(200, 16)).astype(np.float32)
+    vs = SimpleVectorStore()
+    for i, row in enumerate(data):
+        vs.upsert_vector(row.tolist(), {"i": i})
+
+    query = rng.normal(size=16)
+    unit = data / np.linalg.norm(data, axis=1, keepdims=True)
+    expected = np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5]
+
+    results = vs.search_vector(query.tolist(), top_k=5)
+    assert [r["payload"]["i"] for r in results] == expected.tolist()
+
+
+def test_search_empty_store():
+    assert SimpleVectorStore().search_vector([1.0, 0.0], top_k=3) == []
+
+
+def test_upsert_vectors_appends_in_bulk():
+    vs = SimpleVectorStore(initial_capacity=1)
+    ids = vs.upsert_vectors([[1.0, 0.0], [0.0, 2.0], [3.0, 3.0]], [{"i": 0}, {"i": 1}, {"i": 2}])
+    assert len(ids) == len(set(ids)) == 3
+    assert len(vs) == 3
+    top = vs.search_vector([0.0, 1.0], top_k=1)[0]
+    assert top["id"] == ids[1]
+    assert abs(top["score"] - 1.0) < 1e-6
+
+
+def test_qdrant_upsert_vectors_batches():
+    sent = []
+
+    class FakeClient:
+        def upsert(self, collection_name, points):
+            sent.append([p.payload["i"] for p in points])
+
+    store = QdrantVectorStore.__new__(QdrantVectorStore)
+    store.client = FakeClient()
+    ids = store.upsert_vectors([[0.1, 0.2]] * 5, [{"i": i} for i in range(5)], batch_size=2, parallel=2)
+
+    assert len(ids) == 5
+    assert sorted(sent) == [[0, 1], [2, 3], [4]]
+
+
+def test_delete_vectors_compacts_store(monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_COMPACT_BLOCK_ROWS", 1)
+    vs = SimpleVectorStore()
+    ids = vs.upsert_vectors([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], [{"i": 0}, {"i": 1}, {"i": 2}])
+    assert vs.delete_vectors([ids[0], "missing"]) == 1
+    assert len(vs) == 2
+    hits = vs.search_vector([1.0, 0.0], top_k=3)
+    assert [h["id"] for h in hits] == [ids[2], ids[1]]
+    assert [h["payload"]["i"] for h in hits] == [2, 1]
+
+
+def _clustered(rows, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, dim))
+    return centers[rng.integers(0, 20, size=rows)] + 0.3 * rng.standard_normal((rows, dim))
+
+
+def test_ivf_index_trains_incrementally_and_keeps_recall():
+    data = _clustered(3000)
+    vs = SimpleVectorStore(index="ivf")
+    vs._ann = IVFIndex(min_train=1000, n_probe=4)
+    vs.upsert_vectors(data[:500], [{"i": i} for i in range(500)])
+    assert not vs._ann.trained  # brute force until enough rows exist
+    for start in range(500, 2900, 400):
+        vs.upsert_vectors(data[start:start + 400], [{"i": i} for i in range(start, start + 400)])
+    vs._ann.wait()  # trained in the background; the swap files the rows added meanwhile
+    assert vs._ann.trained
+    assert sum(len(rows) for rows in vs._ann._lists) == 2900
+
+    stats = measure_recall(vs, data[2900:], top_k=5)
+    assert stats["recall"] >= 0.9
+    assert measure_recall(vs, data[2900:2910], top_k=5, n_probe=len(vs._ann.centroids))["recall"] == 1.0
+
+
+def test_ivf_index_follows_deletes():
+    data = _clustered(1200, seed=1)
+    vs = SimpleVectorStore(index="ivf")
+    vs._ann = IVFIndex(min_train=1000, n_probe=1000, background=False)
+    ids = vs.upsert_vectors(data, [{"i": i} for i in range(len(data))])
+    vs.delete_vectors(ids[:600])
+    hits = vs.search_vector(data[700], top_k=3)
+    assert hits[0]["id"] == ids[700]
+    assert all(h["payload"]["i"] >= 600 for h in hits)
+
+
+def _hold_kmeans(monkeypatch, module=ann_index, name="spherical_kmeans"):
+    """Make background k-means wait until the returned event is set."""
+    release = threading.Event()
+    kmeans = getattr(module, name)
+
+    def held(*args, **kwargs):
+        release.wait(10)
+        return kmeans(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, held)
+    return release
+
+
+def test_ivf_training_runs_outside_upsert_and_search(monkeypatch):
+    data = _clustered(1500, seed=7)
+    release = _hold_kmeans(monkeypatch)
+    vs = SimpleVectorStore(index="ivf")
+    vs._ann = IVFIndex(min_train=1000, n_probe=1)
+    ids = vs.upsert_vectors(data[:1200], [{"i": i} for i in range(1200)])
+    # training is pending: neither the upsert nor searches wait for it, and searches are exact
+    assert not vs._ann.trained
+    ids += vs.upsert_vectors(data[1200:], [{"i": i} for i in range(1200, 1500)])
+    assert vs._ann.candidates(np.asarray(data[0], dtype=np.float32)) is None
+    assert vs.search_vector(data[1400], top_k=1)[0]["id"] == ids[1400]
+
+    release.set()
+    vs._ann.wait()
+    assert vs._ann.trained
+    assert sorted(np.concatenate([np.frombuffer(rows, dtype=np.int64) for rows in vs._ann._lists])) == list(range(1500))
+
+
+def test_ivf_training_result_is_dropped_after_a_compaction(monkeypatch):
+    data = _clustered(1200, seed=8)
+    release = _hold_kmeans(monkeypatch)
+    vs = SimpleVectorStore(index="ivf")
+    vs._ann = IVFIndex(min_train=1000, n_probe=1000)
+    ids = vs.upsert_vectors(data, [{"i": i} for i in range(len(data))])
+    vs.delete_vectors(ids[:600])  # row numbers the pending training filed are stale
+    release.set()
+    vs._ann.wait()
+    assert not vs._ann.trained
+    assert vs.search_vector(data[700], top_k=1)[0]["id"] == ids[700]
+
+
+def test_int8_store_reranks_with_float_vectors(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_SPILL_DIR", str(tmp_path))
+    data = _clustered(2000, dim=32, seed=2)
+    vs = SimpleVectorStore(quantization="int8")
+    ids = vs.upsert_vectors(data, [{"i": i} for i in range(len(data))])
+    assert isinstance(vs._matrix, np.memmap) and len(list(tmp_path.iterdir())) == 1
+
+    stats = measure_recall(vs, data[:50] + 0.05, top_k=5)
+    assert stats["recall"] >= 0.95
+    top = vs.search_vector(data[7], top_k=1)[0]
+    assert top["id"] == ids[7] and abs(top["score"] - 1.0) < 1e-5  # exact float32 re-rank score
+    vs.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_pq_store_trains_and_keeps_recall(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_SPILL_DIR", str(tmp_path))
+    data = _clustered(3000, dim=32, seed=3)
+    vs = SimpleVectorStore(quantization="pq")
+    vs._quantizer = ProductQuantizer(subvectors=16, min_train=1000)
+    vs.upsert_vectors(data[:500], [{"i": i} for i in range(500)])
+    assert not vs._quantizer.trained
+    vs.upsert_vectors(data[500:], [{"i": i} for i in range(500, 3000)])
+    vs._quantizer.wait()
+    assert vs._quantizer.trained
+    assert vs._quantizer.nbytes() - vs._quantizer.codebooks.nbytes == len(vs) * 16  # 16 bytes vs 128
+
+    assert measure_recall(vs, data[:50] + 0.05, top_k=5)["recall"] >= 0.9
+    vs.close()
+
+
+def test_pq_training_runs_outside_upsert_and_search(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_SPILL_DIR", str(tmp_path))
+    data = _clustered(1500, dim=32, seed=10)
+    release = _hold_kmeans(monkeypatch, quantization, "kmeans")
+    vs = SimpleVectorStore(quantization="pq")
+    vs._quantizer = ProductQuantizer(subvectors=16, min_train=1000)
+    ids = vs.upsert_vectors(data[:1200], [{"i": i} for i in range(1200)])
+    # training is pending: neither the upsert nor searches wait for it, and searches are exact
+    ids += vs.upsert_vectors(data[1200:], [{"i": i} for i in range(1200, 1500)])
+    top = vs.search_vector(data[1400], top_k=1)[0]
+    assert not vs._quantizer.trained and top["id"] == ids[1400] and abs(top["score"] - 1.0) < 1e-5
+
+    release.set()
+    vs._quantizer.wait()
+    assert vs._quantizer.trained and vs._quantizer.nbytes() - vs._quantizer.codebooks.nbytes == 1500 * 16
+    assert vs.search_vector(data[1400], top_k=1)[0]["id"] == ids[1400]
+    vs.close()
+
+
+def test_pq_store_refuses_a_dimension_before_writing(tmp_path):
+    vs = SimpleVectorStore(quantization="pq", path=str(tmp_path))
+    vs._quantizer = ProductQuantizer(subvectors=5)
+    with pytest.raises(ValueError):
+        vs.upsert_vectors(_clustered(4, dim=32, seed=11), [{}] * 4)
+    assert len(vs) == 0 and vs.dim is None
+    vs.close()
+    assert SimpleVectorStore(path=str(tmp_path), read_only=True).dim is None
+
+
+def test_persistent_store_reopens_from_disk(tmp_path):
+    data = _clustered(300, seed=4)
+    vs = SimpleVectorStore(path=str(tmp_path), initial_capacity=64)
+    ids = vs.upsert_vectors(data[:200], [{"i": i} for i in range(200)])
+    ids += vs.upsert_vectors(data[200:], [{"i": i} for i in range(200, 300)])
+    assert vs.delete_vectors([ids[5], "missing"]) == 1
+    vs.close()
+
+    reopened = SimpleVectorStore(path=str(tmp_path))
+    assert len(reopened) == 299 and isinstance(reopened._matrix, np.memmap)
+    assert reopened.search_vector(data[42], top_k=1)[0]["payload"] == {"i": 42}
+    assert all(h["id"] != ids[5] for h in reopened.search_vector(data[5], top_k=10))
+    second = SimpleVectorStore(path=str(tmp_path))  # one writer at a time: the second one follows it
+    assert second.read_only and len(second) == 299
+    with pytest.raises(RuntimeError):
+        second.upsert_vectors(data[:1], [{}])
+    second.close()
+    reopened.close()
+
+
+def test_writer_truncates_a_partial_record_left_by_a_crash(tmp_path):
+    data = _clustered(30, seed=12)
+    vs = SimpleVectorStore(path=str(tmp_path))
+    ids = vs.upsert_vectors(data[:20], [{"i": i} for i in range(20)])
+    vs.close()
+    with open(tmp_path / "records-0.tsv", "ab") as fh:
+        fh.write(b"torn-id\t{\"i\": ")  # the writer died mid-append
+
+    reopened = SimpleVectorStore(path=str(tmp_path))
+    ids += reopened.upsert_vectors(data[20:], [{"i": i} for i in range(20, 30)])
+    reader = SimpleVectorStore(path=str(tmp_path), read_only=True)
+    assert len(reader) == 30 and reader._ids == ids
+    assert reader.search_vector(data[25], top_k=1)[0]["payload"] == {"i": 25}
+    reader.close()
+    reopened.close()
+
+
+def test_payload_updates_persist_and_reach_readers(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_REFRESH_SECONDS", 0.0)
+    data = _clustered(20, seed=8)
+    writer = SimpleVectorStore(path=str(tmp_path))
+    ids = writer.upsert_vectors(data, [{"i": i, "f": "a"} for i in range(20)])
+    reader = SimpleVectorStore(path=str(tmp_path), read_only=True)
+    assert reader.search_vector(data[0], top_k=1, payload_filter={"f": "a"})[0]["id"] == ids[0]
+
+    assert writer.update_payloads({ids[3]: {"f": "b"}, "missing": {"f": "b"}}) == 1
+    assert writer.get_payloads([ids[3], "missing"]) == {ids[3]: {"i": 3, "f": "b"}}
+    hits = reader.search_vector(data[3], top_k=5, payload_filter={"f": "b"})
+    assert [h["id"] for h in hits] == [ids[3]] and hits[0]["payload"] == {"i": 3, "f": "b"}
+    reader.close()
+    writer.close()
+
+    reopened = SimpleVectorStore(path=str(tmp_path))
+    assert reopened.get_payloads([ids[3]])[ids[3]] == {"i": 3, "f": "b"}
+    reopened.close()
+
+
+def test_read_only_store_follows_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_REFRESH_SECONDS", 0.0)
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_COMPACT_RATIO", 0.5)
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_COMPACT_BLOCK_ROWS", 16)
+    data = _clustered(100, seed=5)
+    writer = SimpleVectorStore(path=str(tmp_path))
+    ids = writer.upsert_vectors(data[:50], [{"i": i} for i in range(50)])
+    reader = SimpleVectorStore(path=str(tmp_path), read_only=True)
+    assert len(reader) == 50
+    with pytest.raises(RuntimeError):
+        reader.upsert_vectors(data[:1], [{}])
+
+    ids += writer.upsert_vectors(data[50:], [{"i": i} for i in range(50, 100)])
+    assert reader.search_vector(data[77], top_k=1)[0]["id"] == ids[77]
+    writer.delete_vectors([ids[77]])
+    assert reader.search_vector(data[77], top_k=1)[0]["id"] != ids[77]
+    assert len(reader) == 99
+
+    writer.delete_vectors(ids[:60])  # past the compaction ratio: new generation
+    assert writer._log.generation == 1 and len(writer) == 39
+    hits = reader.search_vector(data[90], top_k=100)
+    assert len(reader) == 39 and len(hits) == 39 and hits[0]["id"] == ids[90]
+    reader.close()
+    writer.close()
+
+
+def test_filtered_search_applies_before_top_k():
+    data = _clustered(2000, seed=6)
+    vs = SimpleVectorStore(index="ivf")
+    vs._ann = IVFIndex(min_train=1000, n_probe=2, background=False)
+    payloads = [{"file_name": f"f{i % 10}.txt", "chunk_id": i} for i in range(len(data))]
+    ids = vs.upsert_vectors(data, payloads)
+
+    hits = vs.search_vector(data[13], top_k=5, payload_filter={"file_name": "f3.txt"})
+    assert len(hits) == 5 and hits[0]["id"] == ids[13]
+    assert all(h["payload"]["file_name"] == "f3.txt" for h in hits)
+
+    hits = vs.search_vector(data[0], top_k=50, payload_filter={"file_name": ["f1.txt", "f2.txt"], "chunk_id": {"lt": 100}})
+    assert sorted(h["payload"]["chunk_id"] for h in hits) == [i for i in range(100) if i % 10 in (1, 2)]
+    assert vs.search_vector(data[0], top_k=5, payload_filter={"file_name": "missing"}) == []
+
+    vs.delete_vectors(ids[:1000])  # the payload index follows compaction
+    hits = vs.search_vector(data[1003], top_k=3, payload_filter={"file_name": "f3.txt"})
+    assert hits[0]["id"] == ids[1003] and all(h["payload"]["chunk_id"] >= 1000 for h in hits)
+
+
+def test_read_only_store_keeps_a_lexical_index_in_step(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_REFRESH_SECONDS", 0.0)
+    monkeypatch.setattr(vectorstore, "LOCAL_VECTOR_STORE_COMPACT_RATIO", 0.5)
+    data = _clustered(40, seed=9)
+    writer = SimpleVectorStore(path=str(tmp_path))
+    ids = writer.upsert_vectors(data[:20], [{"text": f"chunk w{i}", "f": "a"} for i in range(20)])
+    reader = SimpleVectorStore(path=str(tmp_path), read_only=True)
+    lexical = LexicalIndex()
+    lexical.add_many(ids, [{"text": f"chunk w{i}", "f": "a"} for i in range(20)])  # load_from_db at startup
+    reader.on_refresh(lexical.follow)
+
+    ids += writer.upsert_vectors(data[20:], [{"text": f"chunk w{i}", "f": "a"} for i in range(20, 40)])
+    writer.update_payloads({ids[5]: {"f": "b"}})
+    writer.delete_vectors([ids[7]])
+    reader.search_vector(data[0], top_k=1)
+    assert [h["id"] for h in lexical.search("w33")] == [ids[33]]
+    assert lexical.search("w5", payload_filter={"f": "b"})[0]["id"] == ids[5]
+    assert lexical.search("w7") == [] and len(lexical) == 39
+
+    writer.delete_vectors(ids[:25])  # past the compaction ratio: the reader reloads
+    reader.search_vector(data[0], top_k=1)
+    assert len(lexical) == 15 and lexical.search("w3") == []
+    assert [h["id"] for h in lexical.search("w30")] == [ids[30]]
+    reader.close()
+    writer.close()
+
+
+def _memory_qdrant(dim=2):
+    qdrant_client = pytest.importorskip("qdrant_client")
+    from qdrant_client.http import models as rest
+    store = QdrantVectorStore.__new__(QdrantVectorStore)
+    store.client = qdrant_client.QdrantClient(":memory:")
+    store.quantization = "none"
+    store.client.create_collection(
+        collection_name=vectorstore.QDRANT_COLLECTION,
+        vectors_config=rest.VectorParams(size=dim, distance=rest.Distance.COSINE),
+    )
+    return store
+
+
+def test_qdrant_search_applies_native_filter():
+    store = _memory_qdrant()
+    ids = store.upsert_vectors(
+        [[1.0, 0.0], [0.9, 0.1], [0.8, 0.2], [0.7, 0.3]],
+        [
+            {"file_name": "a", "chunk_id": 1},
+            {"file_name": "a", "chunk_id": 2},
+            {"file_name": "c", "file_names": ["c", "b"], "chunk_id": 3},  # deduplicated into b
+            {"file_name": "c", "chunk_id": 4},
+        ],
+    )
+    hits = store.search_vector([1.0, 0.0], top_k=3, payload_filter={"file_name": ["a", "b"], "chunk_id": {"gte": 2}})
+    assert [h["id"] for h in hits] == ids[1:3]
+    assert hits[0]["payload"] == {"file_name": "a", "chunk_id": 2}
+    assert [h["id"] for h in store.search_vector([1.0, 0.0], top_k=5, exact=True)] == ids
+
+    store.update_payloads({ids[3]: {"file_names": ["c", "b"]}})
+    assert store.get_payloads([ids[3], "00000000-0000-0000-0000-000000000000"]) == {
+        ids[3]: {"file_name": "c", "chunk_id": 4, "file_names": ["c", "b"]}
+    }
+    assert len(store.search_vector([1.0, 0.0], payload_filter={"file_name": "b"})) == 2
+
+
+def test_search_vectors_matches_per_query_search(monkeypatch):
+    monkeypatch.setattr(vectorstore, "SEARCH_BATCH_BLOCK_ROWS", 64)  # several blocks
+    data = _clustered(500, seed=7)
+    vs = SimpleVectorStore()
+    payloads = [{"file_name": f"f{i % 4}.txt", "chunk_id": i} for i in range(len(data))]
+    ids = vs.upsert_vectors(data, payloads)
+    vs.delete_vectors(ids[:20])
+    queries = [data[i] for i in (3, 40, 250, 499)]
+
+    for payload_filter in (None, {"file_name": "f2.txt"}):
+        batched = vs.search_vectors(queries, top_k=7, payload_filter=payload_filter)
+        single = [vs.search_vector(q, top_k=7, payload_filter=payload_filter) for q in queries]
+        assert [[h["id"] for h in hits] for hits in batched] == [[h["id"] for h in hits] for hits in single]
+    assert all(h["id"] not in ids[:20] for hits in vs.search_vectors(queries, top_k=30) for h in hits)
+    assert vs.search_vectors(queries[:2], top_k=3, payload_filter={"file_name": "missing"}) == [[], []]
+    assert SimpleVectorStore().search_vectors(queries[:1]) == [[]]
+
+
+def test_qdrant_search_vectors_uses_batch_query():
+    store = _memory_qdrant()
+    ids = store.upsert_vectors([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]], [{"file_name": "a"}, {"file_name": "a"}, {"file_name": "b"}])
+    calls = []
+    query_batch_points = store.client.query_batch_points
+
+    def counting(**kwargs):
+        calls.append(kwargs)
+        return query_batch_points(**kwargs)
+
+    store.client.query_batch_points = counting
+    results = store.search_vectors([[1.0, 0.1], [0.1, 1.0]], top_k=4, payload_filter={"file_name": "a"})
+    assert len(calls) == 1 and [r.limit for r in calls[0]["requests"]] == [4, 4]
+    assert [[h["id"] for h in hits] for hits in results] == [[ids[0], ids[1]], [ids[1], ids[0]]]
+    assert store.search_vectors([]) == []